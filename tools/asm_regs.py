@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# asm_regs.py - Symbolic access to the registers of an ASMedia USB host
+# controller, as described in the YAML data files.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import pathlib
+from typing import Callable
+
+from regdb import Bitfield, Register, RegisterDb
+
+
+DATA_DIR: pathlib.Path = pathlib.Path(__file__).resolve().parents[1] / "data"
+
+# The current value of a field with one of these permissions can be written
+# back without any effect. Fields with other permissions (e.g., "RW1C") are
+# written as zero unless they're being updated.
+WRITE_BACK_PERMISSIONS: set[str | None] = {None, "RW", "RO"}
+
+
+class BoundRegister:
+    '''A register on a device, whose bitfields can be read and written as attributes
+
+    Updating a field performs a read-modify-write of the register, but inside a
+    "with" block the register is only read once on entry, and all the updated
+    fields are written together on exit. Only the bytes that need to change are
+    written.
+    '''
+
+    def __init__(self, space: "RegisterSpace", info: Register) -> None:
+        fields = {field.name: field for field in info.bits}
+
+        # Bits that must be written as zero unless they're being updated.
+        clear_mask = 0
+        for field in info.bits:
+            if field.permissions not in WRITE_BACK_PERMISSIONS:
+                clear_mask |= field.mask
+        if not info.bits and info.permissions not in WRITE_BACK_PERMISSIONS:
+            clear_mask = (1 << (8 * info.size)) - 1
+
+        object.__setattr__(self, '_space', space)
+        object.__setattr__(self, '_info', info)
+        object.__setattr__(self, '_fields', fields)
+        object.__setattr__(self, '_clear_mask', clear_mask)
+        object.__setattr__(self, '_depth', 0)
+        object.__setattr__(self, '_old', 0)
+        object.__setattr__(self, '_value', 0)
+        object.__setattr__(self, '_dirty', 0)
+
+    @property
+    def info(self) -> Register:
+        return self._info
+
+    def read(self) -> int:
+        return int.from_bytes(self._space.read(self._info.start, self._info.size), 'little')
+
+    def write(self, value: int) -> None:
+        size = self._info.size
+        if value < 0 or value >= (1 << (8 * size)):
+            raise ValueError("Value out of range for {}: {:#x}".format(self._info.name, value))
+
+        self._space.write(self._info.start, value.to_bytes(size, 'little'))
+
+    def update(self, **fields: int) -> None:
+        '''Updates several fields with a single read-modify-write'''
+
+        with self:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def __enter__(self) -> "BoundRegister":
+        if self._depth == 0:
+            old = self.read()
+            object.__setattr__(self, '_old', old)
+            object.__setattr__(self, '_value', old & ~self._clear_mask)
+            object.__setattr__(self, '_dirty', 0)
+        object.__setattr__(self, '_depth', self._depth + 1)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        object.__setattr__(self, '_depth', self._depth - 1)
+        if self._depth == 0 and exc_type is None:
+            self._flush()
+
+    def _field(self, name: str) -> Bitfield:
+        field = self._fields.get(name)
+        if field is None:
+            raise AttributeError("Register {} has no field {}".format(self._info.name, name))
+
+        return field
+
+    def __getattr__(self, name: str) -> int:
+        field = self._field(name)
+        if self._depth > 0:
+            return field.extract((self._value & self._dirty) | (self._old & ~self._dirty))
+
+        return field.extract(self.read())
+
+    def __setattr__(self, name: str, value: int) -> None:
+        field = self._field(name)
+        if value < 0 or value >= (1 << (field.end - field.start + 1)):
+            raise ValueError("Value out of range for {}.{}: {:#x}".format(self._info.name, name, value))
+
+        if self._depth == 0:
+            with self:
+                setattr(self, name, value)
+            return
+
+        object.__setattr__(self, '_value', (self._value & ~field.mask) | (value << field.start))
+        object.__setattr__(self, '_dirty', self._dirty | field.mask)
+
+    def __dir__(self) -> list[str]:
+        return list(object.__dir__(self)) + list(self._fields.keys())
+
+    def _flush(self) -> None:
+        # Only write the bytes containing updated fields, and skip the ones
+        # that wouldn't change--unless they contain fields where the write
+        # itself has an effect (like "RW1C").
+        size = self._info.size
+        old = self._old.to_bytes(size, 'little')
+        new = self._value.to_bytes(size, 'little')
+        dirty = self._dirty.to_bytes(size, 'little')
+        action = (self._dirty & self._clear_mask).to_bytes(size, 'little')
+
+        run_start = None
+        for i in range(size + 1):
+            needed = i < size and dirty[i] != 0 and (action[i] != 0 or old[i] != new[i])
+            if needed and run_start is None:
+                run_start = i
+            elif not needed and run_start is not None:
+                self._space.write(self._info.start + run_start, new[run_start:i])
+                run_start = None
+
+        object.__setattr__(self, '_dirty', 0)
+
+class RegisterSpace:
+    '''The registers in one region of a device, accessible as attributes by name'''
+
+    def __init__(self, region: str, registers: list[Register], read: Callable[[int, int], bytes], write: Callable[[int, bytes], None]) -> None:
+        self.region = region
+        self.read = read
+        self.write = write
+        self._infos: dict[str, Register] = {reg.name: reg for reg in registers}
+        self._bound: dict[str, BoundRegister] = dict()
+
+    def __getattr__(self, name: str) -> BoundRegister:
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        bound = self._bound.get(name)
+        if bound is None:
+            info = self._infos.get(name)
+            if info is None:
+                raise AttributeError("No {} register named {}".format(self.region, name))
+            bound = self._bound[name] = BoundRegister(self, info)
+
+        return bound
+
+    def __dir__(self) -> list[str]:
+        return list(object.__dir__(self)) + list(self._infos.keys())
+
+def split_aligned(addr: int, length: int) -> list[tuple[int, int]]:
+    '''Splits a range into the fewest naturally-aligned 1, 2, and 4-byte accesses'''
+
+    accesses = []
+    end = addr + length
+    while addr < end:
+        for width in (4, 2, 1):
+            if addr % width == 0 and addr + width <= end:
+                accesses.append((addr, width))
+                addr += width
+                break
+
+    return accesses
+
+class RegisterFile:
+    '''The register spaces of an AsmDev that the host can access'''
+
+    def __init__(self, dev, db: RegisterDb) -> None:
+        self.db = db
+        pci = dev.pci
+
+        def config_write(addr: int, data: bytes) -> None:
+            for access_addr, width in split_aligned(addr, len(data)):
+                offset = access_addr - addr
+                pci.config_reg_write(access_addr, width, int.from_bytes(data[offset:offset+width], 'little'))
+
+        def bar0_read(addr: int, length: int) -> bytes:
+            data = bytearray()
+            for access_addr, width in split_aligned(addr, length):
+                data += pci.bar0_reg_read(access_addr, width).to_bytes(width, 'little')
+            return bytes(data)
+
+        def bar0_write(addr: int, data: bytes) -> None:
+            for access_addr, width in split_aligned(addr, len(data)):
+                offset = access_addr - addr
+                pci.bar0_reg_write(access_addr, width, int.from_bytes(data[offset:offset+width], 'little'))
+
+        regions = db.regions
+        self.config = RegisterSpace("pci", regions["pci"].registers, pci.config_read, config_write)
+        self.bar0 = RegisterSpace("bar0", regions["bar0"].registers, bar0_read, bar0_write)
+        self.xdata = RegisterSpace("xdata", regions["xdata"].registers, lambda addr, length: bytes(dev.hw_mmio_read_range(addr, length)), dev.hw_mmio_write_range)
+
+    @staticmethod
+    def data_path(dev, data_dir: str | pathlib.Path | None = None) -> pathlib.Path | None:
+        '''Returns the path of the chip's YAML data file, or None if the chip has none'''
+
+        if not dev.data_filename:
+            return None
+
+        path = pathlib.Path(data_dir or DATA_DIR) / dev.data_filename
+        if not path.exists():
+            return None
+
+        return path
+
+    @classmethod
+    def supported(cls, dev, data_dir: str | pathlib.Path | None = None) -> bool:
+        return cls.data_path(dev, data_dir) is not None
+
+    @classmethod
+    def load(cls, dev, data_dir: str | pathlib.Path | None = None) -> "RegisterFile":
+        path = cls.data_path(dev, data_dir)
+        if path is None:
+            raise ValueError("Symbolic register access is not supported on {}, since there's no register data file for it.".format(dev.name))
+
+        return cls(dev, RegisterDb.load(path))
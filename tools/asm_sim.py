@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# asm_sim.py - A simulated ASMedia USB host controller for testing asm_tool.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from asm_tool import AsmDev, CodeRamCache, PciDev, poll
+
+
+class SimDevice:
+    '''A model of the host-visible handshakes of an ASMedia USB host controller
+
+    The device is exposed through a fake sysfs tree, with a regular "config"
+    file and a regular (mmap-able) "resource0" file. Every write made through
+    a SimPciDev is passed to the model, which updates the files to reflect the
+    hardware's response before the write returns.
+    '''
+
+    BAR0_SIZE = 0x8000
+
+    def __init__(self, vid: int, did: int, dbsf: str = "0000:00:00.0", sysfs_dir: str | None = None) -> None:
+        if (vid, did) not in AsmDev.ids_map.keys():
+            raise KeyError("Unrecognized PCI VID:DID pair: {:04x}:{:04x}".format(vid, did))
+
+        self.vid = vid
+        self.did = did
+        self.dbsf = dbsf
+        self.chip = AsmDev.ids_map[(vid, did)]
+        self.hw_code_and_mmio = self.chip.get('hw_code_and_mmio', None)  # type: ignore[attr-defined]
+
+        self._tmp_dir: str | None = None
+        if sysfs_dir is None:
+            sysfs_dir = self._tmp_dir = tempfile.mkdtemp(prefix="asm_sim-")
+        self.sysfs_dir = sysfs_dir
+
+        dev_dir = os.path.join(self.sysfs_dir, self.dbsf)
+        os.makedirs(dev_dir, exist_ok=True)
+        open(os.path.join(dev_dir, "vendor"), "w").write("0x{:04x}\n".format(vid))
+        open(os.path.join(dev_dir, "device"), "w").write("0x{:04x}\n".format(did))
+
+        config = bytearray(PciDev.CONFIG_SPACE_SIZE)
+        struct.pack_into('<HH', config, 0, vid, did)
+        open(os.path.join(dev_dir, "config"), "wb").write(config)
+        open(os.path.join(dev_dir, "resource0"), "wb").write(bytes(self.BAR0_SIZE))
+
+        self._config = os.open(os.path.join(dev_dir, "config"), os.O_RDWR)
+        bar0_fd = os.open(os.path.join(dev_dir, "resource0"), os.O_RDWR)
+        self._bar0 = mmap.mmap(bar0_fd, 0)
+        os.close(bar0_fd)
+
+        self.code = bytearray(0x20000)
+        self.xdata = bytearray(0x20000)
+
+        if self.hw_code_and_mmio == 2:
+            self.mmio_base = 0x10000
+            self.cpu_misc = 0x1500E
+            self.cpu_mode_next = AsmDev.CPU_MODE_NEXT_128K
+            self.cpu_mode_current = AsmDev.CPU_MODE_CURRENT_128K
+            self.cpu_exec_ctrl = AsmDev.CPU_EXEC_CTRL_128K
+        else:
+            self.mmio_base = 0
+            self.cpu_misc = 0xF343
+            self.cpu_mode_next = AsmDev.CPU_MODE_NEXT_64K
+            self.cpu_mode_current = AsmDev.CPU_MODE_CURRENT_64K
+            self.cpu_exec_ctrl = AsmDev.CPU_EXEC_CTRL_64K
+
+        # Count of the writes that triggered a hardware operation.
+        self.operations = 0
+
+    def close(self) -> None:
+        self._bar0.close()
+        os.close(self._config)
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __enter__(self) -> "SimDevice":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def pci(self, debug: bool = False, verbose: bool = False) -> "SimPciDev":
+        return SimPciDev(self, debug, verbose)
+
+    def asm_dev(self, debug: bool = False, verbose: bool = False) -> AsmDev:
+        dev = AsmDev(self.dbsf, debug, verbose, pci=self.pci(debug, verbose))
+        # Keep the simulated device's CODE RAM cache out of the real one.
+        dev.code_cache = CodeRamCache(self.dbsf, dev.name, dev.CODE_BLOCK_SIZE, cache_dir=self.sysfs_dir)
+        return dev
+
+    def _config_read(self, reg: int, width: int) -> int:
+        return int.from_bytes(os.pread(self._config, width, reg), 'little')
+
+    def _config_write(self, reg: int, width: int, value: int) -> None:
+        os.pwrite(self._config, value.to_bytes(width, 'little'), reg)
+
+    def xdata_read(self, addr: int) -> int:
+        return self.xdata[addr]
+
+    def xdata_write(self, addr: int, value: int) -> None:
+        self.xdata[addr] = value
+
+        if addr == self.cpu_exec_ctrl and not (value & 0x3):
+            # The CPU mode is latched when the CPU comes out of reset.
+            self.xdata[self.cpu_mode_current] = self.xdata[self.cpu_mode_next]
+
+    def on_config_write(self, reg: int, data: bytes) -> None:
+        if self.hw_code_and_mmio != 1:
+            return
+
+        width = len(data)
+        value = int.from_bytes(data, 'little')
+        if reg in (AsmDev.CODE_RAM_DATA_LOWER_BANK_DATA, AsmDev.CODE_RAM_DATA_UPPER_BANK_DATA) and width == 2:
+            ram_addr = self._config_read(AsmDev.CODE_RAM_ADDR, 2) & 0x7ffe
+            if self.xdata[self.cpu_misc] & (1 << 1):
+                code_addr = ram_addr
+                if reg == AsmDev.CODE_RAM_DATA_UPPER_BANK_DATA:
+                    code_addr |= 0x8000
+                self.code[code_addr:code_addr+2] = data
+            self._config_write(AsmDev.CODE_RAM_ADDR, 2, (ram_addr + 2) & 0x7ffe)
+            self.operations += 1
+        elif reg == AsmDev.MMIO_ACCESS_ADDR and width == 2:
+            self._config_write(AsmDev.MMIO_ACCESS_READ_DATA, 1, self.xdata_read(value))
+            self.operations += 1
+        elif reg == AsmDev.MMIO_ACCESS_WRITE_DATA and width == 1:
+            self.xdata_write(self._config_read(AsmDev.MMIO_ACCESS_ADDR, 2), value)
+            self.operations += 1
+
+    def on_bar0_write(self, reg: int, data: bytes) -> None:
+        if self.hw_code_and_mmio != 2:
+            return
+
+        width = len(data)
+        value = int.from_bytes(data, 'little')
+        if reg == AsmDev.CODE_RAM_WRITE_DATA_BAR0 and width == 4:
+            ram_addr = self._config_read(AsmDev.CODE_RAM_ADDR, 2) & 0xfffe
+            code_access = self._config_read(0xef, 1)
+            if code_access & (1 << 7):
+                if code_access & (1 << 6):
+                    base_addr = ((ram_addr & 0x8000) << 1) | (ram_addr & 0x3ffe)
+                    for i, bank_offset in enumerate((0x0000, 0x8000, 0x4000, 0xc000)):
+                        self._bar0[AsmDev.CODE_RAM_READ_DATA_BAR0+2*i:AsmDev.CODE_RAM_READ_DATA_BAR0+2*i+2] = self.code[base_addr+bank_offset:base_addr+bank_offset+2]
+                elif self.xdata[self.cpu_misc] & (1 << 0):
+                    code_addr = ((ram_addr & 0x8000) << 1) | (ram_addr & 0x7ffe)
+                    self.code[code_addr:code_addr+2] = data[0:2]
+                    self.code[code_addr+0x8000:code_addr+0x8002] = data[2:4]
+            self._config_write(AsmDev.CODE_RAM_ADDR, 2, (ram_addr + 2) & 0xfffe)
+            self.operations += 1
+        elif reg == AsmDev.MMIO_ACCESS_ADDR_BAR0 and width == 2:
+            self._bar0[AsmDev.MMIO_ACCESS_READ_DATA_BAR0] = self.xdata_read(self.mmio_base | value)
+            self._bar0[AsmDev.MMIO_ACCESS_STATUS_BAR0] = 0
+            self.operations += 1
+        elif reg == AsmDev.MMIO_ACCESS_WRITE_DATA_BAR0 and width == 1:
+            self.xdata_write(self.mmio_base | int.from_bytes(self._bar0[AsmDev.MMIO_ACCESS_ADDR_BAR0:AsmDev.MMIO_ACCESS_ADDR_BAR0+2], 'little'), value)
+            self._bar0[AsmDev.MMIO_ACCESS_STATUS_BAR0] = 0
+            self.operations += 1
+
+class SimPciDev(PciDev):
+    '''A PciDev that reports every write to a SimDevice'''
+
+    def __init__(self, sim: SimDevice, debug: bool = False, verbose: bool = False) -> None:
+        super().__init__(sim.dbsf, debug, verbose, sysfs_dir=sim.sysfs_dir)
+        self.sim = sim
+
+    def config_reg_write(self, reg: int, width: int, value: int, confirm: bool = False) -> None:
+        # Let the model respond before any confirmation reads.
+        super().config_reg_write(reg, width, value)
+        self.sim.on_config_write(reg, value.to_bytes(width, 'little'))
+        if confirm:
+            poll(lambda: self.config_reg_read(reg, width), value.__eq__, "config register {:#x}".format(reg), self.poll_timeout, self.stats)
+
+    def config_write(self, reg: int, data: bytes) -> None:
+        super().config_write(reg, data)
+        self.sim.on_config_write(reg, bytes(data))
+
+    def bar0_reg_write(self, reg: int, width: int, value: int, confirm: bool = False) -> None:
+        super().bar0_reg_write(reg, width, value)
+        self.sim.on_bar0_write(reg, value.to_bytes(width, 'little'))
+        if confirm:
+            poll(lambda: self.bar0_reg_read(reg, width), value.__eq__, "BAR0 register {:#x}".format(reg), self.poll_timeout, self.stats)
+
+
+def main() -> int:
+    names = {chip['name']: ids for ids, chip in AsmDev.ids_map.items() if chip.get('hw_code_and_mmio') in (1, 2)}
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--chip", type=str, choices=names.keys(), default="ASM2142/ASM3142", help="The chip to simulate.")
+    parser.add_argument("-s", "--size", type=lambda x: int(x, 0), default=0x8000, help="The size of the random image to load. Default is 0x8000.")
+    args = parser.parse_args()
+
+    with SimDevice(*names[args.chip]) as sim:
+        dev = sim.asm_dev()
+        print("Chip: {}".format(dev.name))
+
+        code = os.urandom(args.size & ~1)
+        start = time.perf_counter_ns()
+        dev.hw_code_load_exec(code)
+        stop = time.perf_counter_ns()
+
+        if sim.code[:len(code)] != code:
+            print("Error: CODE RAM contents don't match the image.", file=sys.stderr)
+            return 1
+
+        print("Loaded {} bytes in {:.06f} seconds ({} bytes/second), {} hardware operations".format(
+            len(code), (stop-start)/1e9, int(len(code)*1000000000/(stop-start)), sim.operations))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,10 +19,22 @@
 
 
 import argparse
+import array
+import dataclasses
+import fnmatch
+import functools
+import hashlib
+import json
 import mmap
 import os
 import struct
+import sys
 import time
+from typing import Callable, Iterable, NamedTuple
+from zlib import crc32
+
+from asm_regs import RegisterFile, RegisterSpace
+from regdb import RegisterDb
 
 
 class BusError(Exception):
@@ -31,6 +43,483 @@ class BusError(Exception):
 class MmapError(Exception):
     pass
 
+class PollTimeout(Exception):
+    pass
+
+class VerifyError(Exception):
+    def __init__(self, message: str, mismatches: dict[int, list[int]]) -> None:
+        super().__init__(message)
+        # The CODE addresses of the mismatched words, grouped by block.
+        self.mismatches = mismatches
+
+@dataclasses.dataclass
+class Histogram:
+    '''A histogram of non-negative integers with power-of-two buckets'''
+
+    count: int = 0
+    total: int = 0
+    min: int = 0
+    max: int = 0
+    # Bucket "i" counts the values with a bit length of "i".
+    buckets: list[int] = dataclasses.field(default_factory=lambda: [0] * 65)
+
+    def add(self, value: int) -> None:
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+        self.buckets[min(value.bit_length(), 64)] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> int:
+        '''Returns an upper bound on the given percentile'''
+
+        target = self.count * percent / 100
+        cumulative = 0
+        for i, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if bucket_count and cumulative >= target:
+                return min((1 << i) - 1, self.max)
+
+        return self.max
+
+@dataclasses.dataclass
+class AccessStats:
+    '''Counters for the accesses made through a PciDev and the AsmDev using it'''
+
+    config_reads: int = 0
+    config_writes: int = 0
+    config_bytes_read: int = 0
+    config_bytes_written: int = 0
+    config_ns: int = 0
+    bar0_reads: int = 0
+    bar0_writes: int = 0
+    bar0_bytes_read: int = 0
+    bar0_bytes_written: int = 0
+    bar0_ns: int = 0
+    # The number of reads needed to complete each handshake.
+    poll_reads: Histogram = dataclasses.field(default_factory=Histogram)
+    poll_sleep_ns: int = 0
+    poll_timeouts: int = 0
+    # Fixed delays that give the hardware time to latch a write.
+    settle_sleep_ns: int = 0
+    latency_ns: dict[str, Histogram] = dataclasses.field(default_factory=dict)
+
+    def add_latency(self, name: str, ns: int) -> None:
+        histogram = self.latency_ns.get(name)
+        if histogram is None:
+            histogram = self.latency_ns[name] = Histogram()
+        histogram.add(ns)
+
+    def to_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+    def report(self) -> str:
+        lines = [
+            "Config space: {} reads ({} bytes), {} writes ({} bytes), {:.06f} seconds".format(
+                self.config_reads, self.config_bytes_read, self.config_writes, self.config_bytes_written, self.config_ns/1e9),
+            "BAR0: {} reads ({} bytes), {} writes ({} bytes), {:.06f} seconds".format(
+                self.bar0_reads, self.bar0_bytes_read, self.bar0_writes, self.bar0_bytes_written, self.bar0_ns/1e9),
+            "Polling: {} handshakes, {} reads (mean {:.1f}, p99 <= {}, max {}), {:.06f} seconds asleep, {} timeouts".format(
+                self.poll_reads.count, self.poll_reads.total, self.poll_reads.mean, self.poll_reads.percentile(99),
+                self.poll_reads.max, self.poll_sleep_ns/1e9, self.poll_timeouts),
+            "Settle delays: {:.06f} seconds".format(self.settle_sleep_ns/1e9),
+        ]
+        for name, histogram in sorted(self.latency_ns.items()):
+            lines.append("{}: {} calls, {:.06f} seconds (mean {:.1f} us, p50 <= {:.1f} us, p99 <= {:.1f} us, max {:.1f} us)".format(
+                name, histogram.count, histogram.total/1e9, histogram.mean/1e3,
+                histogram.percentile(50)/1e3, histogram.percentile(99)/1e3, histogram.max/1e3))
+
+        return "\n".join(lines)
+
+class TraceRecord(NamedTuple):
+    timestamp_ns: int
+    kind: int
+    addr: int
+    length: int
+    # The value read or written, or the CRC-32 of the data for reads of more
+    # than four bytes.
+    value: int
+    # The data written, for writes of more than four bytes.
+    data: bytes | None
+
+class AccessTrace:
+    '''A compact binary record of the accesses made through a PciDev and the AsmDev using it
+
+    Records are kept in a ring buffer, so only the most recent "capacity"
+    accesses are kept. If "path" is set, the buffer is instead appended to
+    that file whenever it fills up, so every access is kept.
+    '''
+
+    MAGIC = b"ASMTRACE"
+    VERSION = 2
+    HEADER = struct.Struct('<8sHHHHQ')
+    RECORD = struct.Struct('<QBxxxIII')
+    # Version 1 records had a 16-bit length, which can't hold the length of a
+    # 64 kB access.
+    RECORD_V1 = struct.Struct('<QBxHII')
+
+    CONFIG_READ = 0
+    CONFIG_WRITE = 1
+    BAR0_READ = 2
+    BAR0_WRITE = 3
+    # Internal MMIO accesses are made up of config or BAR0 accesses, which
+    # are recorded between an MMIO_START record and the MMIO_READ or
+    # MMIO_WRITE record for the access.
+    MMIO_START = 4
+    MMIO_READ = 5
+    MMIO_WRITE = 6
+    # Writes of more than four bytes are followed by their data, four bytes
+    # per record.
+    DATA = 7
+
+    KIND_NAMES = ("CONFIG_READ", "CONFIG_WRITE", "BAR0_READ", "BAR0_WRITE", "MMIO_START", "MMIO_READ", "MMIO_WRITE", "DATA")
+
+    def __init__(self, capacity: int = 0x10000, path: str | None = None, vid: int = 0, did: int = 0) -> None:
+        if capacity <= 0:
+            raise ValueError("Invalid capacity: {}".format(capacity))
+
+        self.capacity = capacity
+        self.path = path
+        self.vid = vid
+        self.did = did
+        self.start_time_ns = time.time_ns()
+        self._start = time.perf_counter_ns()
+        self._buf = bytearray(capacity * self.RECORD.size)
+        self._count = 0
+        self._file = None
+        if path is not None:
+            self._file = open(path, 'wb')
+            self._file.write(self._header())
+
+    def _header(self) -> bytes:
+        return self.HEADER.pack(self.MAGIC, self.VERSION, self.RECORD.size, self.vid, self.did, self.start_time_ns)
+
+    def record(self, kind: int, addr: int, length: int, value: int) -> None:
+        index = self._count % self.capacity
+        if index == 0 and self._count and self._file is not None:
+            self._file.write(self._buf)
+        self.RECORD.pack_into(self._buf, index * self.RECORD.size, time.perf_counter_ns() - self._start, kind, length, addr, value)
+        self._count += 1
+
+    def record_data(self, kind: int, addr: int, data: bytes, write: bool) -> None:
+        length = len(data)
+        if length <= 4:
+            self.record(kind, addr, length, int.from_bytes(data, 'little'))
+        elif not write:
+            self.record(kind, addr, length, crc32(data))
+        else:
+            self.record(kind, addr, length, 0)
+            for offset in range(0, length, 4):
+                chunk = data[offset:offset+4]
+                self.record(self.DATA, offset, len(chunk), int.from_bytes(chunk, 'little'))
+
+    def _raw_records(self) -> bytes:
+        # The records in the buffer that haven't been written out yet, oldest
+        # first.
+        size = self.RECORD.size
+        if self._file is not None:
+            pending = (self._count - 1) % self.capacity + 1 if self._count else 0
+            return bytes(self._buf[:pending * size])
+        if self._count <= self.capacity:
+            return bytes(self._buf[:self._count * size])
+        index = self._count % self.capacity
+        return bytes(self._buf[index * size:] + self._buf[:index * size])
+
+    def save(self, path: str) -> None:
+        if self._file is not None:
+            raise ValueError("Trace is already being written to {}".format(self.path))
+
+        with open(path, 'wb') as f:
+            f.write(self._header())
+            f.write(self._raw_records())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.write(self._raw_records())
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def load(cls, path: str) -> tuple[int, int, list[TraceRecord]]:
+        '''Returns the VID, DID, and records of a saved trace'''
+
+        raw = open(path, 'rb').read()
+        if len(raw) < cls.HEADER.size:
+            raise ValueError("Not a trace file: {}".format(path))
+        magic, version, record_size, vid, did, _ = cls.HEADER.unpack_from(raw, 0)
+        record_struct = {1: cls.RECORD_V1, cls.VERSION: cls.RECORD}.get(version) if magic == cls.MAGIC else None
+        if record_struct is None or record_size != record_struct.size:
+            raise ValueError("Not a version 1 or {} trace file: {}".format(cls.VERSION, path))
+
+        records: list[TraceRecord] = []
+        pending: TraceRecord | None = None
+        data = bytearray()
+        for timestamp_ns, kind, length, addr, value in record_struct.iter_unpack(memoryview(raw)[cls.HEADER.size:]):
+            if kind == cls.DATA:
+                # A ring buffer may have wrapped in the middle of the data.
+                if pending is not None:
+                    data += value.to_bytes(length, 'little')
+                    if len(data) == pending.length:
+                        records.append(pending._replace(data=bytes(data)))
+                        pending = None
+                continue
+
+            pending = None
+            record = TraceRecord(timestamp_ns, kind, addr, length, value, None)
+            if kind in (cls.CONFIG_WRITE, cls.MMIO_WRITE) and length > 4:
+                pending = record
+                data = bytearray()
+            else:
+                records.append(record)
+
+        return vid, did, records
+
+# Most handshakes complete within a few reads, so spin for a while before
+# starting to sleep between reads.
+POLL_SPIN = 64
+POLL_DELAY_MIN = 0.000001
+POLL_DELAY_MAX = 0.001
+POLL_TIMEOUT = 1.0
+
+def poll(read: Callable[[], int], done: Callable[[int], bool], what: str, timeout: float = POLL_TIMEOUT, stats: AccessStats | None = None) -> int:
+    '''Calls "read" until "done" returns True for the value it returned, and returns that value'''
+
+    value = read()
+    if done(value):
+        if stats is not None:
+            stats.poll_reads.add(1)
+        return value
+
+    deadline = time.monotonic() + timeout
+    for i in range(POLL_SPIN):
+        value = read()
+        if done(value):
+            if stats is not None:
+                stats.poll_reads.add(i + 2)
+            return value
+
+    # The hardware is taking its time, so back off exponentially to avoid
+    # burning the CPU, and give up if it looks like the chip has wedged.
+    reads = POLL_SPIN + 1
+    delay = POLL_DELAY_MIN
+    while True:
+        if time.monotonic() >= deadline:
+            if stats is not None:
+                stats.poll_reads.add(reads)
+                stats.poll_timeouts += 1
+            raise PollTimeout("Timed out after {} seconds waiting for {}, last read: {:#x}".format(timeout, what, value))
+        if stats is not None:
+            start = time.perf_counter_ns()
+            time.sleep(delay)
+            stats.poll_sleep_ns += time.perf_counter_ns() - start
+        else:
+            time.sleep(delay)
+        delay = min(delay * 2, POLL_DELAY_MAX)
+        value = read()
+        reads += 1
+        if done(value):
+            if stats is not None:
+                stats.poll_reads.add(reads)
+            return value
+
+def timed(method: Callable) -> Callable:
+    '''Records the latency of an AsmDev method when stats are enabled'''
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = self.pci.stats
+        if stats is None:
+            return method(self, *args, **kwargs)
+
+        start = time.perf_counter_ns()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats.add_latency(method.__name__, time.perf_counter_ns() - start)
+
+    return wrapper
+
+class CodeSchedule(NamedTuple):
+    '''The sequence of hardware transfers needed to write an image to CODE RAM'''
+
+    # The CODE address of the (lower bank) word written by each transfer.
+    code_addrs: array.array
+    # The value of CODE_RAM_ADDR for each transfer.
+    ram_addrs: array.array
+    # The value written to the CODE RAM data register for each transfer.
+    data: array.array
+
+@functools.lru_cache(maxsize=8)
+def code_schedule(hw_code_and_mmio: int, addr: int, code: bytes) -> CodeSchedule:
+    words = array.array('H', code)
+    if sys.byteorder != 'little':
+        words.byteswap()
+
+    code_addrs = array.array('I')
+    ram_addrs = array.array('H')
+    data = array.array('I')
+
+    if hw_code_and_mmio == 1:
+        # One 16-bit word per transfer, with bit 15 of the address selecting the
+        # data register instead of being part of CODE_RAM_ADDR.
+        for i, word in enumerate(words):
+            code_addr = addr + (i * 2)
+            code_addrs.append(code_addr)
+            ram_addrs.append(code_addr & 0x7ffe)
+            data.append(word)
+    elif hw_code_and_mmio == 2:
+        # Each 32-bit transfer writes one word to the lower 32 kB and one word
+        # to the upper 32 kB of a 64 kB bank, and bit 15 of CODE_RAM_ADDR
+        # selects the bank. Words outside the image are written as zero.
+        end = addr + len(code)
+
+        def word_at(code_addr: int) -> int:
+            if addr <= code_addr < end:
+                return words[(code_addr - addr) >> 1]
+            return 0
+
+        for ram_addr in sorted({((code_addr & 0x10000) >> 1) | (code_addr & 0x7ffe) for code_addr in range(addr, end, 2)}):
+            code_addr = ((ram_addr & 0x8000) << 1) | (ram_addr & 0x7ffe)
+            code_addrs.append(code_addr)
+            ram_addrs.append(ram_addr)
+            data.append(word_at(code_addr) | (word_at(code_addr | 0x8000) << 16))
+    else:
+        raise ValueError("Invalid hardware CODE access type: {}".format(hw_code_and_mmio))
+
+    return CodeSchedule(code_addrs, ram_addrs, data)
+
+class ShadowCache:
+    '''The last values the host wrote to the XDATA registers that only the host changes
+
+    Only the registers in HOST_REGISTERS are cached, and only while the CPU is
+    halted (or held in reset), since the firmware is free to change anything
+    while it's running. The cache is filled by writes, never by reads, and is
+    emptied whenever the CPU is released.
+    '''
+
+    # Registers that nothing but the host writes while the CPU is halted.
+    HOST_REGISTERS: set[str] = {
+        "CPU_MISC",
+        "CPU_MODE_NEXT",
+    }
+
+    def __init__(self, addrs: Iterable[int]) -> None:
+        self.cacheable = frozenset(addrs)
+        self.values: dict[int, int] = dict()
+        self.halted = False
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_db(cls, db: RegisterDb) -> "ShadowCache":
+        addrs = []
+        for reg in db.regions["xdata"].registers:
+            if reg.name in cls.HOST_REGISTERS:
+                addrs.extend(range(reg.start, reg.end + 1))
+
+        return cls(addrs)
+
+    def lookup(self, addr: int, length: int) -> bytearray | None:
+        if not self.halted:
+            return None
+
+        values = self.values
+        data = bytearray(length)
+        for i in range(length):
+            value = values.get(addr + i)
+            if value is None:
+                self.misses += 1
+                return None
+            data[i] = value
+
+        self.hits += 1
+        return data
+
+    def update(self, addr: int, data: bytes) -> None:
+        if not self.halted:
+            return
+
+        for i, value in enumerate(data):
+            if addr + i in self.cacheable:
+                self.values[addr + i] = value
+
+    def set_halted(self, halted: bool) -> None:
+        self.halted = halted
+        if not halted:
+            self.flush()
+
+    def flush(self) -> None:
+        self.values.clear()
+
+class CodeRamCache:
+    '''Remembers the per-block hashes of the image last loaded into a device's CODE RAM'''
+
+    def __init__(self, dbsf: str, chip: str, block_size: int, cache_dir: str | None = None) -> None:
+        self.dbsf = dbsf
+        self.chip = chip
+        self.block_size = block_size
+
+        if cache_dir is None:
+            # Keep the cache on a tmpfs so it doesn't survive a power cycle.
+            cache_dir = os.path.join(os.environ.get('XDG_RUNTIME_DIR', "/run"), "asmedia-xhc-re")
+        self.path = os.path.join(cache_dir, "code-{}.json".format(dbsf.replace(":", "_")))
+
+    @staticmethod
+    def boot_id() -> str:
+        try:
+            return open("/proc/sys/kernel/random/boot_id", "r").read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def block_hashes(self, code: bytes) -> list[str]:
+        view = memoryview(code)
+        return [hashlib.blake2b(view[i:i+self.block_size], digest_size=8).hexdigest() for i in range(0, len(code), self.block_size)]
+
+    def load(self) -> list[str] | None:
+        try:
+            entry = json.load(open(self.path, "r"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if entry.get('dbsf') != self.dbsf or entry.get('chip') != self.chip:
+            return None
+        if entry.get('block_size') != self.block_size or entry.get('boot_id') != self.boot_id():
+            return None
+
+        return entry.get('hashes')
+
+    def store(self, hashes: list[str]) -> None:
+        entry = {
+            'dbsf': self.dbsf,
+            'chip': self.chip,
+            'block_size': self.block_size,
+            'boot_id': self.boot_id(),
+            'hashes': hashes,
+        }
+
+        # The cache is only an optimization, so don't fail the load if it
+        # can't be written.
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def invalidate(self) -> None:
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
 class PciDev:
     '''Lightweight abstraction over the PCI userspace API'''
 
@@ -46,28 +535,57 @@ class PciDev:
         4: '<I',
     }
 
-    def __init__(self, dbsf: str, debug: bool = False, verbose: bool = False, auto_unbind: bool = False) -> None:
+    # Precompiled codecs, so the format strings don't need to be parsed again
+    # on every access.
+    struct_codecs = {width: struct.Struct(fmt) for width, fmt in struct_map.items()}
+
+    array_map = {
+        1: 'B',
+        2: 'H',
+        4: 'I',
+    }
+
+    CONFIG_SPACE_SIZE = 0x1000
+
+    SYSFS_DIR = "/sys/bus/pci/devices"
+
+    def __init__(self, dbsf: str, debug: bool = False, verbose: bool = False, auto_unbind: bool = False, sysfs_dir: str = SYSFS_DIR) -> None:
         self.dbsf = dbsf
         self.debug = debug
         self.verbose = debug or verbose
         self.auto_unbind = auto_unbind
-        self._config = open("/sys/bus/pci/devices/{}/config".format(self.dbsf), "r+b", buffering=0)
+        self.sysfs_dir = sysfs_dir
+        self._config = os.open("{}/{}/config".format(self.sysfs_dir, self.dbsf), os.O_RDWR)
+
+        # The maximum time to wait for a register to take a value.
+        self.poll_timeout = POLL_TIMEOUT
+
+        # Set to an AccessStats to count the accesses made to the device.
+        self.stats: AccessStats | None = None
+
+        # Set to an AccessTrace to record the accesses made to the device.
+        self.trace: AccessTrace | None = None
+
+        # Preallocated buffers for register reads, so polling doesn't allocate
+        # a new bytes object on every read.
+        self._config_bufs = {width: bytearray(width) for width in self.struct_map.keys()}
 
         # Check bus status.
         if self.config_reg_read(0, 4) == 0xffffffff:
             raise BusError("Can't access device.")
 
-        self.vid = int(open("/sys/bus/pci/devices/{}/vendor".format(self.dbsf), "r").read().rstrip('\n'), 16)
-        self.did = int(open("/sys/bus/pci/devices/{}/device".format(self.dbsf), "r").read().rstrip('\n'), 16)
+        self.vid = int(open("{}/{}/vendor".format(self.sysfs_dir, self.dbsf), "r").read().rstrip('\n'), 16)
+        self.did = int(open("{}/{}/device".format(self.sysfs_dir, self.dbsf), "r").read().rstrip('\n'), 16)
 
         self._mmap: mmap.mmap | None = None
+        self._bar0_views: dict[int, memoryview] = dict()
 
     def _mmap_init(self) -> None:
         if self.auto_unbind:
             # Try to unbind the kernel driver if it's attached.
             self.driver_unbind()
 
-        fd = os.open('/sys/bus/pci/devices/{}/resource0'.format(self.dbsf), os.O_RDWR)
+        fd = os.open('{}/{}/resource0'.format(self.sysfs_dir, self.dbsf), os.O_RDWR)
 
         try:
             self._mmap = mmap.mmap(fd, 0)
@@ -77,24 +595,44 @@ class PciDev:
 
             raise MmapError("Failed to mmap BAR0--you may need to unbind the kernel driver for this device.")
 
+        # Indexing a typed memoryview accesses the whole register in one
+        # transaction without allocating a slice, but the values are in host
+        # byte order, so these can only be used on little-endian hosts.
+        if sys.byteorder == 'little':
+            view = memoryview(self._mmap)
+            self._bar0_views = {width: view.cast(self.array_map[width]) for width in self.array_map.keys()}
+
     def driver_unbind(self) -> None:
         try:
-            open("/sys/bus/pci/devices/{}/driver/unbind".format(self.dbsf), "wb").write(self.dbsf.encode('utf-8'))
+            open("{}/{}/driver/unbind".format(self.sysfs_dir, self.dbsf), "wb").write(self.dbsf.encode('utf-8'))
         except FileNotFoundError:
             # If the file doesn't exist, then the driver isn't attached.
             pass
 
     def config_reg_read(self, reg: int, width: int) -> int:
-        if width not in self.struct_map.keys():
+        codec = self.struct_codecs.get(width)
+        if codec is None:
             raise ValueError("Invalid width: {}".format(width))
 
         if self.debug:
             print("PciDev.config_reg_read: Reading {} bytes from {:#x}...".format(width, reg))
 
-        self._config.seek(reg)
-        raw = self._config.read(width)
-        assert len(raw) == width
-        value = struct.unpack(self.struct_map[width], raw)[0]
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter_ns()
+
+        buf = self._config_bufs[width]
+        if os.preadv(self._config, (buf,), reg) != width:
+            raise BusError("Short config space read at {:#x}: expected {} bytes.".format(reg, width))
+        value = codec.unpack(buf)[0]
+
+        if stats is not None:
+            stats.config_ns += time.perf_counter_ns() - start
+            stats.config_reads += 1
+            stats.config_bytes_read += width
+
+        if self.trace is not None:
+            self.trace.record(AccessTrace.CONFIG_READ, reg, width, value)
 
         if self.debug:
             print("PciDev.config_reg_read: Read: {:#x}".format(value))
@@ -102,21 +640,114 @@ class PciDev:
         return value
 
     def config_reg_write(self, reg: int, width: int, value: int, confirm: bool = False) -> None:
-        if width not in self.struct_map.keys():
+        codec = self.struct_codecs.get(width)
+        if codec is None:
             raise ValueError("Invalid width: {}".format(width))
 
         if self.debug:
             print("PciDev.config_reg_write: Writing {} bytes of {:#x} to {:#x}...".format(width, value, reg))
 
-        self._config.seek(reg)
-        self._config.write(struct.pack(self.struct_map[width], value))
-        self._config.flush()
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter_ns()
+
+        raw = codec.pack(value)
+        os.pwrite(self._config, raw, reg)
+
+        if stats is not None:
+            stats.config_ns += time.perf_counter_ns() - start
+            stats.config_writes += 1
+            stats.config_bytes_written += width
+
+        if self.trace is not None:
+            self.trace.record(AccessTrace.CONFIG_WRITE, reg, width, value)
 
         # If "confirm" is set, repeatedly read the register until its contents
         # match the value written.
         if confirm:
-            while self.config_reg_read(reg, width) != value:
-                continue
+            value = codec.unpack(raw)[0]
+            poll(lambda: self.config_reg_read(reg, width), value.__eq__,
+                "config register {:#x} to read back {:#x}".format(reg, value), self.poll_timeout, stats)
+
+    def config_read(self, reg: int, length: int) -> bytes:
+        if reg < 0 or length < 0 or reg + length > self.CONFIG_SPACE_SIZE:
+            raise ValueError("Invalid config space range: {:#x}+{:#x}".format(reg, length))
+
+        if self.debug:
+            print("PciDev.config_read: Reading {} bytes from {:#x}...".format(length, reg))
+
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter_ns()
+
+        # Read the whole range with a single positional read.
+        raw = os.pread(self._config, length, reg)
+        if len(raw) != length:
+            raise BusError("Short config space read at {:#x}: expected {} bytes, got {}.".format(reg, length, len(raw)))
+
+        if stats is not None:
+            stats.config_ns += time.perf_counter_ns() - start
+            stats.config_reads += 1
+            stats.config_bytes_read += length
+
+        if self.trace is not None:
+            self.trace.record_data(AccessTrace.CONFIG_READ, reg, raw, False)
+
+        return raw
+
+    def config_write(self, reg: int, data: bytes) -> None:
+        if reg < 0 or reg + len(data) > self.CONFIG_SPACE_SIZE:
+            raise ValueError("Invalid config space range: {:#x}+{:#x}".format(reg, len(data)))
+
+        if self.debug:
+            print("PciDev.config_write: Writing {} bytes to {:#x}...".format(len(data), reg))
+
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter_ns()
+
+        written = os.pwrite(self._config, data, reg)
+        if written != len(data):
+            raise BusError("Short config space write at {:#x}: expected {} bytes, wrote {}.".format(reg, len(data), written))
+
+        if stats is not None:
+            stats.config_ns += time.perf_counter_ns() - start
+            stats.config_writes += 1
+            stats.config_bytes_written += written
+
+        if self.trace is not None:
+            self.trace.record_data(AccessTrace.CONFIG_WRITE, reg, data, True)
+
+    def config_read_array(self, reg: int, count: int, width: int) -> array.array:
+        typecode = self.array_map.get(width)
+        if typecode is None:
+            raise ValueError("Invalid width: {}".format(width))
+
+        if reg % width != 0:
+            raise ValueError("Invalid register, must be {}-byte aligned: {:#x}".format(width, reg))
+
+        values = array.array(typecode, self.config_read(reg, count * width))
+        if sys.byteorder != 'little':
+            values.byteswap()
+
+        return values
+
+    def config_write_array(self, reg: int, values: array.array) -> None:
+        if reg % values.itemsize != 0:
+            raise ValueError("Invalid register, must be {}-byte aligned: {:#x}".format(values.itemsize, reg))
+
+        if sys.byteorder != 'little':
+            values = array.array(values.typecode, values)
+            values.byteswap()
+
+        self.config_write(reg, values.tobytes())
+
+    def snapshot(self) -> bytes:
+        # The size of the "config" file is 256 bytes for conventional PCI
+        # devices and 4 kB for PCIe devices, so ask the kernel how much there
+        # is to read.
+        size = min(os.fstat(self._config).st_size, self.CONFIG_SPACE_SIZE)
+        return self.config_read(0, size)
 
     def bar0_reg_read(self, reg: int, width: int) -> int:
         if width not in self.struct_map.keys():
@@ -128,11 +759,27 @@ class PciDev:
         if self._mmap is None:
             self._mmap_init()
 
-        # Reads need to be performed in one transaction, but
-        # struct.unpack_from performs one read for every byte. Work around
-        # this limitation by performing the read and unpacking the value in
-        # two separate steps.
-        value = struct.unpack(self.struct_map[width], self._mmap[reg:reg+width])[0]  # type: ignore[index]
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter_ns()
+
+        view = self._bar0_views.get(width)
+        if view is not None and reg % width == 0:
+            value = view[reg // width]
+        else:
+            # Reads need to be performed in one transaction, but
+            # struct.unpack_from performs one read for every byte. Work around
+            # this limitation by performing the read and unpacking the value in
+            # two separate steps.
+            value = struct.unpack(self.struct_map[width], self._mmap[reg:reg+width])[0]  # type: ignore[index]
+
+        if stats is not None:
+            stats.bar0_ns += time.perf_counter_ns() - start
+            stats.bar0_reads += 1
+            stats.bar0_bytes_read += width
+
+        if self.trace is not None:
+            self.trace.record(AccessTrace.BAR0_READ, reg, width, value)
 
         if self.debug:
             print("PciDev.bar0_reg_read: Read: {:#x}".format(value))
@@ -149,17 +796,34 @@ class PciDev:
         if self._mmap is None:
             self._mmap_init()
 
-        # Writes need to be performed in one transaction, but struct.pack_into
-        # performs one write for every byte. Work around this limitation by
-        # packing the value and performing the write in two separate steps.
-        data = struct.pack(self.struct_map[width], value)
-        self._mmap[reg:reg+width] = data  # type: ignore[index]
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter_ns()
+
+        view = self._bar0_views.get(width)
+        if view is not None and reg % width == 0:
+            view[reg // width] = value
+        else:
+            # Writes need to be performed in one transaction, but
+            # struct.pack_into performs one write for every byte. Work around
+            # this limitation by packing the value and performing the write in
+            # two separate steps.
+            data = struct.pack(self.struct_map[width], value)
+            self._mmap[reg:reg+width] = data  # type: ignore[index]
+
+        if stats is not None:
+            stats.bar0_ns += time.perf_counter_ns() - start
+            stats.bar0_writes += 1
+            stats.bar0_bytes_written += width
+
+        if self.trace is not None:
+            self.trace.record(AccessTrace.BAR0_WRITE, reg, width, value)
 
         # If "confirm" is set, repeatedly read the register until its contents
         # match the value written.
         if confirm:
-            while self.bar0_reg_read(reg, width) != value:
-                continue
+            poll(lambda: self.bar0_reg_read(reg, width), value.__eq__,
+                "BAR0 register {:#x} to read back {:#x}".format(reg, value), self.poll_timeout, stats)
 
 class AsmDev:
     width_map = {
@@ -175,7 +839,6 @@ class AsmDev:
         8: '<Q',
     }
 
-    # TODO: Populate structs with register info from YAML files.
     ids_map = {
         (0x1b21, 0x1042): {
             'name': "ASM1042",
@@ -184,14 +847,17 @@ class AsmDev:
         (0x1b21, 0x1142): {
             'name': "ASM1042A",
             'hw_code_and_mmio': 1,
+            'data_filename': "regs-asm1042a.yaml",
         },
         (0x1b21, 0x1242): {
             'name': "ASM1142",
             'hw_code_and_mmio': 1,
+            'data_filename': "regs-asm1142.yaml",
         },
         (0x1b21, 0x2142): {
             'name': "ASM2142/ASM3142",
             'hw_code_and_mmio': 2,
+            'data_filename': "regs-asm2142.yaml",
         },
         (0x1b21, 0x3242): {
             'name': "ASM3242",
@@ -221,15 +887,25 @@ class AsmDev:
     MMIO_ACCESS_STATUS_BAR0 = 0x3009
 
     CPU_MODE_NEXT_64K = 0xF340
+    CPU_MODE_CURRENT_64K = 0xF341
     CPU_EXEC_CTRL_64K = 0xF342
 
     CPU_MODE_NEXT_128K = 0x15040
+    CPU_MODE_CURRENT_128K = 0x15041
     CPU_EXEC_CTRL_128K = 0x15042
 
-    def __init__(self, dbsf: str, debug: bool = False, verbose: bool = False) -> None:
+    # The granularity of differential CODE RAM loads and of verification.
+    CODE_BLOCK_SIZE = 0x100
+
+    VERIFY_MODES = ("none", "sampled", "full")
+
+    # In "sampled" verify mode, check one out of this many blocks.
+    VERIFY_SAMPLE_STRIDE = 8
+
+    def __init__(self, dbsf: str, debug: bool = False, verbose: bool = False, pci: PciDev | None = None) -> None:
         self.debug = debug
         self.verbose = debug or verbose
-        self.pci = PciDev(dbsf, debug, verbose)
+        self.pci = pci if pci is not None else PciDev(dbsf, debug, verbose)
 
         vid = self.pci.vid
         did = self.pci.did
@@ -239,8 +915,181 @@ class AsmDev:
         self.chip = self.ids_map[(vid, did)]
         self.name = self.chip['name']  # type: ignore[index]
         self.hw_code_and_mmio = self.chip.get('hw_code_and_mmio', None)  # type: ignore[attr-defined]
+        self.data_filename = self.chip.get('data_filename', None)  # type: ignore[attr-defined]
+
+        # Chips with 128 kB of CODE RAM also have a 128 kB XDATA space, with
+        # MMIO in the upper 64 kB.
+        self.xdata_size = 0x20000 if self.hw_code_and_mmio == 2 else 0x10000
+
+        self.code_cache = CodeRamCache(dbsf, self.name, self.CODE_BLOCK_SIZE)
+
+        # Set by enable_shadow().
+        self.shadow: ShadowCache | None = None
+
+    def _hw_code_addr_wait(self, ram_addr: int) -> int:
+        return poll(lambda: self.pci.config_reg_read(self.CODE_RAM_ADDR, 2), ram_addr.__ne__,
+            "CODE_RAM_ADDR to increment from {:#06x}".format(ram_addr), self.pci.poll_timeout, self.pci.stats)
+
+    def _hw_code_stream(self, schedule: CodeSchedule, indices: Iterable[int]) -> None:
+        code_addrs = schedule.code_addrs
+        ram_addrs = schedule.ram_addrs
+        data = schedule.data
+
+        # CODE_RAM_ADDR increments by two after every data write, so it only
+        # needs to be written when the next transfer isn't at the address the
+        # hardware has already moved on to.
+        next_ram_addr = None
+        for i in indices:
+            ram_addr = ram_addrs[i]
+            if ram_addr != next_ram_addr:
+                self.pci.config_reg_write(self.CODE_RAM_ADDR, 2, ram_addr, confirm=True)
+
+            if self.hw_code_and_mmio == 1:
+                reg = self.CODE_RAM_DATA_LOWER_BANK_DATA
+                if (code_addrs[i] & (1 << 15)):
+                    reg = self.CODE_RAM_DATA_UPPER_BANK_DATA
+                self.pci.config_reg_write(reg, 2, data[i])
+            elif self.hw_code_and_mmio == 2:
+                self.pci.bar0_reg_write(self.CODE_RAM_WRITE_DATA_BAR0, 4, data[i])
+
+            # The write is complete once CODE_RAM_ADDR has been incremented.
+            next_ram_addr = self._hw_code_addr_wait(ram_addr)
+
+    def _hw_code_block_indices(self, schedule: CodeSchedule, blocks: Iterable[int] | None) -> Iterable[int]:
+        if blocks is None:
+            return range(len(schedule.data))
+
+        block_set = set(blocks)
+        block_size = self.CODE_BLOCK_SIZE
+        indices = []
+        for i, code_addr in enumerate(schedule.code_addrs):
+            if code_addr // block_size in block_set:
+                indices.append(i)
+            elif self.hw_code_and_mmio == 2 and (code_addr | 0x8000) // block_size in block_set:
+                indices.append(i)
+
+        return indices
+
+    def _hw_code_blocks(self, addr: int, length: int) -> set[int]:
+        if length == 0:
+            return set()
+
+        return set(range(addr // self.CODE_BLOCK_SIZE, (addr + length - 1) // self.CODE_BLOCK_SIZE + 1))
+
+    def _hw_code_verify(self, addr: int, code: bytes, blocks: Iterable[int]) -> dict[int, list[int]]:
+        block_size = self.CODE_BLOCK_SIZE
+        end = addr + len(code)
+        view = memoryview(code)
+        readback = bytearray(len(code))
+
+        # Every read returns the words at the same offset in each of the four
+        # 16 kB banks of a 64 kB window, so group the blocks by the range of
+        # read addresses they share and check each group as soon as it has been
+        # read.
+        groups: dict[int, list[int]] = dict()
+        for block in blocks:
+            block_start = max(block * block_size, addr)
+            ram_addr = ((block_start & 0x10000) >> 1) | (block_start & 0x3ffe)
+            groups.setdefault(ram_addr // block_size, []).append(block)
+
+        mismatches: dict[int, list[int]] = dict()
+        next_ram_addr = None
+        for group in sorted(groups.keys()):
+            group_blocks = groups[group]
+
+            ram_addrs = set()
+            for block in group_blocks:
+                for code_addr in range(max(block * block_size, addr), min((block + 1) * block_size, end), 2):
+                    ram_addrs.add(((code_addr & 0x10000) >> 1) | (code_addr & 0x3ffe))
+
+            for ram_addr in sorted(ram_addrs):
+                if ram_addr != next_ram_addr:
+                    self.pci.config_reg_write(self.CODE_RAM_ADDR, 2, ram_addr, confirm=True)
+                self.pci.bar0_reg_write(self.CODE_RAM_WRITE_DATA_BAR0, 4, 0)
+                next_ram_addr = self._hw_code_addr_wait(ram_addr)
+
+                banks_02 = self.pci.bar0_reg_read(self.CODE_RAM_READ_DATA_BAR0, 4)
+                banks_13 = self.pci.bar0_reg_read(self.CODE_RAM_READ_DATA_BAR0+4, 4)
+
+                base_addr = ((ram_addr & 0x8000) << 1) | (ram_addr & 0x3ffe)
+                for bank_offset, word in ((0x0000, banks_02 & 0xffff), (0x8000, banks_02 >> 16), (0x4000, banks_13 & 0xffff), (0xc000, banks_13 >> 16)):
+                    code_addr = base_addr + bank_offset
+                    if addr <= code_addr < end:
+                        readback[code_addr-addr:code_addr-addr+2] = word.to_bytes(2, 'little')
+
+            for block in group_blocks:
+                start = max(block * block_size, addr) - addr
+                stop = min((block + 1) * block_size, end) - addr
+                if readback[start:stop] != view[start:stop]:
+                    mismatches[block] = [addr + i for i in range(start, stop, 2) if readback[i:i+2] != view[i:i+2]]
+
+        return mismatches
+
+    @functools.cached_property
+    def regs(self) -> RegisterFile:
+        '''The chip's registers, by name, as described in its YAML data file'''
+
+        return RegisterFile.load(self)
+
+    @property
+    def xdata(self) -> RegisterSpace:
+        return self.regs.xdata
+
+    def enable_shadow(self) -> ShadowCache:
+        '''Starts caching the values written to the registers that only the host changes, to skip reading them again while the CPU is halted'''
 
-    def hw_code_write(self, addr: int, code: bytes) -> None:
+        if self.shadow is None:
+            self.shadow = ShadowCache.from_db(self.regs.db)
+
+        return self.shadow
+
+    def shadow_flush(self) -> None:
+        if self.shadow is not None:
+            self.shadow.flush()
+
+    def _xdata_addr(self, addr: int) -> int:
+        # The MMIO access mechanism only takes the lower 16 bits of the address.
+        return (addr & 0xffff) | (0x10000 if self.hw_code_and_mmio == 2 else 0)
+
+    @property
+    def stats(self) -> AccessStats | None:
+        return self.pci.stats
+
+    @stats.setter
+    def stats(self, stats: AccessStats | None) -> None:
+        self.pci.stats = stats
+
+    @property
+    def trace(self) -> AccessTrace | None:
+        return self.pci.trace
+
+    @trace.setter
+    def trace(self, trace: AccessTrace | None) -> None:
+        self.pci.trace = trace
+
+    @classmethod
+    def discover(cls, pattern: str = "*", sysfs_dir: str = PciDev.SYSFS_DIR) -> list[str]:
+        '''Returns the DBSFs of every device with hardware CODE and MMIO access that matches the glob pattern'''
+
+        dbsfs = []
+        for dbsf in sorted(os.listdir(sysfs_dir)):
+            if not fnmatch.fnmatch(dbsf, pattern):
+                continue
+
+            try:
+                vid = int(open("{}/{}/vendor".format(sysfs_dir, dbsf), "r").read().rstrip('\n'), 16)
+                did = int(open("{}/{}/device".format(sysfs_dir, dbsf), "r").read().rstrip('\n'), 16)
+            except (FileNotFoundError, ValueError):
+                continue
+
+            chip = cls.ids_map.get((vid, did))
+            if chip is not None and chip.get('hw_code_and_mmio') in (1, 2):
+                dbsfs.append(dbsf)
+
+        return dbsfs
+
+    @timed
+    def hw_code_write(self, addr: int, code: bytes, blocks: Iterable[int] | None = None, verify: str = "full", retries: int = 3) -> None:
         if self.hw_code_and_mmio not in (1, 2):
             raise ValueError("{} is not capable of hardware CODE access.".format(self.name))
 
@@ -260,6 +1109,15 @@ class AsmDev:
         if len(code) % 2 != 0:
             raise ValueError("Invalid code length, must be a multiple of 2: 0x{:04x}".format(len(code)))
 
+        if addr + len(code) > code_size_limit:
+            raise ValueError("Invalid code range, must end at or before {:#x}: {:#x}".format(code_size_limit, addr + len(code)))
+
+        if verify not in self.VERIFY_MODES:
+            raise ValueError("Invalid verify mode, must be one of {}: {}".format(", ".join(self.VERIFY_MODES), verify))
+
+        # Until the write completes, the contents of CODE RAM are unknown.
+        self.code_cache.invalidate()
+
         # Enable hardware CODE write access.
         if self.hw_code_and_mmio == 1:
             reg_F343 = self.hw_mmio_reg_read(0xF343, 1)
@@ -269,93 +1127,84 @@ class AsmDev:
             self.hw_mmio_reg_write(0x1500E, 1, reg_1500E | (1 << 0), confirm=True)
             self.pci.config_reg_write(0xef, 1, 1 << 7, confirm=True)
 
-        # Write to CODE memory.
-        if self.hw_code_and_mmio == 1:
-            for i, (word,) in enumerate(struct.iter_unpack('<H', code)):
-                offset_addr = addr + (i * 2)
-
-                reg = self.CODE_RAM_DATA_LOWER_BANK_DATA
-                if (offset_addr & (1 << 15)):
-                    reg = self.CODE_RAM_DATA_UPPER_BANK_DATA
-
-                masked_addr = offset_addr & 0x7ffe
-                self.pci.config_reg_write(self.CODE_RAM_ADDR, 2, masked_addr, confirm=True)
-                self.pci.config_reg_write(reg, 2, word)
-                while self.pci.config_reg_read(self.CODE_RAM_ADDR, 2) == masked_addr:
-                    pass
-        elif self.hw_code_and_mmio == 2:
-            i = 0
-            while i < len(code):
-                word_ev = struct.unpack_from('<H', code, i)[0]
-                word_od = 0
-
-                word_od_i = i + 0x8000
-                if word_od_i < len(code):
-                    word_od = struct.unpack_from('<H', code, word_od_i)[0]
-
-                data = struct.unpack('<I', struct.pack('<HH', word_ev, word_od))[0]
-
-                offset_addr = addr + i
-                masked_addr = ((offset_addr & 0x10000) >> 1) | (offset_addr & 0x7ffe)
-                self.pci.config_reg_write(self.CODE_RAM_ADDR, 2, masked_addr, confirm=True)
-                self.pci.bar0_reg_write(self.CODE_RAM_WRITE_DATA_BAR0, 4, data)
-                while self.pci.config_reg_read(self.CODE_RAM_ADDR, 2) == masked_addr:
-                    pass
-
-                i += 2
-
-                if i & 0x8000:
-                    i -= 0x8000
-                    i += 0x10000
-
-            # Enable hardware CODE read access.
-            self.pci.config_reg_write(0xef, 1, self.pci.config_reg_read(0xef, 1) | (1 << 6), confirm=True)
-
-            # Read back firmware
-            readback = bytearray(len(code))
-            i = 0
-            while i < len(code):
-                offset_addr = addr + i
-                masked_addr = ((offset_addr & 0x10000) >> 1) | (offset_addr & 0x7ffe)
-                self.pci.config_reg_write(self.CODE_RAM_ADDR, 2, masked_addr, confirm=True)
-                self.pci.bar0_reg_write(self.CODE_RAM_WRITE_DATA_BAR0, 4, 0)
-                while self.pci.config_reg_read(self.CODE_RAM_ADDR, 2) == masked_addr:
-                    pass
-
-                word_ev, word_od = struct.unpack('<HH', struct.pack('<I', self.pci.bar0_reg_read(self.CODE_RAM_READ_DATA_BAR0, 4)))
-
-                struct.pack_into('<H', readback, i, word_ev)
-                word_od_i = i + 0x8000
-                if word_od_i < len(code):
-                    struct.pack_into('<H', readback, word_od_i, word_od)
-
-                word_ev_2, word_od_2 = struct.unpack('<HH', struct.pack('<I', self.pci.bar0_reg_read(self.CODE_RAM_READ_DATA_BAR0+4, 4)))
-
-                word_ev_2_i = i + 0x4000
-                if word_ev_2_i < len(code):
-                    struct.pack_into('<H', readback, word_ev_2_i, word_ev_2)
-                word_od_2_i = i + 0x8000 + 0x4000
-                if word_od_2_i < len(code):
-                    struct.pack_into('<H', readback, word_od_2_i, word_od_2)
+        try:
+            # Write to CODE memory.
+            schedule = code_schedule(self.hw_code_and_mmio, addr, bytes(code))
+            if blocks is None:
+                blocks = self._hw_code_blocks(addr, len(code))
+            else:
+                blocks = set(blocks)
+            self._hw_code_stream(schedule, self._hw_code_block_indices(schedule, blocks))
+
+            # Only the chips with 128 kB of CODE RAM can read it back.
+            if self.hw_code_and_mmio == 2 and verify != "none":
+                verify_blocks = sorted(blocks)
+                if verify == "sampled":
+                    # Derive the first block from the image, so the same
+                    # image always checks the same blocks and any failure
+                    # can be reproduced.
+                    stride = self.VERIFY_SAMPLE_STRIDE
+                    verify_blocks = verify_blocks[crc32(code) % stride::stride]
+                    if self.verbose:
+                        print("AsmDev.hw_code_write: Verifying sampled blocks: {}".format(
+                            ", ".join("{:#07x}".format(block * self.CODE_BLOCK_SIZE) for block in verify_blocks)))
+
+                attempt = 0
+                while True:
+                    # Enable hardware CODE read access. Write access was
+                    # just enabled (and confirmed), so there's no need to
+                    # read the register back first.
+                    self.pci.config_reg_write(0xef, 1, (1 << 7) | (1 << 6), confirm=True)
+
+                    mismatches = self._hw_code_verify(addr, code, verify_blocks)
+                    if not mismatches:
+                        break
+
+                    if self.verbose:
+                        for block, mismatch_addrs in sorted(mismatches.items()):
+                            print("AsmDev.hw_code_write: Block {:#07x} mismatched at: {}".format(
+                                block * self.CODE_BLOCK_SIZE, ", ".join("{:#07x}".format(a) for a in mismatch_addrs)))
+
+                    if attempt >= retries:
+                        raise VerifyError("CODE RAM verification failed in {} block(s) after {} retries, first mismatch at {:#07x}.".format(
+                            len(mismatches), retries, min(min(a) for a in mismatches.values())), mismatches)
+                    attempt += 1
+
+                    # Rewrite only the blocks that failed, then check them again.
+                    self.pci.config_reg_write(0xef, 1, 1 << 7, confirm=True)
+                    self._hw_code_stream(schedule, self._hw_code_block_indices(schedule, mismatches.keys()))
+                    verify_blocks = sorted(mismatches.keys())
+        finally:
+            # Disable hardware CODE write access.
+            if self.hw_code_and_mmio == 1:
+                reg_F343 = self.hw_mmio_reg_read(0xF343, 1)
+                self.hw_mmio_reg_write(0xF343, 1, reg_F343 & ~(1 << 1), confirm=True)
+            elif self.hw_code_and_mmio == 2:
+                self.pci.config_reg_write(0xef, 1, 0, confirm=True)
+                reg_1500E = self.hw_mmio_reg_read(0x1500E, 1)
+                self.hw_mmio_reg_write(0x1500E, 1, reg_1500E & ~(1 << 0), confirm=True)
 
-                i += 2
+    def hw_code_changed_blocks(self, code: bytes) -> set[int] | None:
+        '''Returns the CODE RAM blocks that differ from the last image loaded, or None if the contents of CODE RAM are unknown'''
 
-                if i & 0x4000:
-                    i -= 0x4000
-                    i += 0x10000
+        cached = self.code_cache.load()
+        if cached is None:
+            return None
 
-            assert readback == code
+        # If the CPU isn't running from CODE RAM, it has been reset or lost
+        # power since the last load, so CODE RAM can't be trusted.
+        cpu_mode_current = self.CPU_MODE_CURRENT_64K
+        if self.hw_code_and_mmio == 2:
+            cpu_mode_current = self.CPU_MODE_CURRENT_128K
+        if not (self.hw_mmio_reg_read(cpu_mode_current, 1) & (1 << 0)):
+            self.code_cache.invalidate()
+            return None
 
-        # Disable hardware CODE write access.
-        if self.hw_code_and_mmio == 1:
-            reg_F343 = self.hw_mmio_reg_read(0xF343, 1)
-            self.hw_mmio_reg_write(0xF343, 1, reg_F343 & ~(1 << 1), confirm=True)
-        elif self.hw_code_and_mmio == 2:
-            self.pci.config_reg_write(0xef, 1, 0, confirm=True)
-            reg_1500E = self.hw_mmio_reg_read(0x1500E, 1)
-            self.hw_mmio_reg_write(0x1500E, 1, reg_1500E & ~(1 << 0), confirm=True)
+        hashes = self.code_cache.block_hashes(code)
+        return {i for i, block_hash in enumerate(hashes) if i >= len(cached) or cached[i] != block_hash}
 
-    def hw_code_load_exec(self, code: bytes, half_speed: bool = True) -> None:
+    @timed
+    def hw_code_load_exec(self, code: bytes, half_speed: bool = True, differential: bool = False, verify: str = "full") -> None:
         if self.hw_code_and_mmio not in (1, 2):
             raise ValueError("{} is not capable of hardware CODE access.".format(self.name))
 
@@ -376,11 +1225,24 @@ class AsmDev:
             cpu_mode_next = self.CPU_MODE_NEXT_128K
             cpu_exec_ctrl = self.CPU_EXEC_CTRL_128K
 
+        blocks = None
+        if differential:
+            blocks = self.hw_code_changed_blocks(code)
+            if self.verbose:
+                if blocks is None:
+                    print("AsmDev.hw_code_load_exec: CODE RAM contents unknown, loading the whole image.")
+                else:
+                    print("AsmDev.hw_code_load_exec: Loading {} changed block(s).".format(len(blocks)))
+
+        # Loading new code resets the CPU, so forget everything it may have
+        # changed.
+        self.shadow_flush()
+
         # Halt the CPU.
         self.hw_mmio_reg_write(cpu_exec_ctrl, 1, 1 << 1)
 
         # Write the program to CODE RAM.
-        self.hw_code_write(0x0000, code)
+        self.hw_code_write(0x0000, code, blocks, verify)
 
         # Configure CPU to boot from CODE RAM.
         self.hw_mmio_reg_write(cpu_mode_next, 1, ((1 if half_speed else 0) << 1) | 1)
@@ -388,42 +1250,148 @@ class AsmDev:
         # Release the CPU from reset.
         self.hw_mmio_reg_write(cpu_exec_ctrl, 1, 0)
 
-    def hw_mmio_reg_read(self, addr: int, width: int) -> int:
+        self.code_cache.store(self.code_cache.block_hashes(code))
+
+    def _hw_mmio_check(self) -> None:
         if self.hw_code_and_mmio not in (1, 2):
             raise ValueError("{} is not capable of hardware MMIO access.".format(self.name))
 
+    def _hw_mmio_settle(self) -> None:
+        stats = self.pci.stats
+        if stats is None:
+            time.sleep(0.0001)
+            return
+
+        start = time.perf_counter_ns()
+        time.sleep(0.0001)
+        stats.settle_sleep_ns += time.perf_counter_ns() - start
+
+    def _hw_mmio_idle_wait(self) -> None:
+        poll(lambda: self.pci.bar0_reg_read(self.MMIO_ACCESS_STATUS_BAR0, 1), lambda status: not (status & (1 << 7)),
+            "the MMIO access interface to become idle", self.pci.poll_timeout, self.pci.stats)
+
+    def _hw_mmio_read(self, addr: int, length: int, cached: bool = True) -> bytearray:
+        shadow = self.shadow
+        if shadow is not None and cached:
+            values = shadow.lookup(self._xdata_addr(addr), length)
+            if values is not None:
+                return values
+
+        trace = self.pci.trace
+        if trace is not None:
+            trace.record(AccessTrace.MMIO_START, addr, length, 0)
+
+        data = bytearray(length)
+        if self.hw_code_and_mmio == 1:
+            for i in range(length):
+                byte_addr = (addr + i) & 0xffff
+                self.pci.config_reg_write(self.MMIO_ACCESS_ADDR, 2, byte_addr, confirm=True)
+                self._hw_mmio_settle()
+                data[i] = self.pci.config_reg_read(self.MMIO_ACCESS_READ_DATA, 1)
+                self._hw_mmio_settle()
+        elif self.hw_code_and_mmio == 2:
+            self._hw_mmio_idle_wait()
+            for i in range(length):
+                byte_addr = (addr + i) & 0xffff
+                self.pci.bar0_reg_write(self.MMIO_ACCESS_ADDR_BAR0, 2, byte_addr)
+
+                # Waiting for the read to complete also leaves the interface
+                # idle for the next byte, so there's no need to poll again
+                # before writing the next address.
+                self._hw_mmio_idle_wait()
+                data[i] = self.pci.bar0_reg_read(self.MMIO_ACCESS_READ_DATA_BAR0, 1)
+
+        if trace is not None:
+            trace.record_data(AccessTrace.MMIO_READ, addr, data, False)
+
+        return data
+
+    def _hw_mmio_write(self, addr: int, data: bytes) -> None:
+        trace = self.pci.trace
+        if trace is not None:
+            trace.record(AccessTrace.MMIO_START, addr, len(data), 0)
+
+        if self.hw_code_and_mmio == 1:
+            for i, byte_value in enumerate(data):
+                byte_addr = (addr + i) & 0xffff
+                self.pci.config_reg_write(self.MMIO_ACCESS_ADDR, 2, byte_addr, confirm=True)
+                self._hw_mmio_settle()
+                self.pci.config_reg_write(self.MMIO_ACCESS_WRITE_DATA, 1, byte_value)
+                self._hw_mmio_settle()
+        elif self.hw_code_and_mmio == 2:
+            for i, byte_value in enumerate(data):
+                byte_addr = (addr + i) & 0xffff
+                self.pci.bar0_reg_write(self.MMIO_ACCESS_ADDR_BAR0, 2, byte_addr)
+                self._hw_mmio_idle_wait()
+                self.pci.bar0_reg_write(self.MMIO_ACCESS_WRITE_DATA_BAR0, 1, byte_value)
+                self._hw_mmio_idle_wait()
+
+        if trace is not None:
+            trace.record_data(AccessTrace.MMIO_WRITE, addr, data, True)
+
+        shadow = self.shadow
+        if shadow is not None:
+            xdata_addr = self._xdata_addr(addr)
+            cpu_exec_ctrl = self._xdata_addr(self.CPU_EXEC_CTRL_128K if self.hw_code_and_mmio == 2 else self.CPU_EXEC_CTRL_64K)
+            if xdata_addr <= cpu_exec_ctrl < xdata_addr + len(data):
+                # The cache can only be used while the CPU is halted or held
+                # in reset, and releasing it lets the firmware change anything.
+                shadow.set_halted(data[cpu_exec_ctrl - xdata_addr] & 0x3 != 0)
+            shadow.update(xdata_addr, data)
+
+    @timed
+    def hw_mmio_read_range(self, addr: int, length: int) -> bytearray:
+        self._hw_mmio_check()
+
+        if length < 0:
+            raise ValueError("Invalid length: {}".format(length))
+
+        if self.debug:
+            print("AsmDev.hw_mmio_read_range: Reading {} bytes from {:#x}...".format(length, addr))
+
+        data = self._hw_mmio_read(addr, length)
+
+        if self.debug:
+            print("AsmDev.hw_mmio_read_range: Read: {}".format(data.hex()))
+
+        return data
+
+    @timed
+    def hw_mmio_write_range(self, addr: int, data: bytes, confirm: bool = False) -> None:
+        self._hw_mmio_check()
+
+        if self.debug:
+            print("AsmDev.hw_mmio_write_range: Writing {} to {:#x}...".format(bytes(data).hex(), addr))
+
+        self._hw_mmio_write(addr, data)
+
+        # If "confirm" is set, repeatedly read the range until its contents
+        # match the data written.
+        if confirm:
+            expected = int.from_bytes(data, 'little')
+            poll(lambda: int.from_bytes(self._hw_mmio_read(addr, len(data), False), 'little'), expected.__eq__,
+                "MMIO range {:#x}+{:#x} to read back {}".format(addr, len(data), bytes(data).hex()), self.pci.poll_timeout, self.pci.stats)
+
+    @timed
+    def hw_mmio_reg_read(self, addr: int, width: int) -> int:
+        self._hw_mmio_check()
+
         if width not in self.struct_map.keys():
             raise ValueError("Invalid width: {}".format(width))
 
         if self.debug:
             print("AsmDev.hw_mmio_reg_read: Reading {} bytes from {:#x}...".format(width, addr))
 
-        value = 0
-        for i in range(width):
-            byte_addr = (addr + i) & 0xffff
-            if self.hw_code_and_mmio == 1:
-                self.pci.config_reg_write(self.MMIO_ACCESS_ADDR, 2, byte_addr, confirm=True)
-                time.sleep(0.0001)
-                byte_value = self.pci.config_reg_read(self.MMIO_ACCESS_READ_DATA, 1)
-                time.sleep(0.0001)
-            elif self.hw_code_and_mmio == 2:
-                while self.pci.bar0_reg_read(self.MMIO_ACCESS_STATUS_BAR0, 1) & (1 << 7):
-                    pass
-                self.pci.bar0_reg_write(self.MMIO_ACCESS_ADDR_BAR0, 2, byte_addr)
-                while self.pci.bar0_reg_read(self.MMIO_ACCESS_STATUS_BAR0, 1) & (1 << 7):
-                    pass
-                byte_value = self.pci.bar0_reg_read(self.MMIO_ACCESS_READ_DATA_BAR0, 1)
-
-            value |= byte_value << (8 * i)
+        value = int.from_bytes(self._hw_mmio_read(addr, width), 'little')
 
         if self.debug:
             print("AsmDev.hw_mmio_reg_read: Read: {:#x}".format(value))
 
         return value
 
+    @timed
     def hw_mmio_reg_write(self, addr: int, width: int, value: int, confirm: bool = False) -> None:
-        if self.hw_code_and_mmio not in (1, 2):
-            raise ValueError("{} is not capable of hardware MMIO access.".format(self.name))
+        self._hw_mmio_check()
 
         if width not in self.struct_map.keys():
             raise ValueError("Invalid width: {}".format(width))
@@ -431,28 +1399,13 @@ class AsmDev:
         if self.debug:
             print("AsmDev.hw_mmio_reg_write: Writing {} bytes of {:#x} to {:#x}...".format(width, value, addr))
 
-        for i in range(width):
-            byte_addr = (addr + i) & 0xffff
-            byte_value = (value >> (8 * i)) & 0xff
-            if self.hw_code_and_mmio == 1:
-                self.pci.config_reg_write(self.MMIO_ACCESS_ADDR, 2, byte_addr, confirm=True)
-                time.sleep(0.0001)
-                self.pci.config_reg_write(self.MMIO_ACCESS_WRITE_DATA, 1, byte_value)
-                time.sleep(0.0001)
-            elif self.hw_code_and_mmio == 2:
-                self.pci.bar0_reg_write(self.MMIO_ACCESS_ADDR_BAR0, 2, byte_addr)
-                while self.pci.bar0_reg_read(self.MMIO_ACCESS_STATUS_BAR0, 1) & (1 << 7):
-                    pass
-                self.pci.bar0_reg_write(self.MMIO_ACCESS_WRITE_DATA_BAR0, 1, byte_value)
-                while self.pci.bar0_reg_read(self.MMIO_ACCESS_STATUS_BAR0, 1) & (1 << 7):
-                    pass
+        self._hw_mmio_write(addr, (value & ((1 << (8 * width)) - 1)).to_bytes(width, 'little'))
 
         # If "confirm" is set, repeatedly read the register until its contents
         # match the value written.
         if confirm:
-            while self.hw_mmio_reg_read(addr, width) != value:
-                continue
-
+            poll(lambda: int.from_bytes(self._hw_mmio_read(addr, width, False), 'little'), value.__eq__,
+                "MMIO register {:#x} to read back {:#x}".format(addr, value), self.pci.poll_timeout, self.pci.stats)
 
 def main() -> None:
     parser = argparse.ArgumentParser()
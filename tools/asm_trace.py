@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# asm_trace.py - A tool to inspect and replay asm_tool access traces.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import sys
+import time
+from typing import Iterable, NamedTuple
+from zlib import crc32
+
+from asm_sim import SimDevice
+from asm_tool import AccessTrace, AsmDev, TraceRecord
+
+
+class ReplayResult(NamedTuple):
+    reads: int
+    writes: int
+    # The records whose reads returned something other than what was recorded,
+    # along with the value read during the replay.
+    mismatches: list[tuple[TraceRecord, int]]
+    seconds: float
+
+def format_record(record: TraceRecord) -> str:
+    kind = AccessTrace.KIND_NAMES[record.kind]
+    if record.kind == AccessTrace.MMIO_START:
+        value = ""
+    elif record.data is not None:
+        value = record.data.hex()
+    elif record.length > 4:
+        value = "crc32={:08x}".format(record.value)
+    else:
+        value = "{:#0{}x}".format(record.value, 2 + 2 * record.length)
+
+    return "{:>14.06f} {:<12} {:#07x} {:>4} {}".format(record.timestamp_ns / 1e9, kind, record.addr, record.length, value)
+
+def replay_records(records: Iterable[TraceRecord], level: str) -> Iterable[TraceRecord]:
+    # At the "mmio" level, the config and BAR0 accesses that make up each
+    # internal MMIO access are replaced by the MMIO access itself, so the
+    # replay goes through the current handshake code.
+    in_mmio = False
+    for record in records:
+        if level == "raw":
+            if record.kind in (AccessTrace.MMIO_START, AccessTrace.MMIO_READ, AccessTrace.MMIO_WRITE):
+                continue
+        elif record.kind == AccessTrace.MMIO_START:
+            in_mmio = True
+            continue
+        elif record.kind in (AccessTrace.MMIO_READ, AccessTrace.MMIO_WRITE):
+            in_mmio = False
+        elif in_mmio:
+            continue
+        yield record
+
+def replay(dev: AsmDev, records: Iterable[TraceRecord], level: str = "raw", timing: bool = False) -> ReplayResult:
+    '''Re-issues the recorded accesses, and compares the values read with the ones recorded'''
+
+    pci = dev.pci
+    reads = 0
+    writes = 0
+    mismatches: list[tuple[TraceRecord, int]] = []
+    start = time.perf_counter_ns()
+    first_ns: int | None = None
+    for record in replay_records(records, level):
+        if timing:
+            # Wait until the same time has passed since the first access as
+            # when the trace was recorded.
+            if first_ns is None:
+                first_ns = record.timestamp_ns
+            delay_ns = (record.timestamp_ns - first_ns) - (time.perf_counter_ns() - start)
+            if delay_ns > 0:
+                time.sleep(delay_ns / 1e9)
+
+        kind = record.kind
+        if kind in (AccessTrace.CONFIG_READ, AccessTrace.BAR0_READ, AccessTrace.MMIO_READ):
+            reads += 1
+            if kind == AccessTrace.CONFIG_READ and record.length <= 4:
+                value = pci.config_reg_read(record.addr, record.length)
+            elif kind == AccessTrace.CONFIG_READ:
+                value = crc32(pci.config_read(record.addr, record.length))
+            elif kind == AccessTrace.BAR0_READ:
+                value = pci.bar0_reg_read(record.addr, record.length)
+            else:
+                data = dev.hw_mmio_read_range(record.addr, record.length)
+                value = int.from_bytes(data, 'little') if record.length <= 4 else crc32(data)
+            if value != record.value:
+                mismatches.append((record, value))
+        elif kind in (AccessTrace.CONFIG_WRITE, AccessTrace.BAR0_WRITE, AccessTrace.MMIO_WRITE):
+            writes += 1
+            data = record.data if record.data is not None else record.value.to_bytes(record.length, 'little')
+            if kind == AccessTrace.CONFIG_WRITE and record.data is None:
+                pci.config_reg_write(record.addr, record.length, record.value)
+            elif kind == AccessTrace.CONFIG_WRITE:
+                pci.config_write(record.addr, data)
+            elif kind == AccessTrace.BAR0_WRITE:
+                pci.bar0_reg_write(record.addr, record.length, record.value)
+            else:
+                dev.hw_mmio_write_range(record.addr, data)
+    stop = time.perf_counter_ns()
+
+    return ReplayResult(reads, writes, mismatches, (stop - start) / 1e9)
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--replay", type=str, metavar="DBSF", help="Replay the trace against the host controller at \"<domain>:<bus>:<slot>.<func>\".")
+    parser.add_argument("-s", "--sim", action="store_true", default=False, help="Replay the trace against a simulation of the chip it was recorded on.")
+    parser.add_argument("-l", "--level", type=str, choices=("raw", "mmio"), default="raw", help="Replay the individual config and BAR0 accesses (\"raw\"), or replace the ones that make up each internal MMIO access with the MMIO access itself (\"mmio\"). Default is \"raw\".")
+    parser.add_argument("-t", "--timing", action="store_true", default=False, help="Replay the accesses with the same timing as when they were recorded.")
+    parser.add_argument("-q", "--quiet", action="store_true", default=False, help="Don't print the records.")
+    parser.add_argument("trace", type=str, help="The trace file.")
+    args = parser.parse_args()
+
+    try:
+        vid, did, records = AccessTrace.load(args.trace)
+    except ValueError as error:
+        print("Error: {}".format(error), file=sys.stderr)
+        return 1
+
+    chip = AsmDev.ids_map.get((vid, did), dict()).get('name', "UNKNOWN")
+    print("Chip: {} ({:04x}:{:04x}), {} records".format(chip, vid, did, len(records)))
+
+    if not args.quiet and not (args.replay or args.sim):
+        for record in records:
+            print(format_record(record))
+
+    if not (args.replay or args.sim):
+        return 0
+
+    if args.sim:
+        if (vid, did) not in AsmDev.ids_map.keys():
+            print("Error: The trace doesn't say which chip it was recorded on, so it can't be simulated.", file=sys.stderr)
+            return 1
+
+        with SimDevice(vid, did) as sim:
+            result = replay(sim.asm_dev(), records, args.level, args.timing)
+    else:
+        dev = AsmDev(args.replay)
+        if (dev.pci.vid, dev.pci.did) != (vid, did):
+            print("Warning: The trace was recorded on a different chip ({:04x}:{:04x}).".format(vid, did), file=sys.stderr)
+        dev.pci.driver_unbind()
+        result = replay(dev, records, args.level, args.timing)
+
+    if not args.quiet:
+        for record, value in result.mismatches:
+            print("Mismatch: {} (replay read {:#x})".format(format_record(record), value))
+
+    print("Replayed {} reads and {} writes in {:.06f} seconds, {} reads mismatched".format(
+        result.reads, result.writes, result.seconds, len(result.mismatches)))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
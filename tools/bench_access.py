@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# bench_access.py - Benchmarks for the asm_tool access paths, run against a
+# simulated host controller.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, NamedTuple
+
+from asm_tool import AsmDev
+from asm_sim import SimDevice
+
+
+class BenchResult(NamedTuple):
+    chip: str
+    name: str
+    ops: int
+    bytes: int
+    seconds: float
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.ops / self.seconds
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds
+
+def run(chip: str, name: str, function: Callable[[], int], ops_per_call: int, min_time: float) -> BenchResult:
+    # Call the function until at least "min_time" seconds have elapsed. The
+    # function returns the number of bytes it moved.
+    calls = 0
+    total_bytes = 0
+    start = time.perf_counter_ns()
+    while True:
+        total_bytes += function()
+        calls += 1
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+
+    return BenchResult(chip, name, calls * ops_per_call, total_bytes, elapsed / 1e9)
+
+def bench_chip(sim: SimDevice, min_time: float, code_size: int) -> list[BenchResult]:
+    dev = sim.asm_dev()
+    pci = dev.pci
+    chip = dev.name
+    results = []
+
+    def config_reg_read() -> int:
+        pci.config_reg_read(0x00, 4)
+        return 4
+    results.append(run(chip, "PciDev.config_reg_read", config_reg_read, 1, min_time))
+
+    def config_reg_write() -> int:
+        pci.config_reg_write(0xf8, 4, 0x12345678)
+        return 4
+    results.append(run(chip, "PciDev.config_reg_write", config_reg_write, 1, min_time))
+
+    def snapshot() -> int:
+        return len(pci.snapshot())
+    results.append(run(chip, "PciDev.snapshot", snapshot, 1, min_time))
+
+    def bar0_reg_read() -> int:
+        pci.bar0_reg_read(0x0000, 4)
+        return 4
+    results.append(run(chip, "PciDev.bar0_reg_read", bar0_reg_read, 1, min_time))
+
+    def bar0_reg_write() -> int:
+        pci.bar0_reg_write(0x0020, 4, 0x12345678)
+        return 4
+    results.append(run(chip, "PciDev.bar0_reg_write", bar0_reg_write, 1, min_time))
+
+    if dev.hw_code_and_mmio not in (1, 2):
+        return results
+
+    mmio_addr = dev.CPU_MODE_NEXT_128K if dev.hw_code_and_mmio == 2 else dev.CPU_MODE_NEXT_64K
+
+    def hw_mmio_reg_read() -> int:
+        dev.hw_mmio_reg_read(mmio_addr, 4)
+        return 4
+    results.append(run(chip, "AsmDev.hw_mmio_reg_read", hw_mmio_reg_read, 1, min_time))
+
+    def hw_mmio_reg_write() -> int:
+        dev.hw_mmio_reg_write(mmio_addr, 1, 0x01)
+        return 1
+    results.append(run(chip, "AsmDev.hw_mmio_reg_write", hw_mmio_reg_write, 1, min_time))
+
+    def hw_mmio_read_range() -> int:
+        return len(dev.hw_mmio_read_range(mmio_addr & ~0xff, 0x100))
+    results.append(run(chip, "AsmDev.hw_mmio_read_range", hw_mmio_read_range, 1, min_time))
+
+    code = os.urandom(code_size & ~1)
+
+    def hw_code_write() -> int:
+        dev.hw_code_write(0x0000, code)
+        return len(code)
+    results.append(run(chip, "AsmDev.hw_code_write", hw_code_write, 1, min_time))
+
+    def hw_code_load_exec() -> int:
+        dev.hw_code_load_exec(code)
+        return len(code)
+    results.append(run(chip, "AsmDev.hw_code_load_exec", hw_code_load_exec, 1, min_time))
+
+    return results
+
+def main() -> int:
+    names = {chip['name']: ids for ids, chip in AsmDev.ids_map.items()}
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--chip", type=str, action="append", choices=names.keys(), help="A chip to benchmark. May be specified multiple times. Default is every chip.")
+    parser.add_argument("-t", "--min-time", type=float, default=0.5, help="The minimum time to run each benchmark for, in seconds. Default is 0.5.")
+    parser.add_argument("-s", "--code-size", type=lambda x: int(x, 0), default=0x4000, help="The size of the image for the CODE benchmarks. Default is 0x4000.")
+    parser.add_argument("-j", "--json", action="store_true", default=False, help="Output the results as JSON, for comparing runs.")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.chip or names.keys():
+        with SimDevice(*names[name]) as sim:
+            results.extend(bench_chip(sim, args.min_time, args.code_size))
+
+    if args.json:
+        print(json.dumps([dict(r._asdict(), ops_per_second=r.ops_per_second, bytes_per_second=r.bytes_per_second) for r in results], indent=2))
+    else:
+        print("{:<18} {:<28} {:>14} {:>16}".format("Chip", "Benchmark", "ops/second", "bytes/second"))
+        for r in results:
+            print("{:<18} {:<28} {:>14.1f} {:>16.1f}".format(r.chip, r.name, r.ops_per_second, r.bytes_per_second))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,17 +22,21 @@
 import argparse
 import sys
 
-from asm_tool import AsmDev
+from asm_tool import AccessStats, AsmDev
 
 
 def main() -> int:
     parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--stats", action="store_true", default=False, help="Print statistics about the hardware accesses made by the demo.")
     parser.add_argument("dbsf", type=str, help="The \"<domain>:<bus>:<slot>.<func>\" for the ASMedia USB 3 host controller.")
     args = parser.parse_args()
 
     dev = AsmDev(args.dbsf)
     print("Chip: {}".format(dev.name))
 
+    if args.stats:
+        dev.stats = AccessStats()
+
     if dev.hw_code_and_mmio == 1:
         cpu_mode_next = dev.CPU_MODE_NEXT_64K
         cpu_exec_ctrl = dev.CPU_EXEC_CTRL_64K
@@ -83,6 +87,9 @@ def main() -> int:
     # Reset the CPU.
     dev.hw_mmio_reg_write(cpu_exec_ctrl, 1, 2)
 
+    if dev.stats is not None:
+        print(dev.stats.report())
+
     return 0
 
 
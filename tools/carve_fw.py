@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# carve_fw.py - A tool to find and extract every kind of ASMedia firmware and
+# BROM image from other files.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, NamedTuple
+
+import checksums
+import validate_brom
+from extract_promontory_fw import CHUNK_SIZE, MappedFile
+
+
+class Image(NamedTuple):
+    offset: int
+    length: int
+    # "xhc", "promontory", or "brom".
+    kind: str
+    chip: str
+    version: str
+
+
+# The size of the body length field of the xHC firmware images for each chip,
+# from the header magic.
+XHC_BODY_LEN_SIZES: dict[bytes, int] = {
+    b"U2104_RCFG": 2,
+    b"2104B_RCFG": 2,
+    b"2114A_RCFG": 2,
+    b"2214A_RCFG": 4,
+    b"2324A_RCFG": 4,
+}
+
+# Each magic, with the kind of image it identifies and its offset from the
+# start of the image.
+SIGNATURES: dict[bytes, tuple[str, int]] = {
+    b"_PT_": ("promontory", 0),
+    **{magic: ("xhc", 6) for magic in XHC_BODY_LEN_SIZES.keys()},
+    # The ASM1042 BROM has no magic, so it can't be found this way.
+    **{magic: ("brom", 0x87) for magic in validate_brom.CHIPS.keys() if any(magic)},
+}
+
+SIGNATURE_PATTERN: re.Pattern = re.compile(b"|".join(re.escape(magic) for magic in SIGNATURES.keys()))
+MAX_MAGIC_LEN: int = max(len(magic) for magic in SIGNATURES.keys())
+MAX_MAGIC_OFFSET: int = max(offset for _, offset in SIGNATURES.values())
+
+# When carving a stream, images larger than this won't be found.
+MAX_IMAGE_SIZE: int = 4 * 1024 * 1024
+STREAM_CHUNK_SIZE: int = 1024 * 1024
+
+
+def format_version(version: bytes | memoryview) -> str:
+    if len(version) < 6:
+        return ""
+
+    return "{:02X}{:02X}{:02X}_{:02X}_{:02X}_{:02X}".format(*version)
+
+def chip_name(fw_magic: bytes | memoryview) -> str:
+    fw_magic = bytes(fw_magic)
+    return validate_brom.CHIPS.get(fw_magic, "UNKNOWN ({!r})".format(fw_magic))
+
+def check_promontory(data: memoryview, start: int) -> Image | None:
+    # Check if the full header (4B magic, 4B len, 4B checksum) can be read
+    if start + 12 > len(data):
+        return None
+
+    length_value, stored_checksum = struct.unpack_from("<II", data, start + 4)
+    if length_value < 12 or start + length_value > len(data):
+        return None
+
+    # The signature (if any) isn't included in the checksum.
+    if checksums.sum32(data[start + 12 : start + (length_value & 0xFFFFFF00)]) != stored_checksum:
+        return None
+
+    code: int = start + 12
+    return Image(start, length_value, "promontory", chip_name(data[code+0x87:code+0x87+8]), format_version(data[code+0x80:code+0x86]))
+
+def check_xhc(data: memoryview, start: int) -> Image | None:
+    if start < 0 or start + 16 > len(data):
+        return None
+
+    magic: bytes = bytes(data[start+6:start+16])
+    header_len: int = struct.unpack_from("<H", data, start + 4)[0]
+    if header_len < 16 or start + header_len + 5 > len(data):
+        return None
+
+    header: checksums.Checksums = checksums.checksums(data[start:start+header_len])
+    header_checksum, header_crc32 = struct.unpack_from("<BI", data, start + header_len)
+    if (header.sum8, header.crc32) != (header_checksum, header_crc32):
+        return None
+
+    body: int = start + header_len + 5
+    len_size: int = XHC_BODY_LEN_SIZES[magic]
+    if body + len_size > len(data):
+        return None
+
+    code_len: int = int.from_bytes(data[body:body+len_size], 'little')
+    code: int = body + len_size
+    end: int = code + code_len + 13
+    if end > len(data) or bytes(data[code+code_len:code+code_len+8]) != magic[:5] + b"_FW":
+        return None
+
+    body_checksums: checksums.Checksums = checksums.checksums(data[code:code+code_len])
+    body_checksum, body_crc32 = struct.unpack_from("<BI", data, code + code_len + 8)
+    if (body_checksums.sum8, body_checksums.crc32) != (body_checksum, body_crc32):
+        return None
+
+    if magic == b"2324A_RCFG":
+        # The signature follows the body, starting at an offset encoded in
+        # its second byte.
+        if end + 3 > len(data):
+            return None
+        end += ((data[end + 1] >> 1) & 0x3f) + 0x20
+        if end > len(data):
+            return None
+
+    return Image(start, end - start, "xhc", chip_name(magic[:5] + b"_FW"), format_version(data[code+0x80:code+0x86]))
+
+def check_brom(data: memoryview, start: int) -> Image | None:
+    if start < 0:
+        return None
+
+    info: validate_brom.BromInfo | None = validate_brom.identify(data[start:start+0x10000])
+    if info is None:
+        return None
+
+    return Image(start, info.size, "brom", info.chip, info.version)
+
+CHECKS = {
+    "promontory": check_promontory,
+    "xhc": check_xhc,
+    "brom": check_brom,
+}
+
+def find_images(data: bytes | bytearray | mmap.mmap, start: int = 0, end: int | None = None) -> list[Image]:
+    '''Returns every valid image whose signature starts between "start" and "end", which may overlap'''
+
+    if end is None:
+        end = len(data)
+
+    images: list[Image] = []
+    with memoryview(data) as view:
+        # Search a little past the end, so a signature that straddles the
+        # boundary is still found.
+        for match in SIGNATURE_PATTERN.finditer(data, start, min(end + MAX_MAGIC_LEN - 1, len(data))):
+            if match.start() >= end:
+                break
+
+            kind, magic_offset = SIGNATURES[match.group()]
+            image: Image | None = CHECKS[kind](view, match.start() - magic_offset)
+            if image is not None:
+                images.append(image)
+
+    return images
+
+def select_images(images: list[Image]) -> list[Image]:
+    # Images can't overlap, so skip any image inside one that was already
+    # found (e.g., the firmware code inside an xHC firmware image looks like
+    # a BROM).
+    selected: list[Image] = []
+    next_offset: int = 0
+    for image in sorted(images):
+        if image.offset < next_offset:
+            continue
+
+        selected.append(image)
+        next_offset = image.offset + image.length
+
+    return selected
+
+def carve(data: bytes | mmap.mmap) -> list[Image]:
+    '''Finds every image in a buffer, in a single pass'''
+
+    return select_images(find_images(data))
+
+def carve_stream(stream: BinaryIO) -> Iterator[tuple[Image, bytes]]:
+    '''Finds every image in a stream, yielding each one with its contents, without reading the whole stream into memory'''
+
+    # Only the last MAX_IMAGE_SIZE bytes are kept, so signatures are only
+    # checked once there's enough data after them to contain a whole image.
+    # The bytes just before the last signature checked are kept too, since
+    # some magics are in the middle of their images.
+    buf: bytearray = bytearray()
+    base: int = 0
+    search_from: int = 0
+    next_offset: int = 0
+    while True:
+        chunk: bytes = stream.read(STREAM_CHUNK_SIZE)
+        buf += chunk
+
+        limit: int = len(buf) if not chunk else len(buf) - MAX_IMAGE_SIZE
+        if limit > search_from:
+            for image in sorted(find_images(buf, search_from, limit)):
+                if base + image.offset < next_offset:
+                    continue
+
+                yield (image._replace(offset=base + image.offset), bytes(buf[image.offset:image.offset+image.length]))
+                next_offset = base + image.offset + image.length
+
+            drop: int = max(0, limit - MAX_MAGIC_OFFSET)
+            del buf[:drop]
+            base += drop
+            search_from = limit - drop
+
+        if not chunk:
+            break
+
+def find_images_in_file(input_file: str, start: int, end: int) -> list[Image]:
+    with MappedFile(input_file) as f:
+        if f.mmap is None:
+            return []
+
+        return find_images(f.mmap, start, end)
+
+def carve_file(input_file: str, jobs: int | None = None) -> list[Image]:
+    '''Finds every image in a file, searching chunks of it in parallel'''
+
+    size: int = os.stat(input_file).st_size
+    chunks: list[tuple[int, int]] = [(start, min(start + CHUNK_SIZE, size)) for start in range(0, size, CHUNK_SIZE)]
+    if len(chunks) <= 1:
+        return select_images(find_images_in_file(input_file, 0, size))
+
+    images: list[Image] = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for chunk_images in executor.map(find_images_in_file, [input_file] * len(chunks), *zip(*chunks)):
+            images.extend(chunk_images)
+
+    return select_images(images)
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--list", action="store_true", default=False, help="Only list the images found, don't extract them.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="The number of processes to search the input with. Default is the number of CPUs.")
+    parser.add_argument("input_file", help="Input binary file to search for firmware images.")
+    args: argparse.Namespace = parser.parse_args()
+
+    try:
+        images: list[Image] = carve_file(args.input_file, args.jobs)
+    except FileNotFoundError:
+        print(f"Error: Could not open input file '{args.input_file}'.", file=sys.stderr)
+        return 1
+
+    with MappedFile(args.input_file) as f:
+        for count, image in enumerate(images):
+            print("{:#010x} {:>8} {:<10} {:<16} {}".format(image.offset, image.length, image.kind, image.chip, image.version))
+            if args.list:
+                continue
+
+            filename: str = f"{args.input_file}.{count}.{image.kind}.bin"
+            with open(filename, "wb") as out, memoryview(f.mmap) as data:
+                out.write(data[image.offset : image.offset + image.length])
+
+    if not images:
+        print(f"No firmware images were found in '{args.input_file}'.")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# checksums.py - Calculate the checksums used in ASMedia firmware images.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import mmap
+import sys
+from typing import NamedTuple
+from zlib import crc32
+
+try:
+    import numpy  # type: ignore[import-not-found]
+except ModuleNotFoundError:
+    numpy = None
+
+
+# Data is processed in chunks of this size, so each chunk is still in the
+# cache when the second checksum is calculated over it.
+CHUNK_SIZE: int = 1 << 16
+
+
+class Checksums(NamedTuple):
+    length: int
+    # The sum of all the bytes, without truncation.
+    total: int
+    crc32: int
+
+    @property
+    def sum8(self) -> int:
+        return self.total & 0xff
+
+    @property
+    def sum32(self) -> int:
+        return self.total & 0xffffffff
+
+def byte_sum(data: bytes | bytearray | memoryview) -> int:
+    if numpy is not None:
+        return int(numpy.frombuffer(data, dtype=numpy.uint8).sum(dtype=numpy.uint64))
+
+    if isinstance(data, memoryview):
+        # Summing a memoryview directly is slower than summing a bytes object,
+        # even counting the time it takes to copy the data, so copy it one
+        # chunk at a time.
+        return sum(sum(data[offset:offset+CHUNK_SIZE].tobytes()) for offset in range(0, len(data), CHUNK_SIZE))
+
+    return sum(data)
+
+class Checksummer:
+    '''Calculates the byte sum and CRC-32 of a stream of data in a single pass'''
+
+    def __init__(self) -> None:
+        self.length: int = 0
+        self.total: int = 0
+        self.crc32: int = 0
+
+    def update(self, data: bytes | bytearray | memoryview | mmap.mmap) -> "Checksummer":
+        with memoryview(data) as view:
+            if view.format != 'B' or view.ndim != 1:
+                view = view.cast('B')
+            for offset in range(0, len(view), CHUNK_SIZE):
+                chunk: memoryview = view[offset:offset+CHUNK_SIZE]
+                self.total += byte_sum(chunk)
+                self.crc32 = crc32(chunk, self.crc32)
+            self.length += len(view)
+
+        return self
+
+    def digest(self) -> Checksums:
+        return Checksums(self.length, self.total, self.crc32)
+
+def checksums(data: bytes | bytearray | memoryview | mmap.mmap) -> Checksums:
+    return Checksummer().update(data).digest()
+
+def sum8(data: bytes | bytearray | memoryview | mmap.mmap) -> int:
+    return byte_sum(memoryview(data)) & 0xff
+
+def sum32(data: bytes | bytearray | memoryview | mmap.mmap) -> int:
+    return byte_sum(memoryview(data)) & 0xffffffff
+
+def file_checksums(path: str, start: int = 0, length: int | None = None) -> Checksums:
+    '''Calculates the checksums of part of a file, without reading it into memory'''
+
+    with open(path, 'rb') as f:
+        checksummer: Checksummer = Checksummer()
+        try:
+            mapped: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped.
+            return checksummer.digest()
+
+        with mapped, memoryview(mapped) as view:
+            end: int = len(view) if length is None else min(len(view), start + length)
+            checksummer.update(view[start:end])
+
+        return checksummer.digest()
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--start", type=lambda x: int(x, 0), default=0, help="The offset to start at. Default is 0.")
+    parser.add_argument("-l", "--length", type=lambda x: int(x, 0), help="The number of bytes to checksum. Default is the rest of the file.")
+    parser.add_argument("input", type=str, nargs="+", help="A file to checksum.")
+    args: argparse.Namespace = parser.parse_args()
+
+    for path in args.input:
+        result: Checksums = file_checksums(path, args.start, args.length)
+        print("{}: {} bytes, sum8 0x{:02x}, sum32 0x{:08x}, CRC-32 0x{:08x}".format(
+            path, result.length, result.sum8, result.sum32, result.crc32))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,53 +19,124 @@
 
 
 import argparse
+import mmap
+import os
 import struct
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
 
+import checksums
 
-def checksum32(data: bytes) -> int:
-    return sum(data) & 0xffffffff
 
-def find_and_extract_embedded_files(data: bytes, input_file: str, ignore_checksum: bool) -> int:
-    count: int = 0
-    offset: int = 0
-    while offset < len(data):
-        pos: int = data.find(b"_PT_", offset)
-        if pos == -1:
-            break
-
-        # Check if the full header (4B magic, 4B len, 4B checksum) can be read
-        if pos + 12 > len(data):
-            offset = pos + 1
-            continue
+# Each worker searches this much of the input for headers at a time.
+CHUNK_SIZE: int = 64 * 1024 * 1024
 
-        # Skip if the length is less than the minimum
-        length_value: int = struct.unpack_from("<I", data, pos + 4)[0]
-        if length_value < 12:
-            offset = pos + 1
-            continue
+MAGIC: bytes = b"_PT_"
+
+
+class MappedFile:
+    '''A read-only memory map of a file, which may be empty'''
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "rb")
+        self.size: int = os.fstat(self.file.fileno()).st_size
+        self.mmap: mmap.mmap | None = None
+        if self.size > 0:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self) -> "MappedFile":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.mmap is not None:
+            self.mmap.close()
+        self.file.close()
+
+def find_candidates(input_file: str, start: int, end: int) -> list[tuple[int, int]]:
+    '''Returns the offset and length of every plausible image header starting between "start" and "end"'''
+
+    candidates: list[tuple[int, int]] = []
+    with MappedFile(input_file) as f:
+        data: mmap.mmap | None = f.mmap
+        if data is None:
+            return candidates
 
-        # Skip if the file is larger than the available data
-        if pos + length_value > len(data):
+        # Search a little past the end of the chunk, so a magic that
+        # straddles the boundary is still found.
+        offset: int = start
+        while offset < end:
+            pos: int = data.find(MAGIC, offset, min(end + len(MAGIC) - 1, f.size))
+            if pos == -1:
+                break
             offset = pos + 1
+
+            # Check if the full header (4B magic, 4B len, 4B checksum) can be read
+            if pos + 12 > f.size:
+                continue
+
+            # Skip if the length is less than the minimum
+            length_value: int = struct.unpack_from("<I", data, pos + 4)[0]
+            if length_value < 12:
+                continue
+
+            # Skip if the file is larger than the available data
+            if pos + length_value > f.size:
+                continue
+
+            candidates.append((pos, length_value))
+
+    return candidates
+
+def select_images(candidates: Iterator[tuple[int, int]]) -> Iterator[tuple[int, int]]:
+    # Images can't overlap, so skip any header inside an image that was
+    # already found, whether or not that image's checksum was valid.
+    next_offset: int = 0
+    for pos, length_value in candidates:
+        if pos < next_offset:
             continue
 
-        fw_image: bytes = data[pos : pos + length_value]
+        yield (pos, length_value)
+        next_offset = pos + length_value
 
-        # Only extract if the checksum matches or we're ignoring the checksum
-        valid: bool = ignore_checksum
-        if not valid:
-            stored_checksum: int = struct.unpack_from("<I", data, pos + 8)[0]
-            calculated_checksum: int = checksum32(fw_image[12 : length_value & 0xFFFFFF00])
-            valid = (calculated_checksum == stored_checksum)
+def checksum_valid(input_file: str, image: tuple[int, int]) -> bool:
+    pos, length_value = image
+    with MappedFile(input_file) as f, memoryview(f.mmap) as data:
+        stored_checksum: int = struct.unpack_from("<I", data, pos + 8)[0]
+        calculated_checksum: int = checksums.sum32(data[pos + 12 : pos + (length_value & 0xFFFFFF00)])
 
-        if valid:
-            filename: str = f"{input_file}.{count}.bin"
-            with open(filename, "wb") as f:
-                f.write(fw_image)
-            count += 1
+    return calculated_checksum == stored_checksum
 
-        offset = pos + length_value
+def find_and_extract_embedded_files(input_file: str, ignore_checksum: bool, jobs: int | None = None) -> int:
+    count: int = 0
+    with MappedFile(input_file) as f, ProcessPoolExecutor(max_workers=jobs) as executor:
+        if f.mmap is None:
+            return 0
+
+        # The headers are found in parallel, but images are selected in
+        # order, since whether a header is skipped depends on the images
+        # before it. Only the offsets are kept in memory.
+        chunks: list[tuple[int, int]] = [(start, min(start + CHUNK_SIZE, f.size)) for start in range(0, f.size, CHUNK_SIZE)]
+
+        # Don't bother starting any workers for small inputs.
+        mapper = executor.map if len(chunks) > 1 else map
+        candidates: Iterator[tuple[int, int]] = (candidate
+            for chunk_candidates in mapper(find_candidates, [input_file] * len(chunks), *zip(*chunks))
+            for candidate in chunk_candidates)
+        images: list[tuple[int, int]] = list(select_images(candidates))
+
+        # Only extract if the checksum matches or we're ignoring the checksum
+        valid: Iterator[bool] = iter([True] * len(images))
+        if not ignore_checksum:
+            valid = mapper(checksum_valid, [input_file] * len(images), images)
+
+        with memoryview(f.mmap) as data:
+            for (pos, length_value), image_valid in zip(images, valid):
+                if image_valid:
+                    filename: str = f"{input_file}.{count}.bin"
+                    with open(filename, "wb") as out:
+                        out.write(data[pos : pos + length_value])
+                    count += 1
 
     return count
 
@@ -73,18 +144,17 @@ def main() -> int:
     parser: argparse.ArgumentParser = argparse.ArgumentParser()
     parser.add_argument("-i", "--ignore-checksum", action="store_true",
                         help="Ignore the Promontory firmware image checksum, and extract it even if it doesn't match.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="The number of processes to search the input with. Default is the number of CPUs.")
     parser.add_argument("input_file", help="Input binary file to search for embedded files")
     args: argparse.Namespace = parser.parse_args()
 
     try:
-        with open(args.input_file, "rb") as f:
-            data: bytes = f.read()
+        files_extracted: int = find_and_extract_embedded_files(args.input_file, args.ignore_checksum, args.jobs)
     except FileNotFoundError:
         print(f"Error: Could not open input file '{args.input_file}'.", file=sys.stderr)
         return 1
 
-    files_extracted: int = find_and_extract_embedded_files(data, args.input_file, args.ignore_checksum)
-
     if files_extracted > 0:
         images: str = "image" if files_extracted == 1 else "images"
         print(f"Successfully extracted {files_extracted} Promontory firmware {images} from '{args.input_file}'.")
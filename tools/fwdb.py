@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# fwdb.py - An incrementally-updated index of a collection of firmware and
+# BROM images.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import functools
+import hashlib
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import validate_brom
+import validate_fw
+
+
+# Bump this whenever the schema or the way images are parsed changes, so the
+# index gets rebuilt.
+SCHEMA_VERSION: int = 1
+
+SCHEMA: str = '''
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    error TEXT
+);
+CREATE INDEX files_sha256 ON files (sha256);
+
+CREATE TABLE images (
+    sha256 TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    chip TEXT NOT NULL,
+    version TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    code_size INTEGER,
+    ok INTEGER NOT NULL,
+    signed INTEGER NOT NULL
+);
+CREATE INDEX images_chip_version ON images (chip, version);
+
+CREATE TABLE checks (
+    sha256 TEXT NOT NULL,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    expected INTEGER NOT NULL,
+    calculated INTEGER NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX checks_sha256 ON checks (sha256);
+
+CREATE TABLE config_writes (
+    sha256 TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    addr INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    -- The name of the first register containing the address, if any.
+    register TEXT
+);
+CREATE INDEX config_writes_sha256 ON config_writes (sha256);
+CREATE INDEX config_writes_addr ON config_writes (addr);
+CREATE INDEX config_writes_register ON config_writes (register);
+'''
+
+
+def connect(path: str) -> sqlite3.Connection:
+    db: sqlite3.Connection = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+
+    version: int = db.execute("PRAGMA user_version").fetchone()[0]
+    if version != SCHEMA_VERSION:
+        with db:
+            for table in ("files", "images", "checks", "config_writes"):
+                db.execute("DROP TABLE IF EXISTS {}".format(table))
+            db.executescript(SCHEMA)
+            db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+
+    return db
+
+def find_files(roots: list[str]) -> dict[str, os.stat_result]:
+    files: dict[str, os.stat_result] = dict()
+    for root in roots:
+        if os.path.isfile(root):
+            files[os.path.abspath(root)] = os.stat(root)
+            continue
+
+        for dirpath, dirs, filenames in os.walk(root):
+            for filename in filenames:
+                path: str = os.path.abspath(os.path.join(dirpath, filename))
+                try:
+                    files[path] = os.stat(path)
+                except OSError:
+                    pass
+
+    return files
+
+def parse_file(path: str, data_dir: str) -> dict:
+    # Runs in a worker process, so report failures instead of raising them.
+    result: dict = {'path': path, 'sha256': None, 'error': None}
+    try:
+        fw_bytes: bytes = open(path, 'rb').read()
+        result['sha256'] = hashlib.sha256(fw_bytes).hexdigest()
+        result['size'] = len(fw_bytes)
+
+        if not fw_bytes.startswith(b"_PT_"):
+            brom: validate_brom.BromInfo | None = validate_brom.identify(fw_bytes)
+            if brom is not None:
+                result['info'] = validate_fw.FwInfo(path, "brom", brom.chip, brom.version,
+                    [validate_fw.Check("brom", "crc32", brom.crc32, brom.crc32, 4)], None, [])
+                result['code_size'] = brom.size
+                return result
+
+        fw, info = validate_fw.analyze(path, fw_bytes, data_dir)
+        result['info'] = info
+        result['code_size'] = len(fw.body.firmware.code)
+    except Exception as error:
+        result['error'] = "{}: {}".format(type(error).__name__, error)
+
+    return result
+
+def store(db: sqlite3.Connection, result: dict, stat: os.stat_result) -> None:
+    sha256: str | None = result['sha256']
+    db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+        (result['path'], stat.st_mtime_ns, stat.st_size, sha256, result['error']))
+    if result['error'] is not None:
+        return
+
+    # Images are stored by their contents, so copies of the same image are
+    # only stored once.
+    info: validate_fw.FwInfo = result['info']
+    db.execute("DELETE FROM checks WHERE sha256 = ?", (sha256,))
+    db.execute("DELETE FROM config_writes WHERE sha256 = ?", (sha256,))
+    db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (sha256, info.kind, info.chip, info.version, result['size'], result['code_size'], info.ok, info.signature is not None))
+    db.executemany("INSERT INTO checks VALUES (?, ?, ?, ?, ?, ?)",
+        [(sha256, check.name, check.kind, check.expected, check.calculated, check.ok) for check in info.checks])
+    db.executemany("INSERT INTO config_writes VALUES (?, ?, ?, ?, ?, ?)",
+        [(sha256, seq, write.addr, write.size, write.value, write.registers[0].split("[")[0] if write.registers else None)
+            for seq, write in enumerate(info.mmio_writes)])
+
+def scan(db: sqlite3.Connection, roots: list[str], data_dir: str, jobs: int | None, prune: bool) -> None:
+    start: int = time.perf_counter_ns()
+    files: dict[str, os.stat_result] = find_files(roots)
+
+    # Only parse the files that are new, or whose size or modification time
+    # has changed since the last scan.
+    known: dict[str, tuple[int, int]] = {path: (mtime_ns, size)
+        for path, mtime_ns, size in db.execute("SELECT path, mtime_ns, size FROM files")}
+    changed: list[str] = sorted(path for path, stat in files.items()
+        if known.get(path) != (stat.st_mtime_ns, stat.st_size))
+
+    parsed: int = 0
+    errors: int = 0
+    with db, ProcessPoolExecutor(max_workers=jobs) as executor:
+        worker = functools.partial(parse_file, data_dir=data_dir)
+        chunksize: int = max(1, min(64, len(changed) // (4 * (jobs or os.cpu_count() or 1))))
+        for result in executor.map(worker, changed, chunksize=chunksize):
+            store(db, result, files[result['path']])
+            parsed += 1
+            if result['error'] is not None:
+                errors += 1
+
+        removed: int = 0
+        if prune:
+            # Forget the files under the scanned directories that are gone.
+            prefixes: list[str] = [os.path.join(os.path.abspath(root), "") for root in roots]
+            missing: list[tuple[str]] = [(path,) for path in known
+                if path not in files and any(path.startswith(prefix) for prefix in prefixes)]
+            db.executemany("DELETE FROM files WHERE path = ?", missing)
+            removed = len(missing)
+
+        # Drop the images that no file refers to anymore.
+        for table in ("images", "checks", "config_writes"):
+            db.execute("DELETE FROM {} WHERE sha256 NOT IN (SELECT sha256 FROM files WHERE sha256 IS NOT NULL)".format(table))
+    stop: int = time.perf_counter_ns()
+
+    print("Scanned {} files in {:.06f} seconds: {} new or changed ({} failed to parse), {} unchanged, {} removed".format(
+        len(files), (stop - start) / 1e9, parsed, errors, len(files) - parsed, removed), file=sys.stderr)
+
+def query(db: sqlite3.Connection, args: argparse.Namespace) -> list[tuple]:
+    conditions: list[str] = ["files.error IS NULL"]
+    params: list = []
+
+    if args.chip:
+        # Match any of the names of chips that share firmware, e.g. both
+        # "ASM2142" and "ASM3142" match "ASM2142/ASM3142".
+        conditions.append("('/' || images.chip || '/') LIKE ?")
+        params.append("%/{}/%".format(args.chip))
+    if args.kind:
+        conditions.append("images.kind = ?")
+        params.append(args.kind)
+    # Versions are fixed-width hex strings, so they sort correctly as text.
+    if args.newer_than:
+        conditions.append("images.version > ?")
+        params.append(args.newer_than.upper())
+    if args.older_than:
+        conditions.append("images.version < ?")
+        params.append(args.older_than.upper())
+    if args.invalid:
+        conditions.append("NOT images.ok")
+    if args.signed is not None:
+        conditions.append("images.signed = ?")
+        params.append(args.signed)
+    for register in args.writes or list():
+        try:
+            addr: int = int(register, 0)
+            conditions.append("EXISTS (SELECT 1 FROM config_writes w WHERE w.sha256 = images.sha256 AND w.addr <= ? AND ? < w.addr + w.size)")
+            params.extend((addr, addr))
+        except ValueError:
+            conditions.append("EXISTS (SELECT 1 FROM config_writes w WHERE w.sha256 = images.sha256 AND w.register = ?)")
+            params.append(register)
+
+    return db.execute('''
+        SELECT files.path, images.kind, images.chip, images.version, images.size, images.ok, images.signed
+        FROM files JOIN images ON files.sha256 = images.sha256
+        WHERE {}
+        ORDER BY images.chip, images.version, files.path
+    '''.format(" AND ".join(conditions)), params).fetchall()
+
+def main() -> int:
+    project_dir: pathlib.Path = pathlib.Path(__file__).resolve().parents[1]
+    default_data_dir: str = str(project_dir/"data")
+
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("-D", "--database", type=str, default="fwdb.sqlite", help="The index database. Default is \"fwdb.sqlite\".")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser: argparse.ArgumentParser = subparsers.add_parser("scan", help="Add new and changed images to the index.")
+    scan_parser.add_argument("-d", "--data-dir", type=str, default=default_data_dir, help="The YAML data directory. Default is \"{}\"".format(default_data_dir))
+    scan_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="The number of images to parse in parallel. Default is the number of CPUs.")
+    scan_parser.add_argument("-p", "--prune", action="store_true", default=False, help="Remove the files under the scanned directories that no longer exist from the index.")
+    scan_parser.add_argument("path", type=str, nargs="+", help="A firmware or BROM image, or a directory to scan recursively.")
+
+    query_parser: argparse.ArgumentParser = subparsers.add_parser("query", help="List the indexed images matching all of the given conditions.")
+    query_parser.add_argument("-c", "--chip", type=str, help="Only list images for this chip, e.g. \"ASM2142\".")
+    query_parser.add_argument("-k", "--kind", type=str, choices=("xhc", "promontory", "brom"), help="Only list images of this kind.")
+    query_parser.add_argument("-n", "--newer-than", type=str, metavar="VERSION", help="Only list images with a version newer than this one, e.g. \"170512_70_42_00\".")
+    query_parser.add_argument("-o", "--older-than", type=str, metavar="VERSION", help="Only list images with a version older than this one.")
+    query_parser.add_argument("-w", "--writes", type=str, action="append", metavar="REGISTER", help="Only list images whose header config words write this register, given as a name or an XDATA address. May be specified multiple times.")
+    query_parser.add_argument("-i", "--invalid", action="store_true", default=False, help="Only list images with bad checksums.")
+    query_parser.add_argument("-s", "--signed", action="store_const", const=1, help="Only list signed images.")
+    query_parser.add_argument("-u", "--unsigned", action="store_const", const=0, dest="signed", help="Only list unsigned images.")
+    args: argparse.Namespace = parser.parse_args()
+
+    db: sqlite3.Connection = connect(args.database)
+
+    if args.command == "scan":
+        scan(db, args.path, args.data_dir, args.jobs, args.prune)
+        return 0
+
+    start: int = time.perf_counter_ns()
+    rows: list[tuple] = query(db, args)
+    stop: int = time.perf_counter_ns()
+
+    for path, kind, chip, version, size, ok, signed in rows:
+        print("{} {:<10} {:<16} {} {:>7} {:<3} {}".format(version, kind, chip, "OK " if ok else "BAD", size, "sig" if signed else "-", path))
+    print("{} images in {:.03f} ms".format(len(rows), (stop - start) / 1e6), file=sys.stderr)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
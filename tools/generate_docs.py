@@ -20,15 +20,22 @@
 
 
 import argparse
+import functools
+import hashlib
+import marshal
+import os
+import pathlib
 import re
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, UTC
 
 import markdown  # type: ignore[import-untyped]
-import yaml  # type: ignore[import-untyped]
 from lxml import etree as ET  # type: ignore[import-untyped]
 
+import regdata
+
 
 REGION_NAMES = {
     "pci": "PCI Configuration",
@@ -46,53 +53,6 @@ PERMISSIONS = {
     "WO": "Write-Only",
 }
 
-def validate(doc) -> bool:
-    unknown_keys = set(doc.keys()).difference(set(['meta', 'xdata', 'registers']))
-    if unknown_keys:
-        print("Error: Invalid keys in document: {}".format(unknown_keys))
-        return False
-
-    xdata = doc.get('xdata', list())
-    if type(xdata) is not list:
-        print("Error: \"xdata\" is not a list.")
-        return False
-
-    for i, region in enumerate(xdata):
-        unknown_keys = set(region.keys()).difference(set(['name', 'start', 'end', 'permissions', 'notes']))
-        if unknown_keys:
-            print("Error: Invalid keys in xdata[{}]: {}".format(i, unknown_keys))
-            return False
-
-    registers = doc.get('registers', dict())
-    if type(registers) is not dict:
-        print("Error: \"registers\" is not a dict.")
-        return False
-
-    for region in REGION_NAMES.keys():
-        region_registers = registers.get(region, list())
-        if type(region_registers) is not list:
-            print("Error: Register region \"{}\" is not a list.".format(region))
-            return False
-
-        for i, register in enumerate(region_registers):
-            unknown_keys = set(register.keys()).difference(set(['name', 'start', 'end', 'permissions', 'bits', 'notes']))
-            if unknown_keys:
-                print("Error: Invalid keys in registers.{}[{}]: {}".format(region, i, unknown_keys))
-                return False
-
-            bits = register.get('bits', list())
-            if type(bits) is not list:
-                print("Error: Register {}.{}.bits is not a list.".format(region, i))
-                return False
-
-            for b, bit_range in enumerate(bits):
-                unknown_keys = set(bit_range.keys()).difference(set(['name', 'start', 'end', 'permissions', 'notes']))
-                if unknown_keys:
-                    print("Error: Invalid keys in registers.{}[{}].bits[{}]: {}".format(region, i, b, unknown_keys))
-                    return False
-
-    return True
-
 def gen_css() -> str:
     style = '''
     code {
@@ -115,353 +75,485 @@ def gen_css() -> str:
     '''
     return style
 
-def markdown_subelement(parent, tag, md) -> None:
-    xhtml = markdown.markdown(md, output_format='xhtml')
-    element = ET.fromstring("<{}>{}</{}>".format(tag, xhtml, tag))
-    parent.append(element)
-
-def gen_xhtml(filename, doc) -> bytes:
-    html = ET.Element('html', {
-        ET.QName("http://www.w3.org/2001/XMLSchema-instance", "schemaLocation"): "http://www.w3.org/MarkUp/SCHEMA/xhtml11.xsd",
-        ET.QName("http://www.w3.org/XML/1998/namespace", "lang"): "en",
-    }, nsmap={None: "http://www.w3.org/1999/xhtml"})
-
-    head = ET.SubElement(html, 'head')
-    body = ET.SubElement(html, 'body')
-
-    meta = doc.get('meta', dict())
-    chip = meta.get('chip', "UNKNOWN")
-
-    title = ET.SubElement(head, 'title')
-    title.text = "{} Memory Map and Register Manual".format(chip)
-
-    style = ET.SubElement(head, 'style')
-    style.text = gen_css()
-
-    heading = ET.SubElement(body, 'h1')
-    heading.text = title.text
-
-    ET.SubElement(body, 'h2').text = "XDATA Memory Map"
-    xdata_memory_map = ET.SubElement(body, 'table')
-    xdata_memory_map_header = ET.SubElement(xdata_memory_map, 'tr')
-    for header in ["Start", "End", "Size", "Name", "Permissions", "Notes"]:
-        ET.SubElement(xdata_memory_map_header, 'th').text = header
-
-    xdata = doc.get('xdata', list())
-    for region in xdata:
-        tr = ET.SubElement(xdata_memory_map, 'tr')
-        start = region.get('start')
-        start_text = ""
-        if start is not None:
-            start_text = "0x{:04X}".format(start)
-        ET.SubElement(tr, 'td').text = start_text
-        end = region.get('end')
-        end_text = ""
-        if end is not None:
-            end_text = "0x{:04X}".format(end)
-        ET.SubElement(tr, 'td').text = end_text
-        size_text = ""
-        if start is not None and end is not None:
-            size_text = "0x{:04X}".format(end + 1 - start)
-        ET.SubElement(tr, 'td').text = size_text
-        ET.SubElement(tr, 'td').text = region.get('name', "")
-        ET.SubElement(tr, 'td').text = region.get('permissions', "")
-        markdown_subelement(tr, 'td', region.get('notes', ""))
-
-    ET.SubElement(body, 'h2').text = "Register Permissions"
-    permissions = ET.SubElement(body, 'table')
-    permissions_header = ET.SubElement(permissions, 'tr')
-    for header in ("Abbreviation", "Description"):
-        ET.SubElement(permissions_header, 'th').text = header
-
-    for abbr, desc in PERMISSIONS.items():
-        tr = ET.SubElement(permissions, 'tr')
-        ET.SubElement(tr, 'td').text = abbr
-        ET.SubElement(tr, 'td').text = desc
-
-    ET.SubElement(body, 'h2').text = "Register Map"
-    ET.SubElement(body, 'p').text = " ".join([
-            "NOTE: Except where specified otherwise, all register addresses are byte offsets, and all multi-byte register values are little-endian.",
-            "In other words, for a 32-bit register at address 0x0000, bit 0 is the least-significant bit of the byte located at address 0x0000, and bit 31 is the most-significant bit of the byte located at address 0x0003.",
-            "This applies to all memory spaces ({}).".format(", ".join(map(lambda x: x[1], REGION_NAMES.items()))),
-            ])
-    register_regions = doc.get('registers', dict())
-    for region_name, region_registers in register_regions.items():
-        ET.SubElement(body, 'hr')
-        ET.SubElement(body, 'h3').text = "{} Region Registers".format(REGION_NAMES[region_name])
-        for register in region_registers:
-            ET.SubElement(body, 'hr')
-            reg_name = register.get('name', "")
-            addr_format = "0x{:04X}"
-            if region_name in ("pci", "sfr"):
-                addr_format = "0x{:02X}"
-            start = register.get('start')
-            addr_string = ""
-            if start is not None:
-                addr_string = addr_format.format(start)
-            reg_heading = ET.SubElement(body, 'h4')
-            reg_heading_text = "{}: {}".format(addr_string, reg_name)
-            reg_heading.attrib['id'] = "_" + re.sub(r'[^a-z0-9]', "_", reg_heading_text.lower())
-            reg_heading_link = ET.SubElement(reg_heading, 'a')
-            reg_heading_link.attrib['href'] = "#" + reg_heading.attrib['id']
-            reg_heading_link.text = "#"
-            reg_heading_link.tail = "\u00A0" + reg_heading_text
-            end = register.get('end')
-            size = 0
-            if start is not None and end is not None:
-                size = end + 1 - start
-            max_bits = size * 8
-            ET.SubElement(body, 'p').text = "Size: {} byte{}".format(size, "s" if size > 1 else "")
-            markdown_subelement(body, 'div', register.get('notes', ""))
-            if max_bits > 64:
-                continue
-            bit_table = ET.SubElement(body, 'table')
-            bits = register.get('bits')
-            if bits is None:
-                bits = [{
-                    'name': reg_name,
-                    'start': 0,
-                    'end': max_bits - 1,
-                    'permissions': register.get('permissions', ""),
-                }]
-            unused_bits = set(range(max_bits))
-            bit_spans = dict()
-            for bit_range in bits:
-                bit_start = bit_range.get('start')
-                bit_end = bit_range.get('end')
-                if bit_start is None or bit_end is None:
-                    continue
-                unused_bits = unused_bits.difference(set(range(bit_start, bit_end + 1)))
-                bit_len = bit_end + 1 - bit_start
-                start_bit_block = bit_start // 16
-                end_bit_block = bit_end // 16
-                if end_bit_block > start_bit_block:
-                    for block in range(start_bit_block, end_bit_block + 1):
-                        if block == end_bit_block:
-                            upper_len = bit_end + 1 - block*16
-                            bit_spans[bit_end] = {
-                                'name': bit_range.get('name', ""),
-                                'permissions': bit_range.get('permissions', ""),
-                                'span': upper_len,
-                            }
-                        elif block == start_bit_block:
-                            lower_len = block*16+16 - bit_start
-                            bit_spans[block*16+16-1] = {
-                                'name': bit_range.get('name', ""),
-                                'permissions': bit_range.get('permissions', ""),
-                                'span': lower_len,
-                            }
-                        else:
-                            bit_spans[block*16+16-1] = {
-                                'name': bit_range.get('name', ""),
-                                'permissions': bit_range.get('permissions', ""),
-                                'span': 16,
-                            }
-                else:
-                    bit_spans[bit_end] = {
-                        'name': bit_range.get('name', ""),
-                        'permissions': bit_range.get('permissions', ""),
-                        'span': bit_len,
-                    }
-            if max_bits > 32:
-                bit_table_upper_header = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_upper_header, 'th').text = "Bit"
-                for bit in range(48, 64)[::-1]:
-                    ET.SubElement(bit_table_upper_header, 'th').text = str(bit)
-                bit_table_upper_perms = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_upper_perms, 'th').text = "Type"
-                for bit in range(48, 64)[::-1]:
-                    if bit in bit_spans.keys():
-                        span = bit_spans[bit]
-                        bit_element = ET.SubElement(bit_table_upper_perms, 'td', {'class': 'bitfield'})
-                        bit_element.text = span['permissions']
-                        colspan = span['span']
-                        if colspan > 1:
-                            bit_element.set('colspan', str(colspan))
-                    elif bit in unused_bits:
-                        ET.SubElement(bit_table_upper_perms, 'td', {'class': 'bitfield bitfield-unused'})
-                bit_table_upper_data = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_upper_data, 'th').text = "Name"
-                for bit in range(48, 64)[::-1]:
-                    if bit in bit_spans.keys():
-                        span = bit_spans[bit]
-                        bit_element = ET.SubElement(bit_table_upper_data, 'td', {'class': 'bitfield'})
-                        bit_element.text = span['name']
-                        colspan = span['span']
-                        if colspan > 1:
-                            bit_element.set('colspan', str(colspan))
-                    elif bit in unused_bits:
-                        ET.SubElement(bit_table_upper_data, 'td', {'class': 'bitfield bitfield-unused'})
-                bit_table_lower_header = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_lower_header, 'th').text = "Bit"
-                for bit in range(32, 48)[::-1]:
-                    ET.SubElement(bit_table_lower_header, 'th').text = str(bit)
-                bit_table_lower_perms = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_lower_perms, 'th').text = "Type"
-                for bit in range(32, 48)[::-1]:
-                    if bit in bit_spans.keys():
-                        span = bit_spans[bit]
-                        bit_element = ET.SubElement(bit_table_lower_perms, 'td', {'class': 'bitfield'})
-                        bit_element.text = span['permissions']
-                        colspan = span['span']
-                        if colspan > 1:
-                            bit_element.set('colspan', str(colspan))
-                    elif bit in unused_bits:
-                        ET.SubElement(bit_table_lower_perms, 'td', {'class': 'bitfield bitfield-unused'})
-                bit_table_lower_data = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_lower_data, 'th').text = "Name"
-                for bit in range(32, 48)[::-1]:
-                    if bit in bit_spans.keys():
-                        span = bit_spans[bit]
-                        bit_element = ET.SubElement(bit_table_lower_data, 'td', {'class': 'bitfield'})
-                        bit_element.text = span['name']
-                        colspan = span['span']
-                        if colspan > 1:
-                            bit_element.set('colspan', str(colspan))
-                    elif bit in unused_bits:
-                        ET.SubElement(bit_table_lower_data, 'td', {'class': 'bitfield bitfield-unused'})
-            if max_bits > 16:
-                bit_table_upper_header = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_upper_header, 'th').text = "Bit"
-                for bit in range(16, 32)[::-1]:
-                    ET.SubElement(bit_table_upper_header, 'th').text = str(bit)
-                bit_table_upper_perms = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_upper_perms, 'th').text = "Type"
-                for bit in range(16, 32)[::-1]:
-                    if bit in bit_spans.keys():
-                        span = bit_spans[bit]
-                        bit_element = ET.SubElement(bit_table_upper_perms, 'td', {'class': 'bitfield'})
-                        bit_element.text = span['permissions']
-                        colspan = span['span']
-                        if colspan > 1:
-                            bit_element.set('colspan', str(colspan))
-                    elif bit in unused_bits:
-                        ET.SubElement(bit_table_upper_perms, 'td', {'class': 'bitfield bitfield-unused'})
-                bit_table_upper_data = ET.SubElement(bit_table, 'tr')
-                ET.SubElement(bit_table_upper_data, 'th').text = "Name"
-                for bit in range(16, 32)[::-1]:
-                    if bit in bit_spans.keys():
-                        span = bit_spans[bit]
-                        bit_element = ET.SubElement(bit_table_upper_data, 'td', {'class': 'bitfield'})
-                        bit_element.text = span['name']
-                        colspan = span['span']
-                        if colspan > 1:
-                            bit_element.set('colspan', str(colspan))
-                    elif bit in unused_bits:
-                        ET.SubElement(bit_table_upper_data, 'td', {'class': 'bitfield bitfield-unused'})
-            bit_table_lower_header = ET.SubElement(bit_table, 'tr')
-            ET.SubElement(bit_table_lower_header, 'th').text = "Bit"
-            for bit in range(0, min(16, max_bits))[::-1]:
-                ET.SubElement(bit_table_lower_header, 'th').text = str(bit)
-            bit_table_lower_perms = ET.SubElement(bit_table, 'tr')
-            ET.SubElement(bit_table_lower_perms, 'th').text = "Type"
-            for bit in range(0, min(16, max_bits))[::-1]:
-                if bit in bit_spans.keys():
-                    span = bit_spans[bit]
-                    bit_element = ET.SubElement(bit_table_lower_perms, 'td', {'class': 'bitfield'})
-                    bit_element.text = span['permissions']
-                    colspan = span['span']
-                    if colspan > 1:
-                        bit_element.set('colspan', str(colspan))
-                elif bit in unused_bits:
-                    ET.SubElement(bit_table_lower_perms, 'td', {'class': 'bitfield bitfield-unused'})
-            bit_table_lower_data = ET.SubElement(bit_table, 'tr')
-            ET.SubElement(bit_table_lower_data, 'th').text = "Name"
-            for bit in range(0, min(16, max_bits))[::-1]:
-                if bit in bit_spans.keys():
+class MarkdownRenderer:
+    '''Renders Markdown to XHTML, remembering the results by the hash of the Markdown'''
+
+    def __init__(self, cache_path: pathlib.Path | None = None) -> None:
+        # Reusing the same converter is much faster than creating a new one
+        # for every note.
+        self.md = markdown.Markdown(output_format='xhtml')
+        self.cache_path = cache_path
+        self.cache: dict[str, str] = dict()
+        self.new: dict[str, str] = dict()
+        if cache_path is not None:
+            try:
+                cache = marshal.loads(cache_path.read_bytes())
+                if type(cache) is dict:
+                    self.cache = cache
+            except Exception:
+                pass
+
+    @staticmethod
+    def default_cache_path() -> pathlib.Path:
+        # Different versions of the library may render the same Markdown
+        # differently, and different versions of Python may not be able to
+        # read each other's marshal data, so each pair gets its own cache.
+        return regdata.cache_dir() / "markdown-{}-{}.marshal".format(markdown.__version__, regdata.marshal_tag().decode('ascii'))
+
+    def render(self, md: str) -> str:
+        key: str = hashlib.blake2b(md.encode('utf-8'), digest_size=16).hexdigest()
+        xhtml: str | None = self.cache.get(key)
+        if xhtml is None:
+            xhtml = self.md.reset().convert(md)
+            self.cache[key] = self.new[key] = xhtml
+
+        return xhtml
+
+    def update(self, entries: dict[str, str]) -> None:
+        self.cache.update(entries)
+        self.new.update(entries)
+
+    def save(self) -> None:
+        if self.cache_path is None or not self.new:
+            return
+
+        # The cache is just an optimization, so don't fail if it can't be written.
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path: pathlib.Path = self.cache_path.with_suffix(".tmp{}".format(os.getpid()))
+            tmp_path.write_bytes(marshal.dumps(self.cache))
+            os.replace(tmp_path, self.cache_path)
+        except (OSError, ValueError):
+            pass
+
+def markdown_element(tag, md, renderer: MarkdownRenderer):
+    xhtml = renderer.render(md)
+    return ET.fromstring("<{}>{}</{}>".format(tag, xhtml, tag))
+
+def markdown_subelement(parent, tag, md, renderer: MarkdownRenderer) -> None:
+    parent.append(markdown_element(tag, md, renderer))
+
+@functools.cache
+def git_revision() -> str:
+    try:
+        return "r{}.g{}".format(
+            subprocess.check_output(["git", "rev-list", "--count", "HEAD"]).rstrip().decode('utf-8'),
+            subprocess.check_output(["git", "rev-parse", "--short", "HEAD"]).rstrip().decode('utf-8'),
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return "UNKNOWN"
+
+def register_heading(region_name: str, register: dict) -> tuple[str, str]:
+    '''Returns the text of a register's heading, and the ID of its anchor'''
+
+    addr_format = "0x{:04X}"
+    if region_name in ("pci", "sfr"):
+        addr_format = "0x{:02X}"
+    start = register.get('start')
+    addr_string = ""
+    if start is not None:
+        addr_string = addr_format.format(start)
+    text = "{}: {}".format(addr_string, register.get('name', ""))
+
+    return (text, "_" + re.sub(r'[^a-z0-9]', "_", text.lower()))
+
+class AnchorIndex:
+    '''The anchors of the register headings in a page, by register name'''
+
+    def __init__(self, page: str = "") -> None:
+        self.page = page
+        # When several regions have registers with the same name, an
+        # unqualified name refers to the first one.
+        self.by_name: dict[str, str] = dict()
+        self.by_region: dict[tuple[str, str], str] = dict()
+
+    def add(self, region_name: str, reg_name: str, anchor: str) -> None:
+        self.by_name.setdefault(reg_name, anchor)
+        self.by_region.setdefault((region_name, reg_name), anchor)
+
+    def lookup(self, reg_name: str, region_name: str | None = None) -> str | None:
+        if region_name is None:
+            return self.by_name.get(reg_name)
+
+        return self.by_region.get((region_name, reg_name))
+
+    @classmethod
+    def from_doc(cls, doc: dict, page: str) -> "AnchorIndex":
+        index = cls(page)
+        for region_name, region_registers in doc.get('registers', dict()).items():
+            for register in region_registers:
+                index.add(region_name, register.get('name', ""), register_heading(region_name, register)[1])
+
+        return index
+
+def page_name(filename: str) -> str:
+    return pathlib.Path(filename).stem + ".xhtml"
+
+def chip_anchors(filenames: list[str]) -> dict[str, AnchorIndex]:
+    '''Indexes the pages that will be generated from these files, by the names of their chips'''
+
+    chips: dict[str, AnchorIndex] = dict()
+    for filename in filenames:
+        try:
+            doc = regdata.load(filename)
+        except (OSError, regdata.SchemaError):
+            continue
+
+        index = AnchorIndex.from_doc(doc, page_name(filename))
+        for chip in doc.get('meta', dict()).get('chip', "").split("/"):
+            if chip:
+                chips[chip.upper()] = index
+
+    return chips
+
+def resolve_link(text: str, anchors: AnchorIndex, chips: dict[str, AnchorIndex]) -> str | None:
+    '''Returns the link target of a register name in a note, which may be qualified like "ASM1142:xdata:NAME.FIELD", or None if it isn't a register'''
+
+    *qualifiers, reg_name = text.split(".")[0].split(":")
+    index = anchors
+    region_name = None
+    for qualifier in qualifiers:
+        if qualifier.lower() in REGION_NAMES:
+            region_name = qualifier.lower()
+        elif qualifier.upper() in chips:
+            index = chips[qualifier.upper()]
+        else:
+            return None
+
+    anchor = index.lookup(reg_name, region_name)
+    if anchor is None:
+        return None
+
+    if index is anchors:
+        return "#" + anchor
+
+    return index.page + "#" + anchor
+
+# Bits are laid out in rows of this many, from the most-significant row down.
+BIT_TABLE_ROW_BITS: int = 16
+
+# The rows of bit fields under each row of bit numbers, with the key of the
+# field they show.
+BIT_TABLE_ROWS: tuple[tuple[str, str], ...] = (
+    ("Type", 'permissions'),
+    ("Name", 'name'),
+)
+
+# Larger registers are mostly opaque structures, so they don't get a bit table.
+MAX_BIT_TABLE_BITS: int = 64
+
+XHTML_DOCTYPE = "<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">"
+
+def gen_bit_table(register: dict, max_bits: int):
+    bits = register.get('bits')
+    if bits is None:
+        bits = [{
+            'name': register.get('name', ""),
+            'start': 0,
+            'end': max_bits - 1,
+            'permissions': register.get('permissions', ""),
+        }]
+
+    # Split each field at the row boundaries, and key each piece by its
+    # most-significant bit, which is where its cell starts.
+    unused_bits = set(range(max_bits))
+    bit_spans = dict()
+    for bit_range in bits:
+        bit_start = bit_range.get('start')
+        bit_end = bit_range.get('end')
+        if bit_start is None or bit_end is None:
+            continue
+        unused_bits.difference_update(range(bit_start, bit_end + 1))
+        for row in range(bit_start // BIT_TABLE_ROW_BITS, bit_end // BIT_TABLE_ROW_BITS + 1):
+            piece_start = max(bit_start, row * BIT_TABLE_ROW_BITS)
+            piece_end = min(bit_end, row * BIT_TABLE_ROW_BITS + BIT_TABLE_ROW_BITS - 1)
+            bit_spans[piece_end] = {
+                'name': bit_range.get('name', ""),
+                'permissions': bit_range.get('permissions', ""),
+                'span': piece_end + 1 - piece_start,
+            }
+
+    bit_table = ET.Element('table')
+    for row_start in range(0, max(max_bits, 1), BIT_TABLE_ROW_BITS)[::-1]:
+        row_bits = range(row_start, min(row_start + BIT_TABLE_ROW_BITS, max_bits))[::-1]
+        bit_table_header = ET.SubElement(bit_table, 'tr')
+        ET.SubElement(bit_table_header, 'th').text = "Bit"
+        for bit in row_bits:
+            ET.SubElement(bit_table_header, 'th').text = str(bit)
+        for label, key in BIT_TABLE_ROWS:
+            bit_table_row = ET.SubElement(bit_table, 'tr')
+            ET.SubElement(bit_table_row, 'th').text = label
+            for bit in row_bits:
+                if bit in bit_spans:
                     span = bit_spans[bit]
-                    bit_element = ET.SubElement(bit_table_lower_data, 'td', {'class': 'bitfield'})
-                    bit_element.text = span['name']
+                    bit_element = ET.SubElement(bit_table_row, 'td', {'class': 'bitfield'})
+                    bit_element.text = span[key]
                     colspan = span['span']
                     if colspan > 1:
                         bit_element.set('colspan', str(colspan))
                 elif bit in unused_bits:
-                    ET.SubElement(bit_table_lower_data, 'td', {'class': 'bitfield bitfield-unused'})
-
-            actual_bits = register.get('bits', list())
-            if actual_bits:
-                ET.SubElement(body, 'p')
-                bit_info_table = ET.SubElement(body, 'table')
-
-                bit_info_table_header = ET.SubElement(bit_info_table, 'tr')
-                ET.SubElement(bit_info_table_header, 'th').text = "Bits"
-                ET.SubElement(bit_info_table_header, 'th').text = "Name"
-                ET.SubElement(bit_info_table_header, 'th').text = "Description"
-
-                for bit_range in actual_bits[::-1]:
-                    start_bit = bit_range.get('start')
-                    end_bit = bit_range.get('end')
-                    if start_bit is None or end_bit is None:
-                        continue
-
-                    bits_str: str = "[{}]".format(start_bit)
-                    if end_bit != start_bit:
-                        bits_str = "[{}:{}]".format(end_bit, start_bit)
-
-                    bit_info_table_row = ET.SubElement(bit_info_table, 'tr')
-                    ET.SubElement(bit_info_table_row, 'td').text = bits_str
-                    ET.SubElement(bit_info_table_row, 'td').text = bit_range.get('name', "")
-                    markdown_subelement(bit_info_table_row, 'td', bit_range.get('notes', ""))
-
-    for code_element in body.findall(".//code"):
-        reg_name = code_element.text.split(".")[0]
-        for h4 in body.xpath(".//h4[contains(text(), ': {}')]".format(reg_name)):
-            # Do a precise match to make sure this is the right heading.
-            if not h4[0].tail.endswith(": {}".format(reg_name)):
+                    ET.SubElement(bit_table_row, 'td', {'class': 'bitfield bitfield-unused'})
+
+    return bit_table
+
+def gen_register(region_name: str, register: dict, renderer: MarkdownRenderer):
+    '''Yields the elements documenting a register, in order'''
+
+    yield ET.Element('hr')
+
+    reg_heading = ET.Element('h4')
+    reg_heading_text, reg_heading.attrib['id'] = register_heading(region_name, register)
+    reg_heading_link = ET.SubElement(reg_heading, 'a')
+    reg_heading_link.attrib['href'] = "#" + reg_heading.attrib['id']
+    reg_heading_link.text = "#"
+    reg_heading_link.tail = "\u00A0" + reg_heading_text
+    yield reg_heading
+
+    start = register.get('start')
+    end = register.get('end')
+    size = 0
+    if start is not None and end is not None:
+        size = end + 1 - start
+    max_bits = size * 8
+    size_element = ET.Element('p')
+    size_element.text = "Size: {} byte{}".format(size, "s" if size > 1 else "")
+    yield size_element
+    yield markdown_element('div', register.get('notes', ""), renderer)
+    if max_bits > MAX_BIT_TABLE_BITS:
+        return
+
+    yield gen_bit_table(register, max_bits)
+
+    actual_bits = register.get('bits', list())
+    if actual_bits:
+        yield ET.Element('p')
+        bit_info_table = ET.Element('table')
+
+        bit_info_table_header = ET.SubElement(bit_info_table, 'tr')
+        ET.SubElement(bit_info_table_header, 'th').text = "Bits"
+        ET.SubElement(bit_info_table_header, 'th').text = "Name"
+        ET.SubElement(bit_info_table_header, 'th').text = "Description"
+
+        for bit_range in actual_bits[::-1]:
+            start_bit = bit_range.get('start')
+            end_bit = bit_range.get('end')
+            if start_bit is None or end_bit is None:
                 continue
 
-            # Create link element
-            link = ET.Element('a')
-            link.attrib['href'] = "#" + h4.attrib['id']
-            link.text = "\u21A9"
+            bits_str: str = "[{}]".format(start_bit)
+            if end_bit != start_bit:
+                bits_str = "[{}:{}]".format(end_bit, start_bit)
+
+            bit_info_table_row = ET.SubElement(bit_info_table, 'tr')
+            ET.SubElement(bit_info_table_row, 'td').text = bits_str
+            ET.SubElement(bit_info_table_row, 'td').text = bit_range.get('name', "")
+            markdown_subelement(bit_info_table_row, 'td', bit_range.get('notes', ""), renderer)
+
+        yield bit_info_table
+
+def link_registers(element, anchors: AnchorIndex, chips: dict[str, AnchorIndex]) -> None:
+    '''Links each register name in the notes in an element to its heading'''
 
-            # Move the tail to the new element.
-            link.tail = code_element.tail
-            code_element.tail = ""
+    for code_element in list(element.iter('code')):
+        if code_element.text is None:
+            continue
 
-            # Insert the link element.
-            parent = code_element.getparent()
-            parent.insert(parent.index(code_element) + 1, link)
+        href = resolve_link(code_element.text, anchors, chips)
+        if href is None:
+            continue
 
-            break
+        # Create link element
+        link = ET.Element('a')
+        link.attrib['href'] = href
+        link.text = "\u21A9"
 
-    ET.SubElement(body, 'hr')
+        # Move the tail to the new element.
+        link.tail = code_element.tail
+        code_element.tail = ""
+
+        # Insert the link element.
+        parent = code_element.getparent()
+        parent.insert(parent.index(code_element) + 1, link)
+
+def gen_xhtml(filename, doc, output, renderer: MarkdownRenderer | None = None, git_rev: str | None = None, chips: dict[str, AnchorIndex] | None = None) -> None:
+    '''Writes the documentation to a file as it's generated, so only one register is held in memory at a time'''
+
+    if renderer is None:
+        renderer = MarkdownRenderer()
+    if git_rev is None:
+        git_rev = git_revision()
+
+    # Notes can link to registers that come after them, so every heading has
+    # to be indexed before anything is written.
+    anchors = AnchorIndex.from_doc(doc, "")
+    if chips is None:
+        chips = dict()
+
+    meta = doc.get('meta', dict())
+    chip = meta.get('chip', "UNKNOWN")
+    title_text = "{} Memory Map and Register Manual".format(chip)
+
+    with ET.xmlfile(output, encoding='utf-8') as xf:
+        def emit(element) -> None:
+            link_registers(element, anchors, chips)
+            xf.write(element)
+
+        def emit_text(tag: str, text: str) -> None:
+            element = ET.Element(tag)
+            element.text = text
+            xf.write(element)
+
+        xf.write_declaration()
+        xf.write_doctype(XHTML_DOCTYPE)
+        # lxml's incremental writer can't write attributes in the "xml"
+        # namespace with their usual prefix, so write the name as-is.
+        with xf.element('html', {
+            ET.QName("http://www.w3.org/2001/XMLSchema-instance", "schemaLocation"): "http://www.w3.org/MarkUp/SCHEMA/xhtml11.xsd",
+            "xml:lang": "en",
+        }, nsmap={None: "http://www.w3.org/1999/xhtml", "xsi": "http://www.w3.org/2001/XMLSchema-instance"}):
+            head = ET.Element('head')
+            ET.SubElement(head, 'title').text = title_text
+            ET.SubElement(head, 'style').text = gen_css()
+            xf.write(head)
+
+            with xf.element('body'):
+                emit_text('h1', title_text)
+
+                emit_text('h2', "XDATA Memory Map")
+                xdata_memory_map = ET.Element('table')
+                xdata_memory_map_header = ET.SubElement(xdata_memory_map, 'tr')
+                for header in ["Start", "End", "Size", "Name", "Permissions", "Notes"]:
+                    ET.SubElement(xdata_memory_map_header, 'th').text = header
+
+                xdata = doc.get('xdata', list())
+                for region in xdata:
+                    tr = ET.SubElement(xdata_memory_map, 'tr')
+                    start = region.get('start')
+                    start_text = ""
+                    if start is not None:
+                        start_text = "0x{:04X}".format(start)
+                    ET.SubElement(tr, 'td').text = start_text
+                    end = region.get('end')
+                    end_text = ""
+                    if end is not None:
+                        end_text = "0x{:04X}".format(end)
+                    ET.SubElement(tr, 'td').text = end_text
+                    size_text = ""
+                    if start is not None and end is not None:
+                        size_text = "0x{:04X}".format(end + 1 - start)
+                    ET.SubElement(tr, 'td').text = size_text
+                    ET.SubElement(tr, 'td').text = region.get('name', "")
+                    ET.SubElement(tr, 'td').text = region.get('permissions', "")
+                    markdown_subelement(tr, 'td', region.get('notes', ""), renderer)
+                emit(xdata_memory_map)
+
+                emit_text('h2', "Register Permissions")
+                permissions = ET.Element('table')
+                permissions_header = ET.SubElement(permissions, 'tr')
+                for header in ("Abbreviation", "Description"):
+                    ET.SubElement(permissions_header, 'th').text = header
+
+                for abbr, desc in PERMISSIONS.items():
+                    tr = ET.SubElement(permissions, 'tr')
+                    ET.SubElement(tr, 'td').text = abbr
+                    ET.SubElement(tr, 'td').text = desc
+                xf.write(permissions)
+
+                emit_text('h2', "Register Map")
+                emit_text('p', " ".join([
+                        "NOTE: Except where specified otherwise, all register addresses are byte offsets, and all multi-byte register values are little-endian.",
+                        "In other words, for a 32-bit register at address 0x0000, bit 0 is the least-significant bit of the byte located at address 0x0000, and bit 31 is the most-significant bit of the byte located at address 0x0003.",
+                        "This applies to all memory spaces ({}).".format(", ".join(map(lambda x: x[1], REGION_NAMES.items()))),
+                        ]))
+                register_regions = doc.get('registers', dict())
+                for region_name, region_registers in register_regions.items():
+                    xf.write(ET.Element('hr'))
+                    emit_text('h3', "{} Region Registers".format(REGION_NAMES[region_name]))
+                    for register in region_registers:
+                        for element in gen_register(region_name, register, renderer):
+                            emit(element)
+
+                xf.write(ET.Element('hr'))
+                date_string = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+                footer = ET.Element('p')
+                ET.SubElement(footer, 'i').text = "Generated from {} version {} on {}.".format(filename, git_rev, date_string)
+                xf.write(footer)
+
+def load_doc(filename: str) -> dict | None:
     try:
-        git_rev = "r{}.g{}".format(
-            subprocess.check_output(["git", "rev-list", "--count", "HEAD"]).rstrip().decode('utf-8'),
-            subprocess.check_output(["git", "rev-parse", "--short", "HEAD"]).rstrip().decode('utf-8'),
-        )
-    except subprocess.CalledProcessError:
-        git_rev = "UNKNOWN"
-    date_string = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
-    footer = ET.SubElement(body, 'p')
-    ET.SubElement(footer, 'i').text = "Generated from {} version {} on {}.".format(filename, git_rev, date_string)
-
-    return ET.tostring(
-            html,
-            encoding='utf-8',
-            xml_declaration=True,
-            doctype="<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.1//EN\" \"http://www.w3.org/TR/xhtml11/DTD/xhtml11.dtd\">"
-        )
+        return regdata.load(filename)
+    except regdata.SchemaError as error:
+        print("Error: {}".format(error))
+        print("Error: Document \"{}\" invalid.".format(filename))
+        return None
+
+# Set in each worker process by init_worker().
+worker_renderer: MarkdownRenderer | None = None
+
+def init_worker(cache_path: pathlib.Path | None) -> None:
+    global worker_renderer
+    worker_renderer = MarkdownRenderer(cache_path)
+
+def gen_file(filename: str, output: str, git_rev: str, chips: dict[str, AnchorIndex]) -> tuple[bool, dict[str, str]]:
+    '''Generates the documentation for one file in a worker process, returning whether it succeeded and the newly-rendered Markdown'''
+
+    assert worker_renderer is not None
+    worker_renderer.new = dict()
+
+    doc: dict | None = load_doc(filename)
+    if doc is None:
+        return (False, dict())
+
+    with open(output, 'wb') as f:
+        gen_xhtml(filename, doc, f, worker_renderer, git_rev, chips)
+
+    return (True, worker_renderer.new)
 
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("-o", "--output", type=str, default="regs.xhtml", help="The output file.")
-    parser.add_argument("input", type=str, help="The input YAML register definition file.")
+    parser.add_argument("-O", "--output-dir", type=str, help="Generate the documentation for every input file, naming each output file after its input file (e.g., \"regs-asm2142.xhtml\") in this directory.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="The number of input files to process in parallel when using --output-dir. Default is the number of CPUs.")
+    parser.add_argument("-n", "--no-cache", action="store_true", default=False, help="Don't use or update the cache of rendered Markdown.")
+    parser.add_argument("input", type=str, nargs="+", help="The input YAML register definition file. Multiple files may be given when using --output-dir.")
     args = parser.parse_args()
 
-    doc = yaml.safe_load(open(args.input, 'r'))
-
-    doc_valid = validate(doc)
-    if not doc_valid:
-        print("Error: Document \"{}\" invalid.".format(args.input))
-        return 1
-
-    xhtml = gen_xhtml(args.input, doc)
-    output = open(args.output, 'wb')
-    output.write(xhtml)
-
-    return 0
+    cache_path: pathlib.Path | None = None if args.no_cache else MarkdownRenderer.default_cache_path()
+
+    if args.output_dir is None:
+        if len(args.input) > 1:
+            parser.error("--output-dir is required when there's more than one input file")
+
+        doc = load_doc(args.input[0])
+        if doc is None:
+            return 1
+
+        # Links to other chips' pages assume they're generated from the files
+        # next to this one.
+        siblings = sorted(str(path) for path in pathlib.Path(args.input[0]).parent.glob("regs-*.yaml"))
+        renderer = MarkdownRenderer(cache_path)
+        with open(args.output, 'wb') as output:
+            gen_xhtml(args.input[0], doc, output, renderer, chips=chip_anchors(siblings))
+        renderer.save()
+
+        return 0
+
+    # Every file gets the same git revision, and the Markdown rendered by
+    # each worker is merged into a single cache.
+    output_dir = pathlib.Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = [str(output_dir / page_name(filename)) for filename in args.input]
+    git_rev = git_revision()
+    chips = chip_anchors(args.input)
+    renderer = MarkdownRenderer(cache_path)
+    ok = True
+    with ProcessPoolExecutor(max_workers=min(args.jobs, len(args.input)), initializer=init_worker, initargs=(cache_path,)) as executor:
+        for success, new in executor.map(gen_file, args.input, outputs, [git_rev] * len(args.input), [chips] * len(args.input)):
+            ok = ok and success
+            renderer.update(new)
+    renderer.save()
+
+    return 0 if ok else 1
 
 
 if __name__ == "__main__":
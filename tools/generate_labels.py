@@ -22,7 +22,7 @@
 import argparse
 import sys
 
-import yaml  # type: ignore[import-untyped]
+import regdata
 
 
 ADDR_FORMATS = {
@@ -37,7 +37,7 @@ def main() -> int:
     parser.add_argument("input", type=str, help="The input YAML register definition file.")
     args = parser.parse_args()
 
-    doc = yaml.safe_load(open(args.input, 'r'))
+    doc = regdata.load(args.input)
 
     output = sys.stdout
     if args.output:
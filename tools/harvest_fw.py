@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# harvest_fw.py - A tool to collect the unique firmware images from a
+# collection of files and archives.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import pathlib
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator
+
+import carve_fw
+
+
+# Stop descending into archives nested deeper than this, in case of archive
+# bombs.
+MAX_DEPTH: int = 8
+
+# Enough to detect every supported container format (the tar magic is at
+# offset 257).
+HEAD_SIZE: int = 512
+
+# Zip files inside other archives are read into memory up to this size, and
+# into a temporary file beyond it.
+SPOOL_SIZE: int = 16 * 1024 * 1024
+
+# The errors raised when reading a corrupt or truncated archive.
+ARCHIVE_ERRORS: tuple[type[Exception], ...] = (zipfile.BadZipFile, tarfile.TarError, zlib.error, lzma.LZMAError, OSError, EOFError)
+
+
+class PrefixedStream(io.RawIOBase):
+    '''A stream whose first bytes have already been read, so it can be identified before it's read again'''
+
+    def __init__(self, head: bytes, stream: BinaryIO) -> None:
+        self.head = head
+        self.stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.head:
+            count: int = min(len(buffer), len(self.head))
+            buffer[:count] = self.head[:count]
+            self.head = self.head[count:]
+            return count
+
+        data: bytes = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+class LimitedStream(io.RawIOBase):
+    '''The first "length" bytes of a stream'''
+
+    def __init__(self, stream: BinaryIO, length: int) -> None:
+        self.stream = stream
+        self.remaining = length
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data: bytes = self.stream.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+def identify(head: bytes) -> str | None:
+    if head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return "zip"
+    if head.startswith(b"\x1f\x8b"):
+        return "gzip"
+    if head.startswith(b"BZh"):
+        return "bz2"
+    if head.startswith(b"\xfd7zXZ\x00"):
+        return "xz"
+    if head[257:262] == b"ustar":
+        return "tar"
+
+    return None
+
+def report_error(source: list[str], error: Exception) -> None:
+    print("Warning: Skipping {}: {}: {}".format(" > ".join(source), type(error).__name__, error), file=sys.stderr)
+
+def harvest_stream(stream: BinaryIO, source: list[str], depth: int = 0) -> Iterator[tuple[list[str], carve_fw.Image, bytes]]:
+    '''Finds every image in a stream, descending into any archives (and archives in archives) in it'''
+
+    head: bytes = stream.read(HEAD_SIZE)
+    stream = io.BufferedReader(PrefixedStream(head, stream))
+    kind: str | None = identify(head) if depth < MAX_DEPTH else None
+
+    if kind == "zip":
+        # Zip files can't be read sequentially, so the archive has to be
+        # copied somewhere seekable first (unless it's a file on disk, see
+        # harvest_file()).
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+            shutil.copyfileobj(stream, spool)
+            spool.seek(0)
+            with zipfile.ZipFile(spool) as archive:
+                yield from harvest_zip(archive, source, depth)
+    elif kind == "tar":
+        with tarfile.open(fileobj=stream, mode="r|") as archive:
+            for member in archive:
+                member_stream: BinaryIO | None = archive.extractfile(member) if member.isfile() else None
+                if member_stream is None:
+                    continue
+                # A corrupt member shouldn't stop the rest of the archive from
+                # being searched.
+                try:
+                    yield from harvest_stream(member_stream, source + [member.name], depth + 1)
+                except ARCHIVE_ERRORS as error:
+                    report_error(source + [member.name], error)
+    elif kind in ("gzip", "bz2", "xz"):
+        with {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}[kind](stream) as decompressed:
+            # Keep the images found before the end of a truncated stream.
+            try:
+                yield from harvest_stream(decompressed, source + ["({})".format(kind)], depth + 1)
+            except ARCHIVE_ERRORS as error:
+                report_error(source + ["({})".format(kind)], error)
+    else:
+        for image, data in carve_fw.carve_stream(stream):
+            yield (source, image, data)
+
+def harvest_zip(archive: zipfile.ZipFile, source: list[str], depth: int) -> Iterator[tuple[list[str], carve_fw.Image, bytes]]:
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        try:
+            with archive.open(info) as member_stream:
+                yield from harvest_stream(member_stream, source + [info.filename], depth + 1)
+        except ARCHIVE_ERRORS as error:
+            report_error(source + [info.filename], error)
+
+def harvest_file(path: str) -> Iterator[tuple[list[str], carve_fw.Image, bytes]]:
+    seen: set[tuple[tuple[str, ...], int]] = set()
+    for source, image, data in harvest_file_images(path):
+        # Don't report the same image twice, however it was found.
+        key: tuple[tuple[str, ...], int] = (tuple(source), image.offset)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield (source, image, data)
+
+def harvest_file_images(path: str) -> Iterator[tuple[list[str], carve_fw.Image, bytes]]:
+    with open(path, 'rb') as f:
+        if zipfile.is_zipfile(f):
+            f.seek(0)
+            with zipfile.ZipFile(f) as archive:
+                # Self-extracting archives are executables with a zip file
+                # appended, so search the executable itself, too--but only up
+                # to the start of the zip file, since its members have already
+                # been searched.
+                members: list[zipfile.ZipInfo] = archive.infolist()
+                stub_size: int = min((info.header_offset for info in members), default=0)
+                yield from harvest_zip(archive, [path], 0)
+
+            if stub_size > 0:
+                f.seek(0)
+                yield from harvest_stream(io.BufferedReader(LimitedStream(f, stub_size)), [path])
+            return
+
+        f.seek(0)
+        yield from harvest_stream(f, [path])
+
+def store_image(output_dir: pathlib.Path, data: bytes) -> tuple[str, bool]:
+    '''Stores an image by its SHA-256 hash, returning the hash and whether it was new'''
+
+    sha256: str = hashlib.sha256(data).hexdigest()
+    path: pathlib.Path = output_dir / "images" / sha256[:2] / "{}.bin".format(sha256)
+    if path.exists():
+        return (sha256, False)
+
+    # Several workers may find the same image at once, so write it to a
+    # temporary file and link it into place, which fails if another worker
+    # got there first. That way exactly one worker reports the image as new,
+    # and the image is never seen half-written.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path: pathlib.Path = path.with_suffix(".tmp{}".format(os.getpid()))
+    tmp_path.write_bytes(data)
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        return (sha256, False)
+    finally:
+        tmp_path.unlink()
+
+    return (sha256, True)
+
+def harvest_input(path: str, output_dir: str) -> tuple[list[dict], str | None]:
+    # Runs in a worker process, so report failures instead of raising them.
+    entries: list[dict] = []
+    try:
+        for source, image, data in harvest_file(path):
+            sha256, new = store_image(pathlib.Path(output_dir), data)
+            entries.append({
+                'sha256': sha256,
+                'new': new,
+                'kind': image.kind,
+                'chip': image.chip,
+                'version': image.version,
+                'length': image.length,
+                'source': source,
+                'offset': image.offset,
+            })
+    except Exception as error:
+        return (entries, "{}: {}".format(type(error).__name__, error))
+
+    return (entries, None)
+
+def find_inputs(paths: list[str]) -> list[str]:
+    inputs: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                inputs.extend(os.path.join(root, f) for f in sorted(files))
+        else:
+            inputs.append(path)
+
+    return inputs
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output-dir", type=str, default="harvested", help="The directory to store the images and manifest in. Default is \"harvested\".")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="The number of input files to search in parallel. Default is the number of CPUs.")
+    parser.add_argument("input", type=str, nargs="+", help="A file or archive to search, or a directory of them.")
+    args: argparse.Namespace = parser.parse_args()
+
+    inputs: list[str] = find_inputs(args.input)
+    output_dir: pathlib.Path = pathlib.Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    found: int = 0
+    new: int = 0
+    errors: int = 0
+    start: int = time.perf_counter_ns()
+    with open(output_dir / "manifest.jsonl", 'a') as manifest, ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for path, (entries, error) in zip(inputs, executor.map(harvest_input, inputs, [args.output_dir] * len(inputs))):
+            for entry in entries:
+                manifest.write(json.dumps(entry) + "\n")
+                found += 1
+                if entry['new']:
+                    new += 1
+                    print("{} {:<10} {:<16} {} ({})".format(entry['sha256'], entry['kind'], entry['chip'], entry['version'], " > ".join(entry['source'])))
+            if error is not None:
+                print("Error: {}: {}".format(path, error), file=sys.stderr)
+                errors += 1
+    stop: int = time.perf_counter_ns()
+
+    print("Searched {} files in {:.06f} seconds: found {} images, {} of them new, {} files failed".format(
+        len(inputs), (stop - start) / 1e9, found, new, errors), file=sys.stderr)
+
+    return 0 if errors == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
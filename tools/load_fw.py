@@ -20,33 +20,212 @@
 
 
 import argparse
+import contextlib
+import os
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple, TextIO
 
-from asm_tool import AsmDev
+from asm_tool import AccessStats, AccessTrace, AsmDev
 
 
-def main() -> None:
+class LoadResult(NamedTuple):
+    dbsf: str
+    chip: str
+    size: int
+    seconds: float
+    error: str | None
+    stats: AccessStats | None
+
+def read_firmware(firmware: str) -> bytes:
+    binary = open(firmware,'rb').read()
+    if len(binary) % 2:
+        binary += b'\0'
+
+    return binary
+
+def load(dev: AsmDev, firmware: str, differential: bool, verify: str) -> None:
+    binary = read_firmware(firmware)
+
+    print("Loading \"{}\"...".format(firmware))
+    start = time.perf_counter_ns()
+    dev.hw_code_load_exec(binary, differential=differential, verify=verify)
+    stop = time.perf_counter_ns()
+    print("Loaded {} bytes in {:.06f} seconds ({} bytes/second)".format(len(binary), (stop-start)/1e9, int(len(binary)*1000000000/(stop-start))))
+
+def print_stats(stats: AccessStats, prefix: str = "") -> None:
+    for line in stats.report().splitlines():
+        print("{}{}".format(prefix, line))
+
+class PrefixedOutput:
+    '''Prefixes every line written to a stream, so the output of devices loaded in parallel can be told apart'''
+
+    def __init__(self, stream: TextIO, prefix: str) -> None:
+        self.stream = stream
+        self.prefix = prefix
+        self._partial = ""
+
+    def write(self, text: str) -> int:
+        *lines, self._partial = (self._partial + text).split("\n")
+        if lines:
+            # Write whole lines at once, so lines from different workers
+            # don't get mixed together.
+            self.stream.write("".join("{}{}\n".format(self.prefix, line) for line in lines))
+            self.stream.flush()
+
+        return len(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+def load_device(dbsf: str, firmware: str, differential: bool, verify: str, stats: bool, verbose: bool) -> LoadResult:
+    # Runs in a worker process, so report failures instead of raising them.
+    chip = "UNKNOWN"
+    dev = None
+    with contextlib.redirect_stdout(PrefixedOutput(sys.stdout, "[{}] ".format(dbsf))):
+        try:
+            dev = AsmDev(dbsf, verbose=verbose)
+            chip = dev.name
+            if stats:
+                dev.stats = AccessStats()
+            dev.pci.driver_unbind()
+
+            binary = read_firmware(firmware)
+            print("{}: Loading {} bytes...".format(chip, len(binary)))
+            start = time.perf_counter_ns()
+            dev.hw_code_load_exec(binary, differential=differential, verify=verify)
+            stop = time.perf_counter_ns()
+
+            return LoadResult(dbsf, chip, len(binary), (stop-start)/1e9, None, dev.stats)
+        except Exception as error:
+            return LoadResult(dbsf, chip, 0, 0, "{}: {}".format(type(error).__name__, error), dev.stats if dev is not None else None)
+
+def load_all(dbsfs: list[str], firmware: str, differential: bool, verify: str, jobs: int, stats: bool, verbose: bool) -> bool:
+    print("Loading \"{}\" into {} devices...".format(firmware, len(dbsfs)), flush=True)
+    results: list[LoadResult] = []
+    start = time.perf_counter_ns()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(load_device, dbsf, firmware, differential, verify, stats, verbose): dbsf for dbsf in dbsfs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                # The worker died (e.g., it was killed), so this is the only
+                # way to find out what happened to the device.
+                result = LoadResult(futures[future], "UNKNOWN", 0, 0, "{}: {}".format(type(error).__name__, error), None)
+            results.append(result)
+            if result.error is None:
+                print("[{}] {}: Loaded {} bytes in {:.06f} seconds ({} bytes/second)".format(
+                    result.dbsf, result.chip, result.size, result.seconds, int(result.size/result.seconds)))
+            else:
+                print("[{}] {}: Error: {}".format(result.dbsf, result.chip, result.error))
+            if result.stats is not None:
+                print_stats(result.stats, "[{}]   ".format(result.dbsf))
+            sys.stdout.flush()
+    stop = time.perf_counter_ns()
+
+    loaded = [r for r in results if r.error is None]
+    total_bytes = sum(r.size for r in loaded)
+    print("Loaded {} of {} devices ({} bytes) in {:.06f} seconds ({} bytes/second aggregate)".format(
+        len(loaded), len(results), total_bytes, (stop-start)/1e9, int(total_bytes*1000000000/(stop-start))))
+
+    return len(loaded) == len(results)
+
+def wait_for_change(firmware: str, last: tuple[int, int]) -> tuple[int, int]:
+    while True:
+        time.sleep(0.25)
+        try:
+            stat = os.stat(firmware)
+        except FileNotFoundError:
+            # The file is probably being replaced by the build.
+            continue
+        if (stat.st_mtime_ns, stat.st_size) != last:
+            return (stat.st_mtime_ns, stat.st_size)
+
+def main() -> int:
     parser = argparse.ArgumentParser()
-    parser.add_argument("dbsf", type=str, help="The \"<domain>:<bus>:<slot>.<func>\" for the ASMedia USB 3 host controller.")
+    parser.add_argument("-a", "--all", action="store_true", default=False, help="Load the firmware into every supported host controller in the system.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="The maximum number of devices to load in parallel. Default is the number of CPUs.")
+    parser.add_argument("-D", "--differential", action="store_true", default=False, help="Only write the parts of the image that changed since the last load.")
+    parser.add_argument("-w", "--watch", action="store_true", default=False, help="Keep running, and reload the firmware (differentially) whenever the file changes.")
+    parser.add_argument("-V", "--verify", type=str, choices=AsmDev.VERIFY_MODES, default="full", help="How much of the image to read back and verify, on chips that support it. Default is \"full\".")
+    parser.add_argument("-s", "--stats", action="store_true", default=False, help="Print statistics about the hardware accesses made during each load.")
+    parser.add_argument("-t", "--trace", type=str, help="Record every hardware access to this file, for use with asm_trace.py. Only supported with a single device.")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Print more information about the load.")
+    parser.add_argument("dbsf", type=str, nargs="*", help="The \"<domain>:<bus>:<slot>.<func>\" for the ASMedia USB 3 host controller. May be specified multiple times, and may be a glob pattern.")
     parser.add_argument("firmware", type=str, help="The raw firmware binary to load.")
     args = parser.parse_args()
 
-    dev = AsmDev(args.dbsf)
+    dbsfs: list[str] = []
+    if args.all:
+        dbsfs = AsmDev.discover()
+    for dbsf in args.dbsf:
+        if any(c in dbsf for c in "*?["):
+            dbsfs.extend(AsmDev.discover(dbsf))
+        else:
+            dbsfs.append(dbsf)
+    dbsfs = list(dict.fromkeys(dbsfs))
+
+    if not dbsfs:
+        print("Error: No devices found.", file=sys.stderr)
+        return 1
+
+    if (len(dbsfs) > 1 or args.all) and args.trace:
+        print("Error: Tracing is only supported when loading a single device.", file=sys.stderr)
+        return 1
+
+    if len(dbsfs) > 1 or args.all:
+        differential = args.differential or args.watch
+        ok = load_all(dbsfs, args.firmware, differential, args.verify, args.jobs, args.stats, args.verbose)
+        if args.watch:
+            print("Watching \"{}\" for changes, press Ctrl-C to exit...".format(args.firmware))
+            stat = os.stat(args.firmware)
+            last = (stat.st_mtime_ns, stat.st_size)
+            try:
+                while True:
+                    last = wait_for_change(args.firmware, last)
+                    ok = load_all(dbsfs, args.firmware, True, args.verify, args.jobs, args.stats, args.verbose)
+            except KeyboardInterrupt:
+                pass
+        return 0 if ok else 1
+
+    dev = AsmDev(dbsfs[0], verbose=args.verbose)
     print("Chip: {}".format(dev.name))
 
     print("Unbinding the kernel driver if it's attached...")
     dev.pci.driver_unbind()
 
-    binary = open(args.firmware,'rb').read()
-    if len(binary) % 2:
-        binary += b'\0'
+    if args.stats:
+        dev.stats = AccessStats()
 
-    print("Loading \"{}\"...".format(args.firmware))
-    start = time.perf_counter_ns()
-    dev.hw_code_load_exec(binary)
-    stop = time.perf_counter_ns()
-    print("Loaded {} bytes in {:.06f} seconds ({} bytes/second)".format(len(binary), (stop-start)/1e9, int(len(binary)*1000000000/(stop-start))))
+    if args.trace:
+        dev.trace = AccessTrace(path=args.trace, vid=dev.pci.vid, did=dev.pci.did)
+
+    try:
+        load(dev, args.firmware, args.differential or args.watch, args.verify)
+        if args.stats:
+            print_stats(dev.stats)
+
+        if args.watch:
+            print("Watching \"{}\" for changes, press Ctrl-C to exit...".format(args.firmware))
+            stat = os.stat(args.firmware)
+            last = (stat.st_mtime_ns, stat.st_size)
+            try:
+                while True:
+                    last = wait_for_change(args.firmware, last)
+                    if args.stats:
+                        dev.stats = AccessStats()
+                    load(dev, args.firmware, True, args.verify)
+                    if args.stats:
+                        print_stats(dev.stats)
+            except KeyboardInterrupt:
+                pass
+    finally:
+        if dev.trace is not None:
+            dev.trace.close()
 
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# regdata.py - A validating, caching loader for the YAML register definition
+# files.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import hashlib
+import marshal
+import os
+import pathlib
+import sys
+
+
+REGIONS: tuple[str, ...] = ("pci", "bar0", "sfr", "xdata")
+
+# Bump this whenever the validation rules or the cached format change, so
+# stale cache entries are ignored.
+CACHE_VERSION: int = 1
+
+
+class SchemaError(Exception):
+    pass
+
+def validate(doc) -> None:
+    if type(doc) is not dict:
+        raise SchemaError("Document is not a dict.")
+
+    unknown_keys = set(doc.keys()).difference(set(['meta', 'xdata', 'registers']))
+    if unknown_keys:
+        raise SchemaError("Invalid keys in document: {}".format(unknown_keys))
+
+    xdata = doc.get('xdata', list())
+    if type(xdata) is not list:
+        raise SchemaError("\"xdata\" is not a list.")
+
+    for i, region in enumerate(xdata):
+        unknown_keys = set(region.keys()).difference(set(['name', 'start', 'end', 'permissions', 'notes']))
+        if unknown_keys:
+            raise SchemaError("Invalid keys in xdata[{}]: {}".format(i, unknown_keys))
+
+    registers = doc.get('registers', dict())
+    if type(registers) is not dict:
+        raise SchemaError("\"registers\" is not a dict.")
+
+    for region in REGIONS:
+        region_registers = registers.get(region, list())
+        if type(region_registers) is not list:
+            raise SchemaError("Register region \"{}\" is not a list.".format(region))
+
+        for i, register in enumerate(region_registers):
+            unknown_keys = set(register.keys()).difference(set(['name', 'start', 'end', 'permissions', 'bits', 'notes']))
+            if unknown_keys:
+                raise SchemaError("Invalid keys in registers.{}[{}]: {}".format(region, i, unknown_keys))
+
+            bits = register.get('bits', list())
+            if type(bits) is not list:
+                raise SchemaError("Register {}.{}.bits is not a list.".format(region, i))
+
+            for b, bit_range in enumerate(bits):
+                unknown_keys = set(bit_range.keys()).difference(set(['name', 'start', 'end', 'permissions', 'notes']))
+                if unknown_keys:
+                    raise SchemaError("Invalid keys in registers.{}[{}].bits[{}]: {}".format(region, i, b, unknown_keys))
+
+def cache_dir() -> pathlib.Path:
+    xdg_cache_home: str | None = os.environ.get('XDG_CACHE_HOME')
+    if xdg_cache_home:
+        return pathlib.Path(xdg_cache_home) / "asmedia-xhc-re"
+
+    return pathlib.Path.home() / ".cache" / "asmedia-xhc-re"
+
+def marshal_tag() -> bytes:
+    '''Identifies the interpreter's marshal format, which cached data must have been written in'''
+
+    # The marshal format (and the objects it can represent) can change between
+    # Python versions, so a cache written by one version can't be trusted by
+    # another.
+    return "py{}.{}-marshal{}".format(*sys.version_info[:2], marshal.version).encode('ascii')
+
+def parse(raw: bytes) -> dict:
+    # Only import PyYAML when a file actually needs to be parsed, since
+    # importing it takes longer than loading a cached document.
+    import yaml  # type: ignore[import-untyped]
+
+    # The C loader (if PyYAML was built with libyaml) is much faster.
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(raw, Loader=loader)
+
+def load(path: str | pathlib.Path, use_cache: bool = True) -> dict:
+    '''Loads and validates a register definition file, using the cached copy if the file hasn't changed'''
+
+    raw: bytes = open(path, 'rb').read()
+    if not use_cache:
+        doc: dict = parse(raw)
+        validate(doc)
+        return doc
+
+    key: str = hashlib.blake2b(CACHE_VERSION.to_bytes(4, 'little') + marshal_tag() + raw, digest_size=16).hexdigest()
+    cache_path: pathlib.Path = cache_dir() / "regs-{}.marshal".format(key)
+    try:
+        cached = marshal.loads(cache_path.read_bytes())
+        if type(cached) is dict:
+            return cached
+    except Exception:
+        # Any problem with the cached copy just means it has to be parsed
+        # again.
+        pass
+
+    doc = parse(raw)
+    validate(doc)
+
+    # The cache is just an optimization, so don't fail if it can't be written.
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path: pathlib.Path = cache_path.with_suffix(".tmp{}".format(os.getpid()))
+        tmp_path.write_bytes(marshal.dumps(doc))
+        os.replace(tmp_path, cache_path)
+    except (OSError, ValueError):
+        pass
+
+    return doc
+
+
+def main() -> int:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--no-cache", action="store_true", default=False, help="Don't use or update the cache.")
+    parser.add_argument("input", type=str, nargs="+", help="A YAML register definition file to validate.")
+    args: argparse.Namespace = parser.parse_args()
+
+    status: int = 0
+    for path in args.input:
+        try:
+            load(path, not args.no_cache)
+            print("{}: OK".format(path))
+        except SchemaError as error:
+            print("{}: Error: {}".format(path, error))
+            status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# regdb.py - An indexed database of the registers described in the YAML data
+# files.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import bisect
+import pathlib
+import sys
+from typing import Iterable, NamedTuple
+
+import regdata
+
+
+class Bitfield(NamedTuple):
+    name: str
+    # The first and last bits of the field, counted from bit zero of the
+    # first byte of the register.
+    start: int
+    end: int
+    permissions: str | None
+
+    @property
+    def mask(self) -> int:
+        return ((1 << (self.end - self.start + 1)) - 1) << self.start
+
+    def extract(self, value: int) -> int:
+        return (value & self.mask) >> self.start
+
+class Register(NamedTuple):
+    region: str
+    name: str
+    start: int
+    end: int
+    permissions: str | None
+    bits: tuple[Bitfield, ...]
+    # The position of the register in the YAML file.
+    order: int
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    def fields_at(self, addr: int) -> list[Bitfield]:
+        '''Returns the bitfields that overlap the byte at "addr"'''
+
+        first_bit = (addr - self.start) * 8
+        last_bit = first_bit + 7
+        return [field for field in self.bits if field.start <= last_bit and field.end >= first_bit]
+
+    def field_at(self, addr: int, bit: int) -> Bitfield | None:
+        '''Returns the bitfield containing bit "bit" of the byte at "addr"'''
+
+        reg_bit = (addr - self.start) * 8 + bit
+        for field in self.bits:
+            if field.start <= reg_bit <= field.end:
+                return field
+
+        return None
+
+    def decode(self, value: int) -> list[tuple[Bitfield, int]]:
+        '''Splits a value of the whole register into the values of its bitfields'''
+
+        return [(field, field.extract(value)) for field in self.bits]
+
+class RegionIndex:
+    '''An interval index of the registers in one region'''
+
+    def __init__(self, registers: Iterable[Register]) -> None:
+        self.registers: list[Register] = sorted(registers, key=lambda reg: (reg.start, reg.end))
+        self.starts: list[int] = [reg.start for reg in self.registers]
+
+        # Some registers are aliases that overlap others, so keep track of the
+        # highest end address seen so far. A search can then stop walking
+        # backwards as soon as no earlier register can reach the address.
+        self.max_ends: list[int] = []
+        max_end = -1
+        for reg in self.registers:
+            max_end = max(max_end, reg.end)
+            self.max_ends.append(max_end)
+
+    def _lookup_from(self, addr: int, index: int) -> list[Register]:
+        matches = []
+        i = index - 1
+        while i >= 0 and self.max_ends[i] >= addr:
+            reg = self.registers[i]
+            if reg.end >= addr:
+                matches.append(reg)
+            i -= 1
+
+        if len(matches) > 1:
+            matches.sort(key=lambda reg: reg.order)
+
+        return matches
+
+    def lookup(self, addr: int) -> list[Register]:
+        return self._lookup_from(addr, bisect.bisect_right(self.starts, addr))
+
+    def lookup_many(self, addrs: Iterable[int]) -> list[list[Register]]:
+        # Look the addresses up in sorted order, so each search only has to
+        # cover the part of the index after the previous one.
+        addr_list = list(addrs)
+        results = [[] for _ in addr_list]
+        index = 0
+        for i in sorted(range(len(addr_list)), key=addr_list.__getitem__):
+            addr = addr_list[i]
+            index = bisect.bisect_right(self.starts, addr, index)
+            results[i] = self._lookup_from(addr, index)
+
+        return results
+
+class RegisterDb:
+    '''The registers of one chip, indexed by region and address'''
+
+    REGIONS: tuple[str, ...] = regdata.REGIONS
+
+    def __init__(self, doc: dict, mmio_offset: int = 0) -> None:
+        self.chip: str | None = doc.get('meta', dict()).get('chip')
+
+        # The offset of the firmware's 16-bit MMIO addresses in XDATA.
+        self.mmio_offset: int = mmio_offset
+
+        self.regions: dict[str, RegionIndex] = dict()
+        for region in self.REGIONS:
+            registers = []
+            for order, reg in enumerate(doc.get('registers', dict()).get(region, list())):
+                bits = tuple(
+                    Bitfield(field['name'], field['start'], field['end'], field.get('permissions'))
+                    for field in reg.get('bits', list()))
+                registers.append(Register(region, reg['name'], reg['start'], reg['end'], reg.get('permissions'), bits, order))
+            self.regions[region] = RegionIndex(registers)
+
+    @classmethod
+    def load(cls, path: str | pathlib.Path, mmio_offset: int = 0) -> "RegisterDb":
+        return cls(regdata.load(path), mmio_offset)
+
+    def _region(self, region: str) -> RegionIndex:
+        index = self.regions.get(region)
+        if index is None:
+            raise ValueError("Invalid region, must be one of {}: {}".format(", ".join(self.REGIONS), region))
+
+        return index
+
+    def lookup(self, region: str, addr: int) -> list[Register]:
+        '''Returns the registers containing "addr", in the order they appear in the YAML file'''
+
+        return self._region(region).lookup(addr)
+
+    def lookup_many(self, region: str, addrs: Iterable[int]) -> list[list[Register]]:
+        '''Looks up many addresses at once, which is faster than looking them up one at a time'''
+
+        return self._region(region).lookup_many(addrs)
+
+    def mmio_to_xdata(self, addr: int) -> int:
+        return addr + self.mmio_offset
+
+    def lookup_mmio(self, addr: int) -> list[Register]:
+        '''Looks up a 16-bit MMIO address, as used by the firmware, in XDATA'''
+
+        return self.lookup("xdata", self.mmio_to_xdata(addr))
+
+    def lookup_bit(self, region: str, addr: int, bit: int) -> list[tuple[Register, Bitfield | None]]:
+        return [(reg, reg.field_at(addr, bit)) for reg in self.lookup(region, addr)]
+
+    def format_addr(self, region: str, addr: int, formatted_addr: str) -> str:
+        '''Wraps a formatted address in the names of the registers containing it, like "NAME[offset] (0x1234)"'''
+
+        for reg in self.lookup(region, addr):
+            formatted_addr = "{}[{}] ({})".format(reg.name, addr-reg.start, formatted_addr)
+
+        return formatted_addr
+
+
+def main() -> int:
+    project_dir = pathlib.Path(__file__).resolve().parents[1]
+    default_data_dir = str(project_dir/"data")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-dir", type=str, default=default_data_dir, help="The YAML data directory. Default is \"{}\"".format(default_data_dir))
+    parser.add_argument("-r", "--region", type=str, choices=RegisterDb.REGIONS, default="xdata", help="The region to look the addresses up in. Default is \"xdata\".")
+    parser.add_argument("chip", type=str, help="The name of the chip's data file, e.g. \"regs-asm2142.yaml\".")
+    parser.add_argument("addr", type=lambda x: int(x, 0), nargs="+", help="An address to look up.")
+    args = parser.parse_args()
+
+    db = RegisterDb.load(pathlib.Path(args.data_dir) / args.chip)
+    for addr, registers in zip(args.addr, db.lookup_many(args.region, args.addr)):
+        if not registers:
+            print("{:#07x}: Unknown".format(addr))
+        for reg in registers:
+            fields = ", ".join(field.name for field in reg.fields_at(addr))
+            print("{:#07x}: {}[{}]{}".format(addr, reg.name, addr-reg.start, " ({})".format(fields) if fields else ""))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# snapshot_mmio.py - A tool to dump the internal MMIO space of an ASMedia USB
+# host controller.
+# Copyright (C) 2025  Forest Crossman <cyrozap@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import os
+import pathlib
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+import regdata
+from asm_tool import AsmDev
+
+
+# Registers that are known to have side effects when read, even if the YAML
+# register definitions don't say so.
+SIDE_EFFECT_REGISTERS: set[str] = {
+    "UART_RBR",
+}
+
+# Matches register notes like "decreases by 1 each time `UART_RBR` is read".
+SIDE_EFFECT_NOTE_RE: re.Pattern = re.compile(r"`(\w+)` is\s+read")
+
+
+def load_chip_data(data_dir: str, data_filename: str | None) -> dict:
+    if not data_filename:
+        return dict()
+
+    try:
+        return regdata.load(pathlib.Path(data_dir) / data_filename)
+    except FileNotFoundError:
+        return dict()
+
+def get_readable_ranges(doc: dict) -> list[tuple[int, int]]:
+    # The hardware MMIO access mechanism can't be used to access XRAM, so only
+    # dump the MMIO regions of the memory map. Without a memory map, there's no
+    # way to tell where XRAM ends, so nothing is dumped.
+    ranges = []
+    for region in doc.get('xdata', list()):
+        if region.get('name') == "MMIO":
+            ranges.append((region['start'], region['end'] + 1))
+
+    return ranges
+
+def get_skipped_registers(doc: dict, extra_names: list[str]) -> list[tuple[int, int, str]]:
+    xdata = doc.get('registers', dict()).get('xdata', list())
+
+    names = SIDE_EFFECT_REGISTERS | set(extra_names)
+    for reg in xdata:
+        for match in SIDE_EFFECT_NOTE_RE.finditer(reg.get('notes', "")):
+            names.add(match.group(1))
+        for bit_range in reg.get('bits', list()):
+            for match in SIDE_EFFECT_NOTE_RE.finditer(bit_range.get('notes', "")):
+                names.add(match.group(1))
+
+    skipped = []
+    for reg in xdata:
+        if reg.get('name') in names:
+            skipped.append((reg['start'], reg['end'] + 1, reg['name']))
+
+    return sorted(skipped)
+
+def split_chunk(start: int, end: int, skipped: list[tuple[int, int, str]]) -> list[tuple[int, int]]:
+    pieces = []
+    pos = start
+    for skip_start, skip_end, _ in skipped:
+        if skip_end <= pos or skip_start >= end:
+            continue
+        if skip_start > pos:
+            pieces.append((pos, skip_start))
+        pos = max(pos, skip_end)
+    if pos < end:
+        pieces.append((pos, end))
+
+    return pieces
+
+def write_meta(path: str, meta: dict) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+def main() -> int:
+    project_dir = pathlib.Path(__file__).resolve().parents[1]
+    default_data_dir = str(project_dir/"data")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-dir", type=str, default=default_data_dir, help="The YAML data directory. Default is \"{}\"".format(default_data_dir))
+    parser.add_argument("-c", "--chunk-size", type=lambda x: int(x, 0), default=0x100, help="The number of bytes to read between progress updates. Default is 0x100.")
+    parser.add_argument("-s", "--skip", type=str, action="append", default=[], help="The name of an additional XDATA register to skip. May be specified multiple times.")
+    parser.add_argument("-r", "--resume", action="store_true", default=False, help="Resume an interrupted dump.")
+    parser.add_argument("dbsf", type=str, help="The \"<domain>:<bus>:<slot>.<func>\" for the ASMedia USB 3 host controller.")
+    parser.add_argument("output", type=str, help="The output binary. The metadata is written to \"<output>.json\".")
+    args = parser.parse_args()
+
+    if args.chunk_size <= 0:
+        print("Error: Invalid chunk size: {}".format(args.chunk_size), file=sys.stderr)
+        return 1
+
+    dev = AsmDev(args.dbsf)
+    print("Chip: {}".format(dev.name))
+
+    if dev.hw_code_and_mmio not in (1, 2):
+        print("Error: {} is not capable of hardware MMIO access.".format(dev.name), file=sys.stderr)
+        return 1
+
+    meta_path = args.output + ".json"
+    doc = load_chip_data(args.data_dir, dev.data_filename)
+    ranges = get_readable_ranges(doc)
+    if not ranges:
+        print("Error: The register data for {} has no MMIO region in its XDATA memory map.".format(dev.name), file=sys.stderr)
+        return 1
+    skipped = get_skipped_registers(doc, args.skip)
+
+    if args.resume:
+        try:
+            meta = json.load(open(meta_path, 'r'))
+        except FileNotFoundError:
+            print("Error: No metadata to resume from: {}".format(meta_path), file=sys.stderr)
+            return 1
+        if meta.get('chip') != dev.name or meta.get('size') != dev.xdata_size:
+            print("Error: \"{}\" is a dump of a different chip.".format(args.output), file=sys.stderr)
+            return 1
+        skipped = [tuple(s) for s in meta['skipped']]  # type: ignore[misc]
+        ranges = [tuple(r) for r in meta['ranges']]  # type: ignore[misc]
+    else:
+        meta = {
+            'dbsf': args.dbsf,
+            'chip': dev.name,
+            'vid': "{:04x}".format(dev.pci.vid),
+            'did': "{:04x}".format(dev.pci.did),
+            'size': dev.xdata_size,
+            'ranges': ranges,
+            'skipped': skipped,
+            'next_addr': ranges[0][0],
+            'started': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'complete': False,
+        }
+
+    print("Unbinding the kernel driver if it's attached...")
+    dev.pci.driver_unbind()
+
+    # A new dump must not keep any data from an old file, since the metadata
+    # can't tell the stale bytes apart from the ones that were read.
+    flags = os.O_RDWR | os.O_CREAT
+    if not args.resume:
+        flags |= os.O_TRUNC
+    fd = os.open(args.output, flags)
+    try:
+        os.ftruncate(fd, dev.xdata_size)
+        write_meta(meta_path, meta)
+
+        total = sum(end - start for start, end in ranges)
+        done = sum(min(end, meta['next_addr']) - start for start, end in ranges if start < meta['next_addr'])
+        bytes_read = 0
+        start_ns = time.perf_counter_ns()
+        for range_start, range_end in ranges:
+            for chunk_start in range(max(range_start, meta['next_addr']), range_end, args.chunk_size):
+                chunk_end = min(chunk_start + args.chunk_size, range_end)
+                for piece_start, piece_end in split_chunk(chunk_start, chunk_end, skipped):
+                    data = dev.hw_mmio_read_range(piece_start, piece_end - piece_start)
+                    os.pwrite(fd, data, piece_start)
+                    bytes_read += len(data)
+
+                done += chunk_end - chunk_start
+                meta['next_addr'] = chunk_end
+                write_meta(meta_path, meta)
+
+                elapsed_ns = max(time.perf_counter_ns() - start_ns, 1)
+                print("\r0x{:05x}: {}/{} bytes ({:.1f}%), {} bytes/second".format(
+                    chunk_end, done, total, 100 * done / total, int(bytes_read * 1e9 / elapsed_ns)), end="", flush=True)
+        print()
+    except KeyboardInterrupt:
+        print()
+        print("Interrupted at 0x{:05x}, rerun with \"--resume\" to continue.".format(meta['next_addr']))
+        return 1
+    finally:
+        os.close(fd)
+
+    stop_ns = time.perf_counter_ns()
+    meta['complete'] = True
+    meta['finished'] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    write_meta(meta_path, meta)
+
+    print("Read {} bytes in {:.06f} seconds ({} bytes/second), skipped {} register{}: {}".format(
+        bytes_read, (stop_ns - start_ns) / 1e9, int(bytes_read * 1e9 / max(stop_ns - start_ns, 1)),
+        len(skipped), "" if len(skipped) == 1 else "s", ", ".join(name for _, _, name in skipped)))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pathlib
+import sys
+
+import pytest
+
+# The tools import each other as top-level modules, so make them importable
+# from the tests.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from asm_sim import SimDevice
+
+
+ASM1142 = (0x1b21, 0x1242)
+ASM2142 = (0x1b21, 0x2142)
+
+
+@pytest.fixture(params=[ASM1142, ASM2142], ids=["type1", "type2"])
+def sim(request):
+    '''A simulated chip of each hardware CODE and MMIO access type'''
+
+    with SimDevice(*request.param) as sim:
+        yield sim
+
+@pytest.fixture
+def sim2():
+    '''A simulated chip with 128 kB of CODE RAM, which can be read back'''
+
+    with SimDevice(*ASM2142) as sim:
+        yield sim
@@ -0,0 +1,38 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import struct
+from zlib import crc32
+
+
+def firmware_code(fw_magic: bytes, version: bytes, size: int, seed: int = 0) -> bytes:
+    code = bytearray((i * 5 + seed * 7 + 3) & 0xff for i in range(size))
+    code[0x80:0x86] = version
+    code[0x87:0x8f] = fw_magic
+    return bytes(code)
+
+def config_word(addr: int, size: int, value: int) -> bytes:
+    return struct.pack('<BBHI', 0xcc, size, addr, value)
+
+def xhc_image(header_magic: bytes, version: bytes, size: int = 0x800, config_words: bytes = b"", seed: int = 0) -> bytes:
+    fw_magic = header_magic[:5] + b"_FW"
+    len_format = "<I" if header_magic[:5] in (b"2214A", b"2324A") else "<H"
+
+    # ASM2142 and later have 16 bytes of padding before the config words.
+    data = bytes(16) if len_format == "<I" else b""
+    data += config_words
+    header = struct.pack('<HHH10s', 0, 1, 16 + len(data), header_magic) + data
+    header += struct.pack('<BI', sum(header) & 0xff, crc32(header))
+
+    code = firmware_code(fw_magic, version, size, seed)
+    body = struct.pack(len_format, len(code)) + code + fw_magic
+    body += struct.pack('<BI', sum(code) & 0xff, crc32(code))
+
+    return header + body
+
+def promontory_image(version: bytes, size: int = 0x1000, seed: int = 0) -> bytes:
+    code = firmware_code(b"3328A_FW", version, size - 12, seed)
+    return b"_PT_" + struct.pack('<II', size, sum(code) & 0xffffffff) + code
+
+def brom_image(fw_magic: bytes, version: bytes, size: int = 0x8000, seed: int = 0) -> bytes:
+    brom = firmware_code(fw_magic, version, size - 4, seed)
+    return brom + struct.pack('<I', crc32(brom))
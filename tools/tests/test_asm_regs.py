@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from asm_regs import RegisterFile, split_aligned
+from asm_sim import SimDevice
+from asm_tool import AccessStats
+from regdb import RegisterDb
+
+
+DOC = {
+    'registers': {
+        'pci': [
+            {'name': "SCRATCH", 'start': 0x40, 'end': 0x43},
+        ],
+        'xdata': [
+            {'name': "CTRL", 'start': 0xE300, 'end': 0xE301, 'bits': [
+                {'name': "ENABLE", 'start': 0, 'end': 0, 'permissions': "RW"},
+                {'name': "EVENT", 'start': 1, 'end': 1, 'permissions': "RW1C"},
+                {'name': "MODE", 'start': 8, 'end': 11, 'permissions': "RW"},
+            ]},
+        ],
+    },
+}
+
+
+@pytest.fixture
+def regs(sim2):
+    return RegisterFile(sim2.asm_dev(), RegisterDb(DOC))
+
+def mmio_accesses(dev) -> tuple[int, int]:
+    latency = dev.stats.latency_ns
+    return tuple(latency[name].count if name in latency else 0 for name in ("hw_mmio_read_range", "hw_mmio_write_range"))
+
+
+def test_chip_data(sim):
+    dev = sim.asm_dev()
+    dev.xdata.CPU_MODE_NEXT.CLOCK_DIV = 1
+
+    assert sim.xdata[sim.cpu_mode_next] == 0x02
+    assert dev.xdata.CPU_MODE_NEXT.CLOCK_DIV == 1
+    assert dev.xdata.CPU_MODE_NEXT.read() == 0x02
+
+def test_grouped_update(sim):
+    dev = sim.asm_dev()
+    dev.stats = AccessStats()
+    with dev.xdata.CPU_MODE_NEXT as reg:
+        reg.CODE_LOCATION = 1
+        reg.CLOCK_DIV = 1
+        # Reads inside the block see the pending values.
+        assert reg.CLOCK_DIV == 1
+        assert sim.xdata[sim.cpu_mode_next] == 0
+
+    assert sim.xdata[sim.cpu_mode_next] == 0x03
+    assert mmio_accesses(dev) == (1, 1)
+
+    # Writing the same values again doesn't write anything.
+    dev.xdata.CPU_MODE_NEXT.update(CODE_LOCATION=1, CLOCK_DIV=1)
+    assert mmio_accesses(dev) == (2, 1)
+
+def test_only_changed_bytes_written(regs, sim2):
+    sim2.xdata[0x1E300:0x1E302] = b"\x01\x05"
+    regs.xdata.CTRL.MODE = 0xa
+
+    assert sim2.xdata[0x1E300:0x1E302] == b"\x01\x0a"
+
+def test_write_one_to_clear(regs, sim2):
+    sim2.xdata[0x1E300] = 0x02
+
+    # Writing back a set RW1C bit would clear it, so it's written as zero.
+    regs.xdata.CTRL.ENABLE = 1
+    assert sim2.xdata[0x1E300] == 0x01
+
+    sim2.xdata[0x1E300] = 0x03
+    regs.xdata.CTRL.EVENT = 1
+    assert sim2.xdata[0x1E300] == 0x03
+
+def test_config_space(regs, sim2):
+    regs.config.SCRATCH.write(0x12345678)
+
+    assert regs.config.SCRATCH.read() == 0x12345678
+    assert sim2.pci().config_reg_read(0x40, 4) == 0x12345678
+
+def test_errors(regs):
+    with pytest.raises(ValueError):
+        regs.xdata.CTRL.MODE = 0x10
+    with pytest.raises(ValueError):
+        regs.xdata.CTRL.write(0x10000)
+    with pytest.raises(AttributeError):
+        regs.xdata.CTRL.MISSING = 1
+    with pytest.raises(AttributeError):
+        regs.xdata.MISSING
+
+def test_no_write_after_exception(regs, sim2):
+    with pytest.raises(RuntimeError):
+        with regs.xdata.CTRL as reg:
+            reg.ENABLE = 1
+            raise RuntimeError()
+
+    assert sim2.xdata[0x1E300] == 0
+
+def test_unsupported_chip():
+    # AMD Promontory 21 has no register data file.
+    with SimDevice(0x1022, 0x43f7) as sim:
+        dev = sim.asm_dev()
+        assert not RegisterFile.supported(dev)
+        with pytest.raises(ValueError, match="no register data file"):
+            dev.regs
+
+def test_split_aligned():
+    assert split_aligned(0x40, 4) == [(0x40, 4)]
+    assert split_aligned(0x41, 7) == [(0x41, 1), (0x42, 2), (0x44, 4)]
+    assert split_aligned(0x43, 0) == []
@@ -0,0 +1,52 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+
+import pytest
+
+import bench_access
+from asm_sim import SimDevice
+from asm_tool import AsmDev
+
+
+SUPPORTED = [ids for ids, chip in AsmDev.ids_map.items() if chip.get('hw_code_and_mmio') in (1, 2)]
+
+
+def test_unknown_chip():
+    with pytest.raises(KeyError):
+        SimDevice(0x1234, 0x5678)
+
+@pytest.mark.parametrize("ids", SUPPORTED, ids=["{:04x}:{:04x}".format(*ids) for ids in SUPPORTED])
+def test_load(ids):
+    with SimDevice(*ids) as sim:
+        dev = sim.asm_dev()
+        code = bytes(range(256)) * 8
+        dev.hw_code_load_exec(code)
+
+        assert sim.code[:len(code)] == code
+        assert sim.operations > len(code) // 4
+
+def test_code_write_needs_access_enabled(sim):
+    # The model ignores CODE RAM writes unless CODE write access is enabled,
+    # like the hardware.
+    dev = sim.asm_dev()
+    if dev.hw_code_and_mmio == 1:
+        dev.pci.config_reg_write(AsmDev.CODE_RAM_DATA_LOWER_BANK_DATA, 2, 0x1234)
+    else:
+        dev.pci.bar0_reg_write(AsmDev.CODE_RAM_WRITE_DATA_BAR0, 4, 0x12345678)
+
+    assert not any(sim.code)
+
+def test_close_removes_sysfs_tree():
+    sim = SimDevice(*SUPPORTED[0])
+    sysfs_dir = sim.sysfs_dir
+    sim.close()
+
+    assert not os.path.exists(sysfs_dir)
+
+def test_bench_chip():
+    with SimDevice(0x1b21, 0x2142) as sim:
+        results = bench_access.bench_chip(sim, 0, 0x100)
+
+    assert [result.name for result in results][-2:] == ["AsmDev.hw_code_write", "AsmDev.hw_code_load_exec"]
+    assert all(result.ops > 0 and result.bytes > 0 for result in results)
@@ -0,0 +1,70 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+
+import carve_fw
+from fw_images import brom_image, promontory_image, xhc_image
+
+
+VERSION_1142 = bytes.fromhex("161121000001")
+VERSION_2142 = bytes.fromhex("170825000003")
+VERSION_PROM = bytes.fromhex("180312000002")
+
+
+def test_carve_each_kind():
+    images = [
+        xhc_image(b"2114A_RCFG", VERSION_1142),
+        xhc_image(b"2214A_RCFG", VERSION_2142),
+        promontory_image(VERSION_PROM),
+    ]
+    padding = b"\xff" * 0x123
+    data = padding + padding.join(images) + padding
+
+    found = carve_fw.carve(data)
+
+    # The firmware code inside each image looks like a BROM, but only the
+    # images themselves are reported.
+    assert [(image.kind, image.chip, image.version) for image in found] == [
+        ("xhc", "ASM1142", "161121_00_00_01"),
+        ("xhc", "ASM2142/ASM3142", "170825_00_00_03"),
+        ("promontory", "ASM3283/Prom21", "180312_00_00_02"),
+    ]
+    for image, contents in zip(found, images):
+        assert data[image.offset:image.offset+image.length] == contents
+
+def test_carve_brom():
+    brom = brom_image(b"2214A_FW", VERSION_2142)
+    data = bytes(0x200) + brom + bytes(0x200)
+
+    assert carve_fw.carve(data) == [carve_fw.Image(0x200, 0x8000, "brom", "ASM2142/ASM3142", "170825_00_00_03")]
+
+def test_corrupt_images_are_skipped():
+    xhc = bytearray(xhc_image(b"2214A_RCFG", VERSION_2142))
+    xhc[0x100] ^= 1
+    prom = bytearray(promontory_image(VERSION_PROM))
+    prom[0x100] ^= 1
+    truncated = xhc_image(b"2114A_RCFG", VERSION_1142)[:-1]
+
+    assert carve_fw.carve(bytes(xhc) + bytes(prom) + truncated) == []
+
+def test_carve_stream():
+    image = xhc_image(b"2114A_RCFG", VERSION_1142)
+    prom = promontory_image(VERSION_PROM)
+
+    # Put the second image across a chunk boundary.
+    data = bytes(0x1000) + image + bytes(carve_fw.STREAM_CHUNK_SIZE - 0x1800) + prom + bytes(0x100)
+
+    found = list(carve_fw.carve_stream(io.BytesIO(data)))
+
+    assert [(image.offset, image.kind) for image, _ in found] == [(0x1000, "xhc"), (carve_fw.STREAM_CHUNK_SIZE - 0x800 + len(image), "promontory")]
+    assert [contents for _, contents in found] == [image, prom]
+    assert [image for image, _ in found] == carve_fw.carve(data)
+
+def test_carve_file(tmp_path):
+    image = xhc_image(b"2214A_RCFG", VERSION_2142)
+    path = tmp_path / "flash.bin"
+    path.write_bytes(bytes(0x4321) + image)
+
+    found = carve_fw.carve_file(str(path), jobs=1)
+
+    assert [(image.offset, image.length, image.kind) for image in found] == [(0x4321, len(image), "xhc")]
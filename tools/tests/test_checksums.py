@@ -0,0 +1,60 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import zlib
+
+import pytest
+
+import checksums
+
+
+# The standard check input for CRC-32.
+CHECK = b"123456789"
+
+
+@pytest.fixture(params=[False, True], ids=["python", "numpy"])
+def numpy(request, monkeypatch):
+    if not request.param:
+        monkeypatch.setattr(checksums, "numpy", None)
+    elif checksums.numpy is None:
+        pytest.skip("NumPy isn't installed")
+
+
+def test_reference_values(numpy):
+    result = checksums.checksums(CHECK)
+    assert result == checksums.Checksums(9, 0x1dd, 0xcbf43926)
+    assert result.sum8 == 0xdd
+    assert result.sum32 == 0x1dd
+    assert checksums.sum8(CHECK) == 0xdd
+    assert checksums.sum32(CHECK) == 0x1dd
+
+def test_empty(numpy):
+    assert checksums.checksums(b"") == checksums.Checksums(0, 0, 0)
+
+def test_sum_wraps(numpy):
+    data = b"\xff" * 0x10001
+    assert checksums.sum8(data) == (0xff * 0x10001) & 0xff
+    assert checksums.sum32(memoryview(data)) == 0xff * 0x10001
+
+def test_chunks(numpy):
+    # Spans several chunks, and ends in the middle of one.
+    data = bytes((i * 31 + (i >> 9)) & 0xff for i in range(3 * checksums.CHUNK_SIZE + 123))
+    result = checksums.checksums(memoryview(data))
+    assert result.length == len(data)
+    assert result.total == sum(data)
+    assert result.crc32 == zlib.crc32(data)
+
+    # Updating piece by piece gives the same result as a single update.
+    checksummer = checksums.Checksummer()
+    for offset in range(0, len(data), 1000):
+        checksummer.update(data[offset:offset+1000])
+    assert checksummer.digest() == result
+
+def test_file_checksums(numpy, tmp_path):
+    path = tmp_path / "image.bin"
+    path.write_bytes(b"xx" + CHECK + b"yy")
+    assert checksums.file_checksums(str(path), 2, len(CHECK)) == checksums.checksums(CHECK)
+    assert checksums.file_checksums(str(path), 2).length == len(CHECK) + 2
+
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    assert checksums.file_checksums(str(empty)) == checksums.Checksums(0, 0, 0)
@@ -0,0 +1,84 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from asm_tool import AsmDev, CodeRamCache
+
+
+def image(size: int, seed: int = 0) -> bytes:
+    return bytes((i * 7 + seed * 13 + (i >> 8)) & 0xff for i in range(size))
+
+
+def test_differential_load(sim):
+    dev = sim.asm_dev()
+    code = bytearray(image(0x8000, 6))
+    dev.hw_code_load_exec(bytes(code))
+    full_operations = sim.operations
+
+    # Change a single block.
+    code[0x1234] ^= 0xff
+    sim.operations = 0
+    dev.hw_code_load_exec(bytes(code), differential=True)
+
+    assert sim.code[:len(code)] == code
+    assert dev.hw_code_changed_blocks(bytes(code)) == set()
+    assert 0 < sim.operations < full_operations // 8
+
+def test_changed_blocks(sim):
+    dev = sim.asm_dev()
+    code = bytearray(image(0x1000, 1))
+
+    # Nothing is known about CODE RAM until the first load.
+    assert dev.hw_code_changed_blocks(bytes(code)) is None
+    dev.hw_code_load_exec(bytes(code))
+
+    code[0x0ff] ^= 1
+    code[0x300] ^= 1
+    assert dev.hw_code_changed_blocks(bytes(code)) == {0, 3}
+    # Blocks past the end of the last image are always loaded.
+    assert dev.hw_code_changed_blocks(bytes(code) + bytes(0x100)) == {0, 3, 0x10}
+
+def test_differential_load_after_reset(sim):
+    dev = sim.asm_dev()
+    code = image(0x2000, 7)
+    dev.hw_code_load_exec(code)
+
+    # Reboot the CPU from ROM, which may change CODE RAM.
+    dev.hw_mmio_reg_write(sim.cpu_mode_next, 1, 2)
+    dev.hw_mmio_reg_write(sim.cpu_exec_ctrl, 1, 2)
+    dev.hw_mmio_reg_write(sim.cpu_exec_ctrl, 1, 0)
+    sim.code[:len(code)] = bytes(len(code))
+
+    assert dev.hw_code_changed_blocks(code) is None
+    dev.hw_code_load_exec(code, differential=True)
+    assert sim.code[:len(code)] == code
+
+def test_direct_write_invalidates_cache(sim):
+    dev = sim.asm_dev()
+    code = image(0x1000, 8)
+    dev.hw_code_load_exec(code)
+
+    try:
+        dev.hw_code_write(0, bytes(3))
+    except ValueError:
+        pass
+    assert dev.hw_code_changed_blocks(code) is not None
+
+    dev.hw_code_write(0, code)
+    # A write outside of hw_code_load_exec leaves CODE RAM in an unknown state.
+    assert dev.hw_code_changed_blocks(code) is None
+
+def test_cache_entry(tmp_path):
+    cache = CodeRamCache("0000:01:00.0", "ASM2142/ASM3142", AsmDev.CODE_BLOCK_SIZE, cache_dir=str(tmp_path))
+    hashes = cache.block_hashes(image(0x280))
+    assert len(hashes) == 3
+
+    assert cache.load() is None
+    cache.store(hashes)
+    assert cache.load() == hashes
+
+    # Entries for another device, chip, or block size are ignored.
+    assert CodeRamCache("0000:02:00.0", "ASM2142/ASM3142", AsmDev.CODE_BLOCK_SIZE, cache_dir=str(tmp_path)).load() is None
+    assert CodeRamCache("0000:01:00.0", "ASM1142", AsmDev.CODE_BLOCK_SIZE, cache_dir=str(tmp_path)).load() is None
+    assert CodeRamCache("0000:01:00.0", "ASM2142/ASM3142", 0x200, cache_dir=str(tmp_path)).load() is None
+
+    open(cache.path, "w").write("{")
+    assert cache.load() is None
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from asm_sim import SimDevice
+from asm_tool import AsmDev, VerifyError
+
+
+def image(size: int, seed: int = 0) -> bytes:
+    return bytes((i * 7 + seed * 13 + (i >> 8)) & 0xff for i in range(size))
+
+def fail_once(sim: SimDevice, code_addr: int) -> None:
+    '''Corrupts a byte of CODE RAM right after the first write that touches it'''
+
+    on_bar0_write = sim.on_bar0_write
+    state = {'failed': False}
+    def hook(reg: int, data: bytes) -> None:
+        before = sim.code[code_addr]
+        on_bar0_write(reg, data)
+        if not state['failed'] and sim.code[code_addr] != before:
+            sim.code[code_addr] ^= 0xff
+            state['failed'] = True
+    sim.on_bar0_write = hook  # type: ignore[method-assign]
+
+def fail_always(sim: SimDevice, code_addr: int) -> None:
+    '''Makes a byte of CODE RAM stuck at 0x5a'''
+
+    on_bar0_write = sim.on_bar0_write
+    def hook(reg: int, data: bytes) -> None:
+        on_bar0_write(reg, data)
+        sim.code[code_addr] = 0x5a
+    sim.on_bar0_write = hook  # type: ignore[method-assign]
+
+
+def test_verify_retries_failed_block(sim2):
+    dev = sim2.asm_dev()
+    code = image(0x1000, 2)
+    fail_once(sim2, 0x345)
+    dev.hw_code_write(0, code)
+
+    assert sim2.code[:len(code)] == code
+
+def test_verify_gives_up(sim2):
+    dev = sim2.asm_dev()
+    code = image(0x1000, 3)
+    fail_always(sim2, 0x345)
+    with pytest.raises(VerifyError) as error:
+        dev.hw_code_write(0, code, retries=2)
+
+    assert error.value.mismatches == {0x345 // AsmDev.CODE_BLOCK_SIZE: [0x344]}
+    # CODE write access is disabled again.
+    assert sim2.xdata[sim2.cpu_misc] & 1 == 0
+
+def test_verify_upper_bank(sim2):
+    # Reads return the words of all four banks at once, so check that a
+    # mismatch is reported in the right one.
+    dev = sim2.asm_dev()
+    code = image(0x18000, 4)
+    fail_always(sim2, 0x14001)
+    with pytest.raises(VerifyError) as error:
+        dev.hw_code_write(0, code, retries=0)
+
+    assert error.value.mismatches == {0x14000 // AsmDev.CODE_BLOCK_SIZE: [0x14000]}
+
+def test_verify_none_skips_readback(sim2):
+    dev = sim2.asm_dev()
+    code = image(0x1000, 4)
+    fail_always(sim2, 0x345)
+    dev.hw_code_write(0, code, verify="none")
+
+    assert sim2.code[0x345] == 0x5a
+
+def test_sampled_verify_is_deterministic(sim2):
+    code = image(0x4000, 5)
+    operations = []
+    for _ in range(2):
+        sim2.operations = 0
+        sim2.asm_dev().hw_code_write(0, code, verify="sampled")
+        operations.append(sim2.operations)
+
+    sim2.operations = 0
+    sim2.asm_dev().hw_code_write(0, code, verify="full")
+
+    assert operations[0] == operations[1]
+    assert operations[0] < sim2.operations
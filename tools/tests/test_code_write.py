@@ -0,0 +1,65 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from asm_tool import code_schedule
+
+
+def image(size: int, seed: int = 0) -> bytes:
+    return bytes((i * 7 + seed * 13 + (i >> 8)) & 0xff for i in range(size))
+
+
+def test_load_full_image(sim):
+    dev = sim.asm_dev()
+    code = image(0x10000 if dev.hw_code_and_mmio == 1 else 0x18000)
+    dev.hw_code_load_exec(code)
+
+    assert sim.code[:len(code)] == code
+    # The CPU was released from reset, running from CODE RAM.
+    assert sim.xdata[sim.cpu_exec_ctrl] == 0
+    assert sim.xdata[sim.cpu_mode_current] & 1
+
+def test_write_at_offset(sim):
+    dev = sim.asm_dev()
+    code = image(0x300, 1)
+    dev.hw_code_write(0x7f00, code)
+
+    assert sim.code[0x7f00:0x8200] == code
+    assert not any(sim.code[:0x7f00])
+    assert not any(sim.code[0x8200:0x10000])
+
+def test_write_invalid(sim):
+    dev = sim.asm_dev()
+    with pytest.raises(ValueError):
+        dev.hw_code_write(1, bytes(2))
+    with pytest.raises(ValueError):
+        dev.hw_code_write(0, bytes(3))
+    with pytest.raises(ValueError):
+        dev.hw_code_write(0xfffe, bytes(0x18002))
+    with pytest.raises(ValueError):
+        dev.hw_code_write(0, bytes(2), verify="sometimes")
+
+def test_schedule_type1():
+    code = image(0x10000)
+    schedule = code_schedule(1, 0, code)
+
+    assert len(schedule.data) == 0x8000
+    assert schedule.code_addrs[0x4000] == 0x8000
+    # Bit 15 selects the data register, not the address.
+    assert schedule.ram_addrs[0x4000] == 0x0000
+    assert schedule.data[1] == int.from_bytes(code[2:4], 'little')
+
+def test_schedule_type2():
+    code = image(0x18000)
+    schedule = code_schedule(2, 0, code)
+
+    # Each transfer writes a word in each half of a 64 kB bank.
+    assert len(schedule.data) == 0x8000
+    assert list(schedule.ram_addrs) == list(range(0, 0x10000, 2))
+    assert schedule.data[1] == int.from_bytes(code[2:4] + code[0x8002:0x8004], 'little')
+    # The upper half of the second bank is past the end of the image.
+    assert schedule.code_addrs[0x4001] == 0x10002
+    assert schedule.data[0x4001] == int.from_bytes(code[0x10002:0x10004], 'little')
+
+    with pytest.raises(ValueError):
+        code_schedule(3, 0, code)
@@ -0,0 +1,75 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import array
+import os
+
+import pytest
+
+from asm_tool import BusError, PciDev
+
+
+def config_file(sim) -> str:
+    return os.path.join(sim.sysfs_dir, sim.dbsf, "config")
+
+
+def test_config_read(sim):
+    pci = sim.pci()
+    data = os.urandom(0x40)
+    with open(config_file(sim), "r+b") as f:
+        f.seek(0x40)
+        f.write(data)
+
+    assert pci.config_read(0x40, 0x40) == data
+    assert pci.config_read(0x7f, 1) == data[-1:]
+    assert pci.config_read(0, 0) == b""
+    # Single register reads see the same bytes.
+    assert pci.config_reg_read(0x44, 4) == int.from_bytes(data[4:8], 'little')
+
+def test_config_write(sim):
+    pci = sim.pci()
+    data = os.urandom(0x20)
+    pci.config_write(0x100, data)
+
+    assert open(config_file(sim), "rb").read()[0x100:0x120] == data
+
+def test_config_range(sim):
+    pci = sim.pci()
+    with pytest.raises(ValueError):
+        pci.config_read(PciDev.CONFIG_SPACE_SIZE - 1, 2)
+    with pytest.raises(ValueError):
+        pci.config_read(-1, 1)
+    with pytest.raises(ValueError):
+        pci.config_write(PciDev.CONFIG_SPACE_SIZE, b"\0")
+
+def test_config_arrays(sim):
+    pci = sim.pci()
+    values = array.array('I', [0x12345678, 0x9abcdef0, 0, 0xffffffff])
+    pci.config_write_array(0x200, values)
+
+    assert open(config_file(sim), "rb").read()[0x200:0x210] == bytes.fromhex("78563412f0debc9a00000000ffffffff")
+    assert pci.config_read_array(0x200, 4, 4) == values
+    assert pci.config_read_array(0x200, 2, 2).tolist() == [0x5678, 0x1234]
+
+    with pytest.raises(ValueError):
+        pci.config_read_array(0x201, 1, 2)
+    with pytest.raises(ValueError):
+        pci.config_read_array(0x200, 1, 3)
+    with pytest.raises(ValueError):
+        pci.config_write_array(0x202, values)
+
+def test_snapshot(sim):
+    pci = sim.pci()
+    snapshot = pci.snapshot()
+
+    assert len(snapshot) == PciDev.CONFIG_SPACE_SIZE
+    assert snapshot == open(config_file(sim), "rb").read()
+    assert snapshot[0:4] == sim.vid.to_bytes(2, 'little') + sim.did.to_bytes(2, 'little')
+
+def test_short_config_space(sim):
+    # Conventional PCI devices only have 256 bytes of config space.
+    os.truncate(config_file(sim), 0x100)
+    pci = sim.pci()
+
+    assert len(pci.snapshot()) == 0x100
+    with pytest.raises(BusError):
+        pci.config_read(0xf0, 0x20)
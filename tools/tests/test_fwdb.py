@@ -0,0 +1,118 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import argparse
+import os
+import pathlib
+
+import pytest
+
+from fw_images import brom_image, config_word, xhc_image
+
+# fwdb uses validate_fw, which exits if the Kaitai Struct parsers haven't been
+# generated.
+pytest.importorskip("asm_fw")
+pytest.importorskip("prom_fw")
+
+import fwdb
+
+
+DATA_DIR = str(pathlib.Path(__file__).resolve().parents[2] / "data")
+
+VERSION_1142 = bytes.fromhex("161121000001")
+VERSION_2142 = bytes.fromhex("170825000003")
+VERSION_2142_NEW = bytes.fromhex("200421000004")
+
+
+def query_args(**kwargs):
+    args = dict(chip=None, kind=None, newer_than=None, older_than=None, writes=None, invalid=False, signed=None)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+def paths(rows):
+    return [os.path.basename(row[0]) for row in rows]
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    images = tmp_path / "images"
+    (images / "sub").mkdir(parents=True)
+    (images / "asm1142.bin").write_bytes(xhc_image(b"2114A_RCFG", VERSION_1142))
+    (images / "asm2142-old.bin").write_bytes(xhc_image(b"2214A_RCFG", VERSION_2142,
+        config_words=config_word(0x5042, 1, 0x01)))
+    (images / "sub" / "asm2142-new.bin").write_bytes(xhc_image(b"2214A_RCFG", VERSION_2142_NEW, seed=1))
+    (images / "sub" / "copy.bin").write_bytes(xhc_image(b"2114A_RCFG", VERSION_1142))
+    (images / "brom.bin").write_bytes(brom_image(b"2214A_FW", VERSION_2142))
+    (images / "garbage.bin").write_bytes(b"not a firmware image")
+
+    bad = bytearray(xhc_image(b"2114A_RCFG", VERSION_1142, seed=2))
+    bad[0x100] ^= 1
+    (images / "bad.bin").write_bytes(bad)
+
+    return images
+
+
+def test_scan(tree, tmp_path, capsys):
+    db = fwdb.connect(str(tmp_path / "fwdb.sqlite"))
+    fwdb.scan(db, [str(tree)], DATA_DIR, 2, False)
+    assert "Scanned 7 files" in capsys.readouterr().err
+
+    files = dict(db.execute("SELECT path, error FROM files"))
+    assert len(files) == 7
+    assert files[str(tree / "garbage.bin")] is not None
+    assert [error for path, error in files.items() if not path.endswith("garbage.bin")] == [None] * 6
+
+    # Copies of the same image are only stored once.
+    assert db.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 5
+    assert db.execute("SELECT kind, chip, version FROM images WHERE kind = 'brom'").fetchall() == [
+        ("brom", "ASM2142/ASM3142", "170825_00_00_03")]
+    assert db.execute("SELECT addr, size, value, register FROM config_writes").fetchall() == [
+        (0x15042, 1, 0x01, "CPU_EXEC_CTRL")]
+
+def test_rescan_only_parses_changes(tree, tmp_path, capsys):
+    db = fwdb.connect(str(tmp_path / "fwdb.sqlite"))
+    fwdb.scan(db, [str(tree)], DATA_DIR, 2, False)
+    capsys.readouterr()
+
+    fwdb.scan(db, [str(tree)], DATA_DIR, 2, False)
+    assert "0 new or changed (0 failed to parse), 7 unchanged, 0 removed" in capsys.readouterr().err
+
+    (tree / "asm1142.bin").write_bytes(xhc_image(b"2114A_RCFG", VERSION_1142, seed=3))
+    os.utime(tree / "asm1142.bin", ns=(0, 0))
+    os.remove(tree / "sub" / "copy.bin")
+    fwdb.scan(db, [str(tree)], DATA_DIR, 2, False)
+    assert "1 new or changed (0 failed to parse), 5 unchanged, 0 removed" in capsys.readouterr().err
+
+    # Without pruning, the deleted file is still listed.
+    assert "copy.bin" in paths(fwdb.query(db, query_args(chip="ASM1142")))
+
+    fwdb.scan(db, [str(tree)], DATA_DIR, 2, True)
+    assert "0 new or changed (0 failed to parse), 6 unchanged, 1 removed" in capsys.readouterr().err
+    assert paths(fwdb.query(db, query_args(chip="ASM1142"))) == ["asm1142.bin", "bad.bin"]
+
+def test_schema_version_rebuilds(tree, tmp_path):
+    db_path = str(tmp_path / "fwdb.sqlite")
+    db = fwdb.connect(db_path)
+    fwdb.scan(db, [str(tree)], DATA_DIR, 1, False)
+    with db:
+        db.execute("PRAGMA user_version = 0")
+    db.close()
+
+    db = fwdb.connect(db_path)
+    assert db.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+
+def test_query(tree, tmp_path):
+    db = fwdb.connect(str(tmp_path / "fwdb.sqlite"))
+    fwdb.scan(db, [str(tree)], DATA_DIR, 2, False)
+
+    assert paths(fwdb.query(db, query_args())) == [
+        "asm1142.bin", "bad.bin", "copy.bin", "asm2142-old.bin", "brom.bin", "asm2142-new.bin"]
+    assert paths(fwdb.query(db, query_args(chip="ASM3142", kind="xhc"))) == ["asm2142-old.bin", "asm2142-new.bin"]
+    assert paths(fwdb.query(db, query_args(kind="brom"))) == ["brom.bin"]
+    assert paths(fwdb.query(db, query_args(chip="ASM2142", newer_than="170825_00_00_03"))) == ["asm2142-new.bin"]
+    assert paths(fwdb.query(db, query_args(chip="ASM2142", older_than="200421_00_00_04", kind="xhc"))) == ["asm2142-old.bin"]
+    assert paths(fwdb.query(db, query_args(invalid=True))) == ["bad.bin"]
+    assert paths(fwdb.query(db, query_args(signed=1))) == []
+    assert paths(fwdb.query(db, query_args(writes=["CPU_EXEC_CTRL"]))) == ["asm2142-old.bin"]
+    assert paths(fwdb.query(db, query_args(writes=["0x15042"]))) == ["asm2142-old.bin"]
+    assert paths(fwdb.query(db, query_args(writes=["0x15043"]))) == []
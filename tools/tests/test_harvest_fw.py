@@ -0,0 +1,143 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import gzip
+import hashlib
+import io
+import lzma
+import tarfile
+import zipfile
+
+import harvest_fw
+from fw_images import brom_image, promontory_image, xhc_image
+
+
+VERSION_1142 = bytes.fromhex("161121000001")
+VERSION_2142 = bytes.fromhex("170825000003")
+VERSION_PROM = bytes.fromhex("180312000002")
+
+XHC_1142 = xhc_image(b"2114A_RCFG", VERSION_1142)
+XHC_2142 = xhc_image(b"2214A_RCFG", VERSION_2142)
+PROM = promontory_image(VERSION_PROM)
+BROM = brom_image(b"2114A_FW", VERSION_1142)
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+def make_tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def found(path):
+    return [(source[1:], image.kind, image.version) for source, image, _ in harvest_fw.harvest_file(str(path))]
+
+
+def test_plain_file(tmp_path):
+    path = tmp_path / "flash.bin"
+    path.write_bytes(bytes(0x100) + XHC_1142 + b"\xff" * 0x100 + PROM)
+
+    results = list(harvest_fw.harvest_file(str(path)))
+    assert [(source, image.offset, image.kind) for source, image, _ in results] == [
+        ([str(path)], 0x100, "xhc"),
+        ([str(path)], 0x200 + len(XHC_1142), "promontory"),
+    ]
+    assert [data for _, _, data in results] == [XHC_1142, PROM]
+
+def test_nested_archives(tmp_path):
+    inner_zip = make_zip([("fw/2142.bin", XHC_2142)])
+    tar = make_tar([
+        ("update/1142.bin", bytes(0x10) + XHC_1142),
+        ("update/inner.zip", inner_zip),
+        ("update/brom.xz", lzma.compress(BROM)),
+    ])
+    path = tmp_path / "update.tar.gz"
+    path.write_bytes(gzip.compress(tar))
+
+    assert found(path) == [
+        (["(gzip)", "update/1142.bin"], "xhc", "161121_00_00_01"),
+        (["(gzip)", "update/inner.zip", "fw/2142.bin"], "xhc", "170825_00_00_03"),
+        (["(gzip)", "update/brom.xz", "(xz)"], "brom", "161121_00_00_01"),
+    ]
+
+def test_self_extracting_archive(tmp_path):
+    path = tmp_path / "setup.exe"
+    path.write_bytes(b"MZ" + bytes(0x100) + XHC_1142 + make_zip([("prom.bin", PROM)]))
+
+    assert sorted(found(path)) == [
+        ([], "xhc", "161121_00_00_01"),
+        (["prom.bin"], "promontory", "180312_00_00_02"),
+    ]
+
+def test_corrupt_members_are_skipped(tmp_path, capsys):
+    truncated_gzip = gzip.compress(bytes(0x100) + XHC_2142)[:-0x100]
+    path = tmp_path / "drivers.zip"
+    path.write_bytes(make_zip([
+        ("a/bad.zip", b"PK\x03\x04" + bytes(0x100)),
+        ("b/truncated.gz", truncated_gzip),
+        ("c/bad.tar", make_tar([("fw.bin", XHC_1142)])[:0x300]),
+        ("d/fw.bin", XHC_1142),
+    ]))
+
+    assert found(path) == [(["d/fw.bin"], "xhc", "161121_00_00_01")]
+
+    err = capsys.readouterr().err
+    assert "Warning: Skipping {} > a/bad.zip: BadZipFile: ".format(path) in err
+    assert "Warning: Skipping {} > b/truncated.gz > (gzip): EOFError: ".format(path) in err
+    assert "Warning: Skipping {} > c/bad.tar: ".format(path) in err
+
+def test_max_depth(tmp_path, monkeypatch):
+    monkeypatch.setattr(harvest_fw, "MAX_DEPTH", 1)
+    path = tmp_path / "fw.tar"
+    path.write_bytes(make_tar([("inner.tar", make_tar([("fw.bin", XHC_1142)]))]))
+
+    # The innermost archive isn't opened, but the image is still found (by
+    # carving the archive).
+    assert found(path) == [(["inner.tar"], "xhc", "161121_00_00_01")]
+
+def test_harvest_input(tmp_path):
+    output_dir = tmp_path / "harvested"
+    first = tmp_path / "first.zip"
+    first.write_bytes(make_zip([("a.bin", XHC_1142), ("b.bin", XHC_1142)]))
+    second = tmp_path / "second.bin"
+    second.write_bytes(XHC_1142 + PROM)
+
+    entries, error = harvest_fw.harvest_input(str(first), str(output_dir))
+    assert error is None
+    assert [(entry['source'], entry['new']) for entry in entries] == [
+        ([str(first), "a.bin"], True),
+        ([str(first), "b.bin"], False),
+    ]
+
+    entries, error = harvest_fw.harvest_input(str(second), str(output_dir))
+    assert error is None
+    assert [(entry['kind'], entry['offset'], entry['new']) for entry in entries] == [
+        ("xhc", 0, False),
+        ("promontory", len(XHC_1142), True),
+    ]
+
+    # Images are stored once each, named by their hash.
+    stored = {path.stem: path.read_bytes() for path in output_dir.glob("images/*/*.bin")}
+    assert stored == {hashlib.sha256(data).hexdigest(): data for data in (XHC_1142, PROM)}
+
+def test_harvest_input_error(tmp_path):
+    entries, error = harvest_fw.harvest_input(str(tmp_path / "missing.bin"), str(tmp_path / "harvested"))
+    assert entries == []
+    assert error.startswith("FileNotFoundError: ")
+
+def test_find_inputs(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "2.bin").write_bytes(b"")
+    (tmp_path / "b" / "1.bin").write_bytes(b"")
+    (tmp_path / "a.bin").write_bytes(b"")
+
+    assert harvest_fw.find_inputs([str(tmp_path), "other.bin"]) == [
+        str(tmp_path / "a.bin"), str(tmp_path / "b" / "1.bin"), str(tmp_path / "b" / "2.bin"), "other.bin"]
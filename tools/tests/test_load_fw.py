@@ -0,0 +1,56 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import io
+import os
+
+import load_fw
+
+
+def crash(*args) -> None:
+    os._exit(1)
+
+
+def test_prefixed_output():
+    stream = io.StringIO()
+    output = load_fw.PrefixedOutput(stream, "[0000:01:00.0] ")
+    print("Loading...", file=output)
+    output.write("partial")
+    assert stream.getvalue() == "[0000:01:00.0] Loading...\n"
+
+    output.write(" line\nlast\n")
+    assert stream.getvalue() == "[0000:01:00.0] Loading...\n[0000:01:00.0] partial line\n[0000:01:00.0] last\n"
+
+def test_load_all(sim2, monkeypatch, capfd, tmp_path):
+    monkeypatch.setattr(load_fw, "AsmDev", lambda dbsf, verbose=False: sim2.asm_dev(verbose=verbose))
+    firmware = tmp_path / "fw.bin"
+    firmware.write_bytes(bytes(range(256)))
+
+    assert load_fw.load_all([sim2.dbsf], str(firmware), True, "full", 1, True, True)
+
+    # Progress and verbose output from the worker are prefixed with the device.
+    out = capfd.readouterr().out
+    assert "[{}] ASM2142/ASM3142: Loading 256 bytes...\n".format(sim2.dbsf) in out
+    assert "[{}] AsmDev.hw_code_load_exec: CODE RAM contents unknown, loading the whole image.\n".format(sim2.dbsf) in out
+    assert "[{}] ASM2142/ASM3142: Loaded 256 bytes".format(sim2.dbsf) in out
+    assert "[{}]   Config space: ".format(sim2.dbsf) in out
+    assert "Loaded 1 of 1 devices" in out
+
+def test_load_all_error(sim2, monkeypatch, capfd, tmp_path):
+    monkeypatch.setattr(load_fw, "AsmDev", lambda dbsf, verbose=False: sim2.asm_dev(verbose=verbose))
+
+    assert not load_fw.load_all([sim2.dbsf], str(tmp_path / "missing.bin"), False, "full", 1, False, False)
+
+    out = capfd.readouterr().out
+    assert "[{}] ASM2142/ASM3142: Error: FileNotFoundError: ".format(sim2.dbsf) in out
+    assert "Loaded 0 of 1 devices" in out
+
+def test_load_all_worker_crash(monkeypatch, capfd, tmp_path):
+    monkeypatch.setattr(load_fw, "load_device", crash)
+
+    # A dead worker is reported as a failure of its device, instead of
+    # stopping the run.
+    assert not load_fw.load_all(["0000:01:00.0"], str(tmp_path / "fw.bin"), False, "full", 1, False, False)
+
+    out = capfd.readouterr().out
+    assert "[0000:01:00.0] UNKNOWN: Error: BrokenProcessPool: " in out
+    assert "Loaded 0 of 1 devices" in out
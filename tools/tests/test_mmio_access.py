@@ -0,0 +1,73 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+
+import pytest
+
+from asm_sim import SimDevice
+from asm_tool import AccessTrace, AsmDev
+
+
+def test_range(sim):
+    dev = sim.asm_dev()
+    data = os.urandom(16)
+    dev.hw_mmio_write_range(0xE300, data, confirm=True)
+
+    assert sim.xdata[sim.mmio_base+0xE300:sim.mmio_base+0xE310] == data
+    assert dev.hw_mmio_read_range(0xE300, 16) == data
+    assert dev.hw_mmio_read_range(0xE300, 0) == b""
+
+def test_reg(sim):
+    dev = sim.asm_dev()
+    dev.hw_mmio_reg_write(0xE304, 4, 0x12345678, confirm=True)
+
+    assert sim.xdata[sim.mmio_base+0xE304:sim.mmio_base+0xE308] == bytes.fromhex("78563412")
+    assert dev.hw_mmio_reg_read(0xE304, 4) == 0x12345678
+    assert dev.hw_mmio_reg_read(0xE306, 2) == 0x1234
+
+    # Values are truncated to the width of the register.
+    dev.hw_mmio_reg_write(0xE308, 1, 0x1ab)
+    assert sim.xdata[sim.mmio_base+0xE308] == 0xab
+
+    with pytest.raises(ValueError):
+        dev.hw_mmio_reg_read(0xE300, 3)
+
+def test_address_wraps(sim):
+    dev = sim.asm_dev()
+    sim.xdata[sim.mmio_base+0xffff] = 0x11
+    sim.xdata[sim.mmio_base+0x0000] = 0x22
+
+    assert dev.hw_mmio_read_range(0xffff, 2) == b"\x11\x22"
+
+def test_type2_read_sequence(sim2, tmp_path):
+    dev = sim2.asm_dev()
+    dev.trace = AccessTrace()
+    sim2.xdata[0x1E300:0x1E302] = b"\xaa\x55"
+    dev.hw_mmio_read_range(0xE300, 2)
+
+    dev.trace.save(str(tmp_path / "trace.bin"))
+    _, _, records = AccessTrace.load(str(tmp_path / "trace.bin"))
+    accesses = [(record.kind, record.addr, record.length) for record in records]
+
+    # Every byte waits for STATUS to report the read as complete before
+    # reading the data, with separate accesses.
+    wait_idle = (AccessTrace.BAR0_READ, AsmDev.MMIO_ACCESS_STATUS_BAR0, 1)
+    assert accesses == [
+        (AccessTrace.MMIO_START, 0xE300, 2),
+        wait_idle,
+        (AccessTrace.BAR0_WRITE, AsmDev.MMIO_ACCESS_ADDR_BAR0, 2),
+        wait_idle,
+        (AccessTrace.BAR0_READ, AsmDev.MMIO_ACCESS_READ_DATA_BAR0, 1),
+        (AccessTrace.BAR0_WRITE, AsmDev.MMIO_ACCESS_ADDR_BAR0, 2),
+        wait_idle,
+        (AccessTrace.BAR0_READ, AsmDev.MMIO_ACCESS_READ_DATA_BAR0, 1),
+        (AccessTrace.MMIO_READ, 0xE300, 2),
+    ]
+
+def test_unsupported():
+    with SimDevice(0x1b21, 0x1042) as sim:
+        dev = sim.asm_dev()
+        with pytest.raises(ValueError):
+            dev.hw_mmio_read_range(0, 1)
+        with pytest.raises(ValueError):
+            dev.hw_mmio_reg_write(0, 1, 0)
@@ -0,0 +1,82 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import time
+
+import pytest
+
+import asm_tool
+from asm_tool import AccessStats, AsmDev, PollTimeout, poll
+
+
+def counter():
+    reads = []
+    def read() -> int:
+        reads.append(len(reads))
+        return len(reads)
+    return read, reads
+
+
+def test_poll_done_immediately():
+    stats = AccessStats()
+    read, reads = counter()
+
+    assert poll(read, lambda value: value >= 1, "nothing", stats=stats) == 1
+    assert len(reads) == 1
+    assert (stats.poll_reads.count, stats.poll_reads.total) == (1, 1)
+    assert stats.poll_sleep_ns == 0
+
+def test_poll_spins_then_sleeps():
+    stats = AccessStats()
+    read, reads = counter()
+    done_at = asm_tool.POLL_SPIN + 5
+
+    assert poll(read, lambda value: value >= done_at, "nothing", stats=stats) == done_at
+    assert len(reads) == done_at
+    assert stats.poll_reads.total == done_at
+    # Only the reads after the spin sleep first.
+    assert stats.poll_sleep_ns > 0
+    assert stats.poll_timeouts == 0
+
+def test_poll_timeout():
+    stats = AccessStats()
+    start = time.monotonic()
+    with pytest.raises(PollTimeout, match="Timed out after 0.05 seconds waiting for the answer, last read: 0x2a"):
+        poll(lambda: 42, lambda value: False, "the answer", 0.05, stats)
+    elapsed = time.monotonic() - start
+
+    assert 0.05 <= elapsed < 1
+    assert stats.poll_timeouts == 1
+    assert stats.poll_reads.count == 1
+    assert stats.poll_reads.total > asm_tool.POLL_SPIN
+
+def test_stuck_code_ram_addr(sim):
+    dev = sim.asm_dev()
+    dev.pci.poll_timeout = 0.01
+
+    # CODE RAM data writes are dropped, so CODE_RAM_ADDR never increments.
+    data_regs = (AsmDev.CODE_RAM_DATA_LOWER_BANK_DATA, AsmDev.CODE_RAM_DATA_UPPER_BANK_DATA, AsmDev.CODE_RAM_WRITE_DATA_BAR0)
+    for name in ("on_config_write", "on_bar0_write"):
+        def hook(reg: int, data: bytes, handler=getattr(sim, name)) -> None:
+            if reg not in data_regs:
+                handler(reg, data)
+        setattr(sim, name, hook)
+
+    with pytest.raises(PollTimeout, match="CODE_RAM_ADDR to increment from 0x0000"):
+        dev.hw_code_write(0, bytes(0x100))
+
+    # CODE write access is disabled again.
+    assert not sim.xdata[sim.cpu_misc]
+
+def test_wedged_mmio_interface(sim2):
+    dev = sim2.asm_dev()
+    dev.pci.poll_timeout = 0.01
+
+    # The MMIO access interface never becomes idle.
+    on_bar0_write = sim2.on_bar0_write
+    def hook(reg: int, data: bytes) -> None:
+        on_bar0_write(reg, data)
+        sim2._bar0[AsmDev.MMIO_ACCESS_STATUS_BAR0] = 0x80
+    sim2.on_bar0_write = hook  # type: ignore[method-assign]
+
+    with pytest.raises(PollTimeout, match="MMIO access interface"):
+        dev.hw_mmio_reg_read(0xE300, 1)
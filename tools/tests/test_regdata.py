@@ -0,0 +1,115 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import marshal
+
+import pytest
+
+import regdata
+
+
+DOC = """\
+meta:
+  chip: TEST
+registers:
+  xdata:
+    - name: CTRL
+      start: 0x100
+      end: 0x101
+      bits:
+        - name: ENABLE
+          start: 0
+          end: 0
+"""
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path / "cache" / "asmedia-xhc-re"
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "regs-test.yaml"
+    path.write_text(DOC)
+    return path
+
+def no_parse(monkeypatch):
+    def parse(raw: bytes) -> dict:
+        raise AssertionError("The file was parsed again.")
+    monkeypatch.setattr(regdata, "parse", parse)
+
+
+def test_load(cache_dir, data_file):
+    doc = regdata.load(data_file)
+    assert doc['registers']['xdata'][0]['bits'][0]['name'] == "ENABLE"
+    assert len(list(cache_dir.glob("regs-*.marshal"))) == 1
+
+def test_cache_hit(cache_dir, data_file, monkeypatch):
+    doc = regdata.load(data_file)
+    no_parse(monkeypatch)
+    assert regdata.load(data_file) == doc
+
+def test_changed_file(cache_dir, data_file):
+    regdata.load(data_file)
+    data_file.write_text(DOC.replace("CTRL", "CONTROL"))
+
+    assert regdata.load(data_file)['registers']['xdata'][0]['name'] == "CONTROL"
+    assert len(list(cache_dir.glob("regs-*.marshal"))) == 2
+
+def test_python_version_in_key(cache_dir, data_file, monkeypatch):
+    regdata.load(data_file)
+    monkeypatch.setattr(regdata, "marshal_tag", lambda: b"py0.0-marshal0")
+    regdata.load(data_file)
+
+    # Another version of Python doesn't share the cache entry.
+    assert len(list(cache_dir.glob("regs-*.marshal"))) == 2
+
+@pytest.mark.parametrize("contents", [b"", b"\xff garbage", marshal.dumps([1, 2, 3])], ids=["empty", "garbage", "not-dict"])
+def test_bad_cache_entry(cache_dir, data_file, contents):
+    doc = regdata.load(data_file)
+    cache_path, = cache_dir.glob("regs-*.marshal")
+    cache_path.write_bytes(contents)
+
+    # A bad entry is treated as a miss, and replaced.
+    assert regdata.load(data_file) == doc
+    assert marshal.loads(cache_path.read_bytes()) == doc
+
+def test_no_cache(cache_dir, data_file):
+    regdata.load(data_file, use_cache=False)
+    assert not cache_dir.exists()
+
+def test_unwritable_cache(tmp_path, data_file, monkeypatch):
+    # The cache directory can't be created, since a file is in the way.
+    (tmp_path / "cache").write_text("")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    assert regdata.load(data_file)['meta']['chip'] == "TEST"
+
+def test_invalid(cache_dir, data_file):
+    data_file.write_text(DOC + "extra: 1\n")
+    with pytest.raises(regdata.SchemaError, match="extra"):
+        regdata.load(data_file)
+
+    # Invalid documents aren't cached.
+    assert not list(cache_dir.glob("regs-*.marshal"))
+
+@pytest.mark.parametrize("doc", [
+    [],
+    {'xdata': {}},
+    {'registers': {'xdata': [{'name': "A", 'size': 1}]}},
+    {'registers': {'xdata': [{'name': "A", 'bits': [{'name': "B", 'width': 1}]}]}},
+])
+def test_validate(doc):
+    with pytest.raises(regdata.SchemaError):
+        regdata.validate(doc)
+
+def test_main(cache_dir, data_file, tmp_path, monkeypatch, capsys):
+    bad_file = tmp_path / "regs-bad.yaml"
+    bad_file.write_text("registers: []\n")
+    monkeypatch.setattr("sys.argv", ["regdata.py", str(data_file), str(bad_file)])
+
+    assert regdata.main() == 1
+    assert capsys.readouterr().out.splitlines() == [
+        "{}: OK".format(data_file),
+        "{}: Error: \"registers\" is not a dict.".format(bad_file),
+    ]
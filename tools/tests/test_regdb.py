@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pathlib
+
+import pytest
+
+from regdb import RegisterDb
+
+
+DATA_DIR = pathlib.Path(__file__).resolve().parents[2] / "data"
+
+DOC = {
+    'meta': {'chip': "TEST"},
+    'registers': {
+        'xdata': [
+            {'name': "WIDE", 'start': 0x100, 'end': 0x107},
+            {'name': "ALIAS", 'start': 0x104, 'end': 0x105},
+            {'name': "CTRL", 'start': 0x200, 'end': 0x201, 'bits': [
+                {'name': "ENABLE", 'start': 0, 'end': 0, 'permissions': "RW"},
+                {'name': "MODE", 'start': 4, 'end': 11, 'permissions': "RW"},
+                {'name': "STATUS", 'start': 15, 'end': 15, 'permissions': "RW1C"},
+            ]},
+            {'name': "LAST", 'start': 0x300, 'end': 0x300},
+        ],
+    },
+}
+
+
+@pytest.fixture
+def db():
+    return RegisterDb(DOC)
+
+def names(registers):
+    return [reg.name for reg in registers]
+
+
+def test_lookup(db):
+    assert names(db.lookup("xdata", 0x100)) == ["WIDE"]
+    assert names(db.lookup("xdata", 0x107)) == ["WIDE"]
+    assert names(db.lookup("xdata", 0x201)) == ["CTRL"]
+    assert names(db.lookup("xdata", 0x300)) == ["LAST"]
+
+def test_lookup_miss(db):
+    assert db.lookup("xdata", 0xff) == []
+    assert db.lookup("xdata", 0x108) == []
+    assert db.lookup("xdata", 0x202) == []
+    assert db.lookup("xdata", 0x10000) == []
+    assert db.lookup("pci", 0x100) == []
+
+def test_lookup_overlapping(db):
+    # Overlapping registers are returned in the order of the YAML file.
+    assert names(db.lookup("xdata", 0x104)) == ["WIDE", "ALIAS"]
+    assert names(db.lookup("xdata", 0x106)) == ["WIDE"]
+
+def test_lookup_many(db):
+    addrs = [0x300, 0x104, 0x0, 0x200, 0x104, 0x107]
+    assert db.lookup_many("xdata", addrs) == [db.lookup("xdata", addr) for addr in addrs]
+
+def test_lookup_invalid_region(db):
+    with pytest.raises(ValueError):
+        db.lookup("code", 0)
+
+def test_fields(db):
+    ctrl, = db.lookup("xdata", 0x200)
+    assert [field.name for field in ctrl.fields_at(0x200)] == ["ENABLE", "MODE"]
+    assert [field.name for field in ctrl.fields_at(0x201)] == ["MODE", "STATUS"]
+    assert ctrl.field_at(0x201, 7).name == "STATUS"
+    assert ctrl.field_at(0x200, 1) is None
+    assert [(field.name, value) for field, value in ctrl.decode(0x8ab1)] == [("ENABLE", 1), ("MODE", 0xab), ("STATUS", 1)]
+
+def test_lookup_bit(db):
+    assert [(reg.name, field.name if field else None) for reg, field in db.lookup_bit("xdata", 0x201, 3)] == [("CTRL", "MODE")]
+
+def test_mmio_offset():
+    db = RegisterDb(DOC, 0x100)
+    assert names(db.lookup_mmio(0x0)) == ["WIDE"]
+    assert db.format_addr("xdata", 0x105, "0x0105") == "ALIAS[1] (WIDE[5] (0x0105))"
+
+def test_chip_data(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    db = RegisterDb.load(DATA_DIR / "regs-asm2142.yaml", 0x10000)
+    assert names(db.lookup_mmio(0x5042)) == ["CPU_EXEC_CTRL"]
+    assert names(db.lookup("xdata", 0x10052)) == ["PCI_CONFIG_SVID_SSID"]
@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from asm_tool import AsmDev, ShadowCache
+
+
+@pytest.fixture
+def dev(sim):
+    dev = sim.asm_dev()
+    dev.enable_shadow()
+    return dev
+
+def halt(dev: AsmDev, sim) -> None:
+    dev.hw_mmio_reg_write(sim.cpu_exec_ctrl, 1, 1 << 1)
+
+def release(dev: AsmDev, sim) -> None:
+    dev.hw_mmio_reg_write(sim.cpu_exec_ctrl, 1, 0)
+
+
+def test_only_host_registers(dev, sim):
+    names = {reg.name for reg in dev.regs.db.regions["xdata"].registers if reg.start in dev.shadow.cacheable}
+    assert names == ShadowCache.HOST_REGISTERS
+
+    # Registers the firmware or hardware can change are never cached.
+    d2h0 = dev.xdata.PCI_CONFIG_D2H0.info
+    assert not dev.shadow.cacheable.intersection(range(d2h0.start, d2h0.end + 1))
+
+def test_halted_writes_are_cached(dev, sim):
+    halt(dev, sim)
+    dev.hw_mmio_reg_write(sim.cpu_mode_next, 1, 0x03)
+
+    # The cached value is returned without reading the hardware.
+    sim.xdata[sim.cpu_mode_next] = 0xff
+    assert dev.hw_mmio_reg_read(sim.cpu_mode_next, 1) == 0x03
+    assert dev.shadow.hits == 1
+
+def test_reads_are_not_cached(dev, sim):
+    halt(dev, sim)
+    sim.xdata[sim.cpu_mode_next] = 0x01
+    assert dev.hw_mmio_reg_read(sim.cpu_mode_next, 1) == 0x01
+
+    sim.xdata[sim.cpu_mode_next] = 0x02
+    assert dev.hw_mmio_reg_read(sim.cpu_mode_next, 1) == 0x02
+    assert dev.shadow.hits == 0
+
+def test_running_cpu_is_not_cached(dev, sim):
+    # The CPU state isn't known until the host halts it.
+    dev.hw_mmio_reg_write(sim.cpu_mode_next, 1, 0x03)
+    sim.xdata[sim.cpu_mode_next] = 0x01
+    assert dev.hw_mmio_reg_read(sim.cpu_mode_next, 1) == 0x01
+
+def test_release_invalidates(dev, sim):
+    halt(dev, sim)
+    dev.hw_mmio_reg_write(sim.cpu_mode_next, 1, 0x03)
+    release(dev, sim)
+
+    # The firmware changes the register once it's running.
+    sim.xdata[sim.cpu_mode_next] = 0x01
+    assert dev.hw_mmio_reg_read(sim.cpu_mode_next, 1) == 0x01
+    assert not dev.shadow.values
+
+    # It also isn't cached again until the CPU is halted.
+    dev.hw_mmio_reg_write(sim.cpu_mode_next, 1, 0x03)
+    sim.xdata[sim.cpu_mode_next] = 0x02
+    assert dev.hw_mmio_reg_read(sim.cpu_mode_next, 1) == 0x02
+
+def test_reset_and_flush(dev, sim):
+    halt(dev, sim)
+    dev.hw_mmio_reg_write(sim.cpu_mode_next, 1, 0x03)
+    # Holding the CPU in reset keeps it halted.
+    dev.hw_mmio_reg_write(sim.cpu_exec_ctrl, 1, 1 << 0)
+    assert dev.shadow.values
+
+    dev.shadow_flush()
+    sim.xdata[sim.cpu_mode_next] = 0x02
+    assert dev.hw_mmio_reg_read(sim.cpu_mode_next, 1) == 0x02
+
+def test_confirm_reads_hardware(dev, sim):
+    halt(dev, sim)
+    dev.hw_mmio_reg_write(sim.cpu_misc, 1, 0x01, confirm=True)
+    assert dev.shadow.hits == 0
+
+def test_load(dev, sim):
+    code = bytes(range(256)) * 4
+    dev.hw_code_load_exec(code)
+    dev.hw_code_load_exec(code)
+
+    assert sim.code[:len(code)] == code
+    # The CPU_MISC read-modify-writes hit the cache while the CPU was halted,
+    # and the cache was emptied when the CPU was released.
+    assert dev.shadow.hits > 0
+    assert not dev.shadow.halted
+    assert not dev.shadow.values
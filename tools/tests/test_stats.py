@@ -0,0 +1,65 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+
+from asm_tool import AccessStats, Histogram
+
+
+def test_histogram():
+    histogram = Histogram()
+    assert histogram.mean == 0.0
+    assert histogram.percentile(99) == 0
+
+    for value in (1, 2, 3, 100, 5):
+        histogram.add(value)
+
+    assert (histogram.count, histogram.total, histogram.min, histogram.max) == (5, 111, 1, 100)
+    assert histogram.mean == 111 / 5
+    # Percentiles are the upper bound of the bucket they fall in.
+    assert histogram.percentile(50) == 3
+    assert histogram.percentile(80) == 7
+    assert histogram.percentile(100) == 100
+
+def test_config_counters(sim):
+    pci = sim.pci()
+    pci.stats = AccessStats()
+    pci.config_reg_read(0, 4)
+    pci.config_read(0x40, 0x20)
+    pci.config_reg_write(0x40, 2, 0x1234)
+    pci.config_write(0x80, bytes(8))
+
+    stats = pci.stats
+    assert (stats.config_reads, stats.config_bytes_read) == (2, 0x24)
+    assert (stats.config_writes, stats.config_bytes_written) == (2, 10)
+    assert stats.config_ns > 0
+    assert stats.bar0_reads == stats.bar0_writes == 0
+
+def test_load_stats(sim):
+    dev = sim.asm_dev()
+    dev.stats = AccessStats()
+    dev.hw_code_load_exec(bytes(0x200))
+
+    stats = dev.stats
+    assert stats.config_writes > 0
+    assert stats.poll_reads.count > 0
+    assert stats.poll_timeouts == 0
+    if dev.hw_code_and_mmio == 1:
+        # Type-1 MMIO accesses wait for the hardware to latch each byte.
+        assert stats.settle_sleep_ns > 0
+        assert stats.bar0_reads == stats.bar0_writes == 0
+    else:
+        assert stats.bar0_writes >= 0x100
+    assert stats.latency_ns["hw_code_load_exec"].count == 1
+    assert stats.latency_ns["hw_code_write"].count == 1
+    assert stats.latency_ns["hw_mmio_reg_write"].count > 0
+
+    report = stats.report()
+    assert "hw_code_load_exec: 1 calls" in report
+    # The stats can be saved as JSON.
+    assert json.loads(json.dumps(stats.to_dict()))["latency_ns"]["hw_code_write"]["count"] == 1
+
+def test_stats_disabled(sim):
+    dev = sim.asm_dev()
+    dev.hw_mmio_reg_read(0xE300, 1)
+
+    assert dev.stats is None
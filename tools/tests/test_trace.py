@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+from zlib import crc32
+
+import pytest
+
+import asm_trace
+from asm_sim import SimDevice
+from asm_tool import AccessTrace
+
+
+def load(trace: AccessTrace, path) -> list:
+    trace.save(str(path))
+    vid, did, records = AccessTrace.load(str(path))
+    assert (vid, did) == (trace.vid, trace.did)
+    return records
+
+
+def test_round_trip(tmp_path):
+    trace = AccessTrace(vid=0x1b21, did=0x2142)
+    trace.record(AccessTrace.CONFIG_READ, 0x40, 4, 0x12345678)
+    trace.record_data(AccessTrace.CONFIG_READ, 0x100, bytes(range(16)), False)
+    trace.record_data(AccessTrace.CONFIG_WRITE, 0x200, bytes(range(10)), True)
+    trace.record_data(AccessTrace.MMIO_WRITE, 0xE300, b"\xaa\xbb", True)
+
+    records = load(trace, tmp_path / "trace.bin")
+
+    assert [(r.kind, r.addr, r.length, r.value, r.data) for r in records] == [
+        (AccessTrace.CONFIG_READ, 0x40, 4, 0x12345678, None),
+        (AccessTrace.CONFIG_READ, 0x100, 16, crc32(bytes(range(16))), None),
+        (AccessTrace.CONFIG_WRITE, 0x200, 10, 0, bytes(range(10))),
+        (AccessTrace.MMIO_WRITE, 0xE300, 2, 0xbbaa, None),
+    ]
+    timestamps = [r.timestamp_ns for r in records]
+    assert timestamps == sorted(timestamps)
+
+def test_large_accesses(tmp_path):
+    trace = AccessTrace()
+    data = os.urandom(0x12346)
+    trace.record_data(AccessTrace.MMIO_READ, 0, data, False)
+    trace.record_data(AccessTrace.MMIO_WRITE, 0, data, True)
+
+    records = load(trace, tmp_path / "trace.bin")
+
+    assert [(r.kind, r.length, r.value, r.data) for r in records] == [
+        (AccessTrace.MMIO_READ, 0x12346, crc32(data), None),
+        (AccessTrace.MMIO_WRITE, 0x12346, 0, data),
+    ]
+
+def test_64k_mmio_read(sim2, tmp_path):
+    dev = sim2.asm_dev()
+    dev.trace = AccessTrace(vid=sim2.vid, did=sim2.did)
+    sim2.xdata[0x10000:0x20000] = os.urandom(0x10000)
+    data = dev.hw_mmio_read_range(0, 0x10000)
+
+    records = load(dev.trace, tmp_path / "trace.bin")
+
+    # Only the end of the access fits in the ring buffer.
+    assert records[-1][1:] == (AccessTrace.MMIO_READ, 0, 0x10000, crc32(data), None)
+
+def test_ring_buffer(tmp_path):
+    trace = AccessTrace(capacity=4)
+    for i in range(10):
+        trace.record(AccessTrace.BAR0_READ, i, 4, i)
+
+    assert [r.addr for r in load(trace, tmp_path / "trace.bin")] == [6, 7, 8, 9]
+
+def test_file(tmp_path):
+    path = str(tmp_path / "trace.bin")
+    trace = AccessTrace(capacity=4, path=path)
+    for i in range(10):
+        trace.record(AccessTrace.BAR0_WRITE, i, 4, i)
+    with pytest.raises(ValueError):
+        trace.save(str(tmp_path / "other.bin"))
+    trace.close()
+
+    # Every record is kept.
+    _, _, records = AccessTrace.load(path)
+    assert [r.addr for r in records] == list(range(10))
+
+def test_version_1(tmp_path):
+    path = tmp_path / "trace.bin"
+    header = AccessTrace.HEADER.pack(AccessTrace.MAGIC, 1, AccessTrace.RECORD_V1.size, 0x1b21, 0x1242, 0)
+    path.write_bytes(header + AccessTrace.RECORD_V1.pack(123, AccessTrace.CONFIG_WRITE, 2, 0xE8, 0xF340))
+
+    assert AccessTrace.load(str(path)) == (0x1b21, 0x1242, [(123, AccessTrace.CONFIG_WRITE, 0xE8, 2, 0xF340, None)])
+
+    path.write_bytes(b"NOTTRACE" + header[8:])
+    with pytest.raises(ValueError):
+        AccessTrace.load(str(path))
+
+@pytest.mark.parametrize("level", ["raw", "mmio"])
+def test_replay(sim, tmp_path, level):
+    dev = sim.asm_dev()
+    dev.trace = AccessTrace(vid=sim.vid, did=sim.did)
+    dev.hw_code_load_exec(bytes(range(256)) * 2)
+    dev.hw_mmio_write_range(0xE300, bytes(range(8)))
+    dev.hw_mmio_read_range(0xE300, 8)
+    records = load(dev.trace, tmp_path / "trace.bin")
+
+    # A replay on a fresh chip reads back the same values.
+    with SimDevice(sim.vid, sim.did) as replay_sim:
+        result = asm_trace.replay(replay_sim.asm_dev(), records, level)
+        assert replay_sim.code == sim.code
+        assert replay_sim.xdata == sim.xdata
+
+    assert result.mismatches == []
+    assert result.reads > 0 and result.writes > 0
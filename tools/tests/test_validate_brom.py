@@ -0,0 +1,124 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import csv
+import io
+import sys
+
+import pytest
+
+import validate_brom
+from fw_images import brom_image
+
+
+VERSION_1142 = bytes.fromhex("161121000001")
+VERSION_2142 = bytes.fromhex("170825000003")
+
+HEADER = "Chip,Version,Size (Bytes),CRC-32 (Embedded),MD5,SHA-1,SHA-256,SHA-512,BLAKE2b"
+
+
+def known_row(data, sha256=None):
+    info = validate_brom.identify(data)
+    hashes = validate_brom.digests(data)
+    if sha256 is not None:
+        hashes[validate_brom.HASH_ALGS.index(validate_brom.sha256)] = sha256
+    return validate_brom.csv_row(info, hashes)
+
+@pytest.fixture
+def dumps(tmp_path):
+    known = brom_image(b"2114A_FW", VERSION_1142)
+    unknown = brom_image(b"2214A_FW", VERSION_2142, size=0x10000)
+    mismatch = brom_image(b"2214A_FW", VERSION_2142, seed=1)
+    corrupt = bytearray(brom_image(b"2114A_FW", VERSION_1142, seed=2))
+    corrupt[0x100] ^= 1
+
+    for name, data in (("a-known.bin", known), ("b-unknown.bin", unknown), ("c-mismatch.bin", mismatch), ("d-corrupt.bin", corrupt)):
+        (tmp_path / name).write_bytes(data)
+
+    # A known BROM with the same CRC-32 as the mismatched dump, but different
+    # contents.
+    known_path = tmp_path / "known.csv"
+    known_path.write_text("\n".join([HEADER, known_row(known), known_row(mismatch, "00" * 32)]) + "\n")
+
+    return tmp_path
+
+
+def test_identify():
+    brom = brom_image(b"2214A_FW", VERSION_2142)
+    info = validate_brom.identify(brom + bytes(0x100))
+    assert info.chip == "ASM2142/ASM3142"
+    assert info.version == "170825_00_00_03"
+    assert info.size == 0x8000
+    assert info.crc32 == int.from_bytes(brom[-4:], 'little')
+
+    # The 64 kB BROM is checked after the 32 kB one.
+    assert validate_brom.identify(brom_image(b"2114A_FW", VERSION_1142, size=0x10000)).size == 0x10000
+
+    assert validate_brom.identify(brom[:-1]) is None
+    assert validate_brom.identify(bytes(0x8000)) is None
+
+def test_check_file(dumps):
+    known = validate_brom.KnownBroms.load(dumps / "known.csv")
+    statuses = [validate_brom.check_file(str(dumps / name), known)[0]
+        for name in ("a-known.bin", "b-unknown.bin", "c-mismatch.bin", "d-corrupt.bin", "missing.bin")]
+    assert statuses == ["known", "unknown", "mismatch", "corrupt", "error"]
+
+    status, info, hashes, error = validate_brom.check_file(str(dumps / "b-unknown.bin"), None)
+    assert status == "unchecked"
+    assert info.size == 0x10000
+    assert len(hashes) == len(validate_brom.HASH_ALGS)
+    assert error == ""
+
+def test_batch_csv(dumps, capsys):
+    known = validate_brom.KnownBroms.load(dumps / "known.csv")
+    paths = [str(dumps / name) for name in ("a-known.bin", "b-unknown.bin", "c-mismatch.bin", "d-corrupt.bin")]
+    assert not validate_brom.batch(paths, known, 2, True)
+
+    out, err = capsys.readouterr()
+
+    # Only the valid BROMs that aren't known are printed to stdout.
+    rows = list(csv.reader(io.StringIO(out)))
+    assert [(row[0], row[1], row[2]) for row in rows] == [
+        ("ASM2142/ASM3142", "170825_00_00_03", "65536"),
+        ("ASM2142/ASM3142", "170825_00_00_03", "32768"),
+    ]
+
+    lines = err.splitlines()
+    assert [line.split()[0] for line in lines[:4]] == ["KNOWN", "UNKNOWN", "MISMATCH", "CORRUPT"]
+    assert lines[4] == "Checked 4 files: 1 corrupt, 1 known, 1 mismatch, 1 unknown"
+
+def test_batch_ok(dumps, capsys):
+    known = validate_brom.KnownBroms.load(dumps / "known.csv")
+    paths = [str(dumps / name) for name in ("a-known.bin", "b-unknown.bin")]
+    assert validate_brom.batch(paths, known, 1, False)
+
+    out, err = capsys.readouterr()
+    assert out.startswith("KNOWN     {}: ASM1142".format(paths[0]))
+    assert err == "Checked 2 files: 1 known, 1 unknown\n"
+
+def test_find_dumps(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "2.bin").write_bytes(b"")
+    (tmp_path / "b" / "1.bin").write_bytes(b"")
+    (tmp_path / "a.bin").write_bytes(b"")
+
+    assert validate_brom.find_dumps([str(tmp_path), "other.bin"]) == [
+        str(tmp_path / "a.bin"), str(tmp_path / "b" / "1.bin"), str(tmp_path / "b" / "2.bin"), "other.bin"]
+
+@pytest.mark.parametrize("name, args, returncode", [
+    ("a-known.bin", [], 0),
+    ("b-unknown.bin", ["--csv"], 0),
+    ("c-mismatch.bin", [], 1),
+    ("c-mismatch.bin", ["--csv"], 1),
+    ("d-corrupt.bin", [], 1),
+])
+def test_main_single_file(dumps, monkeypatch, capsys, name, args, returncode):
+    monkeypatch.setattr(sys, "argv", ["validate_brom.py", "-k", str(dumps / "known.csv")] + args + [str(dumps / name)])
+    assert validate_brom.main() == returncode
+
+def test_main_batch(dumps, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["validate_brom.py", "-k", str(dumps / "known.csv"), "-j", "1",
+        str(dumps / "a-known.bin"), str(dumps / "b-unknown.bin")])
+    assert validate_brom.main() == 0
+
+    monkeypatch.setattr(sys, "argv", ["validate_brom.py", "-k", str(dumps / "known.csv"), "-j", "1", str(dumps)])
+    assert validate_brom.main() == 1
@@ -0,0 +1,114 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import csv
+import io
+import json
+import pathlib
+
+import pytest
+
+from fw_images import config_word, xhc_image
+
+# validate_fw exits if the Kaitai Struct parsers haven't been generated.
+pytest.importorskip("asm_fw")
+pytest.importorskip("prom_fw")
+
+import validate_fw
+
+
+DATA_DIR = str(pathlib.Path(__file__).resolve().parents[2] / "data")
+
+VERSION_1142 = bytes.fromhex("161121000001")
+VERSION_2142 = bytes.fromhex("170825000003")
+
+
+def write_images(tmp_path):
+    good = tmp_path / "a-good.bin"
+    good.write_bytes(xhc_image(b"2114A_RCFG", VERSION_1142))
+
+    bad = bytearray(xhc_image(b"2214A_RCFG", VERSION_2142))
+    bad[0x100] ^= 1
+    (tmp_path / "b-bad.bin").write_bytes(bad)
+
+    (tmp_path / "c-garbage.bin").write_bytes(b"not a firmware image")
+
+    return [str(tmp_path / name) for name in ("a-good.bin", "b-bad.bin", "c-garbage.bin")]
+
+
+def test_validate_file_good(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    path = tmp_path / "fw.bin"
+    path.write_bytes(xhc_image(b"2214A_RCFG", VERSION_2142, config_words=config_word(0x5042, 1, 0x01)))
+
+    result = validate_fw.validate_file(str(path), DATA_DIR, False)
+    assert result['error'] is None
+    assert result['ok']
+    assert result['kind'] == "xhc"
+    assert result['chip'] == "ASM2142/ASM3142"
+    assert result['version'] == "170825_00_00_03"
+    assert [check['ok'] for check in result['checks']] == [True] * 4
+    assert result['mmio_writes'] == [{'addr': 0x15042, 'size': 1, 'value': 0x01, 'registers': ["CPU_EXEC_CTRL[0]"]}]
+
+def test_validate_file_errors(tmp_path):
+    path = tmp_path / "garbage.bin"
+    path.write_bytes(b"not a firmware image")
+    result = validate_fw.validate_file(str(path), DATA_DIR, False)
+    assert not result['ok']
+    assert result['error']
+
+    result = validate_fw.validate_file(str(tmp_path / "missing.bin"), DATA_DIR, False)
+    assert not result['ok']
+    assert result['error'].startswith("FileNotFoundError: ")
+
+def test_batch_jsonl(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    paths = write_images(tmp_path)
+
+    output = io.StringIO()
+    assert not validate_fw.batch(paths, DATA_DIR, False, 2, "jsonl", output)
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [result['path'] for result in results] == paths
+    assert [result['ok'] for result in results] == [True, False, False]
+    assert results[0]['error'] is None
+    assert results[1]['error'] is None
+    assert [check['ok'] for check in results[1]['checks']] == [True, True, False, False]
+    assert results[2]['error'] is not None
+
+    err = capsys.readouterr().err
+    assert "Validated 3 images" in err
+    assert "1 valid, 1 with bad checksums, 1 failed to parse" in err
+    assert "  ASM1142: 1" in err
+    assert "  ASM2142/ASM3142: 1" in err
+
+def test_batch_csv(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    paths = write_images(tmp_path)
+
+    output = io.StringIO(newline="")
+    validate_fw.batch(paths, DATA_DIR, False, 2, "csv", output)
+
+    rows = list(csv.DictReader(io.StringIO(output.getvalue(), newline="")))
+    assert [row['path'] for row in rows] == paths
+    assert rows[0]['ok'] == "True"
+    assert rows[0]['code_crc32'] == "ok"
+    assert rows[1]['code_crc32'].startswith("bad (")
+    assert rows[2]['error']
+
+def test_batch_all_valid(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    paths = write_images(tmp_path)[:1]
+    assert validate_fw.batch(paths, DATA_DIR, False, 1, "jsonl", io.StringIO())
+    assert "1 valid, 0 with bad checksums, 0 failed to parse" in capsys.readouterr().err
+
+def test_find_images(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / "b" / "2.bin").write_bytes(b"")
+    (tmp_path / "b" / "1.bin").write_bytes(b"")
+    (tmp_path / "a.bin").write_bytes(b"")
+    (tmp_path / "a.txt").write_bytes(b"")
+
+    assert validate_fw.find_images([str(tmp_path / "b")]) == [str(tmp_path / "b" / "1.bin"), str(tmp_path / "b" / "2.bin")]
+    assert validate_fw.find_images([str(tmp_path / "*.bin")]) == [str(tmp_path / "a.bin")]
+    assert validate_fw.find_images([str(tmp_path / "**" / "*.bin"), str(tmp_path / "a.bin")]) == [
+        str(tmp_path / "a.bin"), str(tmp_path / "b" / "1.bin"), str(tmp_path / "b" / "2.bin")]
@@ -21,9 +21,13 @@
 import argparse
 import csv
 import io
+import os
+import pathlib
 import struct
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import md5, sha1, sha256, sha512, blake2b
+from typing import NamedTuple
 from zlib import crc32
 
 
@@ -40,52 +44,189 @@ CHIPS: dict[bytes, str] = {
 }
 
 
-def validate_crc32(data: bytes, expected: int) -> None:
-    calc_crc32: int = crc32(data)
-    if calc_crc32 != expected:
-        raise ValueError("Invalid CRC-32: expected {:#010x}, got: {:#010x}".format(expected, calc_crc32))
+# Hashes are calculated over the data in chunks of this size.
+CHUNK_SIZE: int = 1 << 16
 
-def main() -> int:
-    parser: argparse.ArgumentParser = argparse.ArgumentParser()
-    parser.add_argument("-c", "--csv", default=False, action="store_true", help="Output in CSV format.")
-    parser.add_argument("firmware", type=str, help="The ASMedia USB 3 host controller boot ROM binary.")
-    args: argparse.Namespace = parser.parse_args()
+HASH_ALGS = (md5, sha1, sha256, sha512, blake2b)
+
+BROM_SIZES: tuple[int, ...] = (0x8000, 0x10000)
+
+
+class BromInfo(NamedTuple):
+    chip: str
+    version: str
+    size: int
+    crc32: int
+
+class KnownBroms:
+    '''The known BROMs listed in brom_info.csv, indexed by CRC-32 and SHA-256'''
+
+    def __init__(self, rows: list[dict[str, str]]) -> None:
+        self.rows = rows
+        self.by_crc32: dict[int, list[dict[str, str]]] = dict()
+        self.by_sha256: dict[str, dict[str, str]] = dict()
+        for row in rows:
+            self.by_crc32.setdefault(int(row["CRC-32 (Embedded)"], 16), []).append(row)
+            self.by_sha256[row["SHA-256"].lower()] = row
+
+    @classmethod
+    def load(cls, path: str | pathlib.Path) -> "KnownBroms":
+        with open(path, newline="") as csvfile:
+            return cls(list(csv.DictReader(csvfile)))
+
+    def status(self, info: BromInfo, sha256_hex: str) -> str:
+        '''Returns "known" if the BROM is listed, "unknown" if it isn't, or "mismatch" if a BROM with the same CRC-32 but different contents is'''
 
-    fw_bytes: bytes
-    with open(args.firmware, "rb") as f:
-        fw_bytes = f.read()
+        if sha256_hex in self.by_sha256:
+            return "known"
+        if info.crc32 in self.by_crc32:
+            return "mismatch"
 
-    chip_magic: bytes = fw_bytes[0x87:0x87+8]
+        return "unknown"
+
+
+def identify(fw_bytes: bytes | memoryview) -> BromInfo | None:
+    '''Returns information about a BROM dump, or None if its CRC-32 doesn't match for either BROM size'''
+
+    chip_magic: bytes = bytes(fw_bytes[0x87:0x87+8])
     chip_name: str = CHIPS.get(chip_magic, "Unknown magic: {!r}".format(chip_magic))
 
-    for size in (0x8000, 0x10000):
-        expected: int = struct.unpack_from('<I', fw_bytes, size-4)[0]
-
-        try:
-            validate_crc32(fw_bytes[:size-4], expected)
-
-            version_bytes: bytes = fw_bytes[0x80:0x80+6]
-            version_string: str = "{:02X}{:02X}{:02X}_{:02X}_{:02X}_{:02X}".format(*version_bytes)
-            if args.csv:
-                hashes: list[str] = []
-                for hash_alg in (md5, sha1, sha256, sha512, blake2b):
-                    # Calculate hashes on the 32 kB / 64 kB BROM (includes the CRC-32)
-                    hashes.append(hash_alg(fw_bytes[:size], usedforsecurity=False).hexdigest())
-                with io.StringIO(newline="") as csvfile:
-                    csvwriter = csv.writer(csvfile)
-                    csvwriter.writerow([chip_name, version_string, size, "0x{:08X}".format(expected)] + hashes)
-                    print(csvfile.getvalue().rstrip())
-            else:
-                print("BROM CRC-32 OK! Chip name: {}, BROM version: {}, BROM size: {} bytes, BROM CRC-32: 0x{:08X}".format(
-                    chip_name, version_string, size, expected))
-
-            return 0
-        except ValueError:
-            pass
-
-    print("Error: Failed to validate BROM CRC-32.", file=sys.stderr)
-
-    return 1
+    # The 32 kB BROM's data is a prefix of the 64 kB one's, so continue the
+    # same CRC-32 instead of starting over for each size.
+    view: memoryview = memoryview(fw_bytes)
+    calc_crc32: int = 0
+    done: int = 0
+    for size in BROM_SIZES:
+        if len(view) < size:
+            break
+
+        calc_crc32 = crc32(view[done:size-4], calc_crc32)
+        done = size - 4
+
+        expected: int = struct.unpack_from('<I', view, size-4)[0]
+        if calc_crc32 != expected:
+            continue
+
+        version_bytes: bytes = bytes(view[0x80:0x80+6])
+        version_string: str = "{:02X}{:02X}{:02X}_{:02X}_{:02X}_{:02X}".format(*version_bytes)
+        return BromInfo(chip_name, version_string, size, expected)
+
+    return None
+
+def digests(data: bytes | memoryview) -> list[str]:
+    '''Calculates all the hashes in HASH_ALGS in a single pass over the data'''
+
+    hashes = [hash_alg(usedforsecurity=False) for hash_alg in HASH_ALGS]
+    view: memoryview = memoryview(data)
+    for offset in range(0, len(view), CHUNK_SIZE):
+        chunk: memoryview = view[offset:offset+CHUNK_SIZE]
+        for h in hashes:
+            h.update(chunk)
+
+    return [h.hexdigest() for h in hashes]
+
+def csv_row(info: BromInfo, hashes: list[str]) -> str:
+    with io.StringIO(newline="") as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow([info.chip, info.version, info.size, "0x{:08X}".format(info.crc32)] + hashes)
+        return csvfile.getvalue().rstrip()
+
+def check_file(path: str, known: KnownBroms | None) -> tuple[str, BromInfo | None, list[str], str]:
+    '''Returns the status, info, and hashes of a BROM dump'''
+
+    try:
+        with open(path, "rb") as f:
+            fw_bytes: bytes = f.read()
+    except OSError as error:
+        return ("error", None, [], "{}: {}".format(type(error).__name__, error))
+
+    info: BromInfo | None = identify(fw_bytes)
+    if info is None:
+        return ("corrupt", None, [], "Failed to validate BROM CRC-32.")
+
+    # Calculate hashes on the 32 kB / 64 kB BROM (includes the CRC-32)
+    hashes: list[str] = digests(memoryview(fw_bytes)[:info.size])
+    if known is None:
+        return ("unchecked", info, hashes, "")
+
+    return (known.status(info, hashes[HASH_ALGS.index(sha256)]), info, hashes, "")
+
+def batch(paths: list[str], known: KnownBroms | None, jobs: int | None, print_csv: bool) -> bool:
+    # With CSV output, only the CSV rows go to stdout, so they can be
+    # redirected to a file.
+    report = sys.stderr if print_csv else sys.stdout
+    counts: dict[str, int] = dict()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for path, (status, info, hashes, error) in zip(paths, executor.map(check_file, paths, [known] * len(paths))):
+            counts[status] = counts.get(status, 0) + 1
+            if info is None:
+                print("{:<9} {}: {}".format(status.upper(), path, error), file=report)
+                continue
+
+            print("{:<9} {}: {}, version {}, {} bytes, CRC-32 0x{:08X}".format(
+                status.upper(), path, info.chip, info.version, info.size, info.crc32), file=report)
+            if print_csv and status != "known":
+                print(csv_row(info, hashes))
+
+    print("Checked {} files: {}".format(len(paths), ", ".join("{} {}".format(count, status) for status, count in sorted(counts.items()))), file=sys.stderr)
+
+    # A dump with the CRC-32 of a known BROM but different contents is
+    # corrupted (or has been tampered with).
+    return not (counts.get("corrupt") or counts.get("error") or counts.get("mismatch"))
+
+def find_dumps(inputs: list[str]) -> list[str]:
+    paths: list[str] = []
+    for name in inputs:
+        if os.path.isdir(name):
+            for root, dirs, files in os.walk(name):
+                dirs.sort()
+                paths.extend(os.path.join(root, f) for f in sorted(files))
+        else:
+            paths.append(name)
+
+    return paths
+
+def main() -> int:
+    project_dir: pathlib.Path = pathlib.Path(__file__).resolve().parents[1]
+    default_known: str = str(project_dir/"data"/"brom_info.csv")
+
+    parser: argparse.ArgumentParser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--csv", default=False, action="store_true", help="Output in CSV format. In batch mode, print CSV rows for the valid BROMs that aren't already known, and print everything else to stderr.")
+    parser.add_argument("-k", "--known", type=str, default=default_known, help="The list of known BROMs. Default is \"{}\"".format(default_known))
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="The number of dumps to validate in parallel in batch mode. Default is the number of CPUs.")
+    parser.add_argument("firmware", type=str, nargs="+", help="The ASMedia USB 3 host controller boot ROM binary. If more than one is given, or a directory of them, they're all validated and checked against the list of known BROMs.")
+    args: argparse.Namespace = parser.parse_args()
+
+    known: KnownBroms | None = None
+    try:
+        known = KnownBroms.load(args.known)
+    except FileNotFoundError:
+        print("Warning: Failed to open \"{}\", BROMs can't be checked against the known ones.".format(args.known), file=sys.stderr)
+
+    paths: list[str] = find_dumps(args.firmware)
+    if paths != args.firmware or len(paths) > 1:
+        return 0 if batch(paths, known, args.jobs, args.csv) else 1
+
+    status, info, hashes, error = check_file(paths[0], known)
+    if info is None:
+        print("Error: {}".format(error), file=sys.stderr)
+        return 1
+
+    if args.csv:
+        print(csv_row(info, hashes))
+        if status == "mismatch":
+            print("Warning: A known BROM has the same CRC-32, but different contents.", file=sys.stderr)
+    else:
+        print("BROM CRC-32 OK! Chip name: {}, BROM version: {}, BROM size: {} bytes, BROM CRC-32: 0x{:08X}".format(
+            info.chip, info.version, info.size, info.crc32))
+        if status == "known":
+            print("This is a known BROM.")
+        elif status == "unknown":
+            print("This BROM isn't in the list of known BROMs.")
+        elif status == "mismatch":
+            print("Warning: A known BROM has the same CRC-32, but different contents.", file=sys.stderr)
+
+    return 1 if status == "mismatch" else 0
 
 
 if __name__ == "__main__":
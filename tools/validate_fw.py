@@ -19,10 +19,20 @@
 
 
 import argparse
+import collections
+import csv
+import functools
+import glob
+import json
+import os
 import pathlib
 import sys
-from typing import Callable, NamedTuple
-from zlib import crc32
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import checksums
+from regdb import RegisterDb
 
 try:
     import asm_fw
@@ -56,25 +66,64 @@ CHIP_INFO: dict[str, ChipInfo] = {
 }
 
 
-def checksum8(data: bytes) -> int:
-    return sum(data) & 0xff
-
-def checksum32(data: bytes) -> int:
-    return sum(data) & 0xffffffff
-
-def validate_checksum(name: str, data: bytes, expected: int, function: Callable[[bytes], int]) -> None:
-    calc_csum: int = function(data)
-    if calc_csum != expected:
-        print("Error: Invalid {} checksum: expected {:#04x}, got: {:#04x}".format(name, expected, calc_csum), file=sys.stderr)
-        sys.exit(1)
-    print("{} checksum OK! 0x{:02x}".format(name.capitalize(), expected))
+class Check(NamedTuple):
+    name: str
+    # "checksum" or "crc32".
+    kind: str
+    expected: int
+    calculated: int
+    # The width of the checksum, in bytes.
+    size: int
+
+    @property
+    def ok(self) -> bool:
+        return self.expected == self.calculated
+
+class MmioWrite(NamedTuple):
+    # The XDATA address, i.e., with the chip's MMIO offset applied.
+    addr: int
+    size: int
+    value: int
+    # The registers containing the address, like "NAME[offset]".
+    registers: list[str]
+
+class FwInfo(NamedTuple):
+    path: str
+    # "xhc" or "promontory".
+    kind: str
+    chip: str
+    version: str
+    checks: list[Check]
+    signature: str | None
+    mmio_writes: list[MmioWrite]
+
+    @property
+    def ok(self) -> bool:
+        return all(check.ok for check in self.checks)
+
+    def to_dict(self) -> dict:
+        return {
+            'path': self.path,
+            'kind': self.kind,
+            'chip': self.chip,
+            'version': self.version,
+            'ok': self.ok,
+            'checks': [{
+                'name': check.name,
+                'kind': check.kind,
+                'expected': check.expected,
+                'calculated': check.calculated,
+                'ok': check.ok,
+            } for check in self.checks],
+            'signature': self.signature,
+            'mmio_writes': [{
+                'addr': write.addr,
+                'size': write.size,
+                'value': write.value,
+                'registers': write.registers,
+            } for write in self.mmio_writes],
+        }
 
-def validate_crc32(name: str, data: bytes, expected: int) -> None:
-    calc_crc32: int = crc32(data)
-    if calc_crc32 != expected:
-        print("Error: Invalid {} crc32: expected {:#010x}, got: {:#010x}".format(name, expected, calc_crc32), file=sys.stderr)
-        sys.exit(1)
-    print("{} CRC32 OK! 0x{:08x}".format(name.capitalize(), expected))
 
 def format_version(version: bytes) -> str:
     return "{:02X}{:02X}{:02X}_{:02X}_{:02X}_{:02X}".format(*version)
@@ -83,113 +132,240 @@ def get_chip_info(magic: str) -> ChipInfo:
     chip_id: str = magic[:5]
     return CHIP_INFO.get(chip_id, ChipInfo("UNKNOWN (\"{}\")".format(chip_id), None, 0x10000))
 
-def promontory(args: argparse.Namespace, fw_bytes: bytes) -> prom_fw.PromFw:
-    fw: prom_fw.PromFw = prom_fw.PromFw.from_bytes(fw_bytes)
-
-    chip_info: ChipInfo = get_chip_info(fw.body.firmware.magic)
-
-    print("Chip: {}".format(chip_info.name))
-    print("Firmware version: {}".format(format_version(fw.body.firmware.version)))
+@functools.cache
+def load_regs(data_dir: str, chip_info: ChipInfo) -> RegisterDb | None:
+    # Cached, since batch workers validate many images for the same chips.
+    if not chip_info.data_filename:
+        return None
 
-    validate_checksum("code", fw.body.firmware.code, fw.header.checksum, checksum32)
+    try:
+        return RegisterDb.load(pathlib.Path(data_dir) / chip_info.data_filename, chip_info.mmio_offset)
+    except FileNotFoundError:
+        return None
+    except ModuleNotFoundError:
+        return None
 
+def get_signature(fw: asm_fw.AsmFw | prom_fw.PromFw) -> str | None:
     try:
-        print("Code signature: {}".format(fw.body.signature.data.hex()))
+        return fw.body.signature.data.hex()
     except AttributeError:
-        pass
+        return None
 
-    return fw
+def promontory(path: str, fw_bytes: bytes) -> tuple[prom_fw.PromFw, FwInfo]:
+    fw: prom_fw.PromFw = prom_fw.PromFw.from_bytes(fw_bytes)
 
-def xhc(args: argparse.Namespace, fw_bytes: bytes) -> asm_fw.AsmFw:
-    fw: asm_fw.AsmFw = asm_fw.AsmFw.from_bytes(fw_bytes)
+    chip_info: ChipInfo = get_chip_info(fw.body.firmware.magic)
 
-    chip_info: ChipInfo = get_chip_info(fw.header.magic)
+    checks: list[Check] = [
+        Check("code", "checksum", fw.header.checksum, checksums.sum32(fw.body.firmware.code), 4),
+    ]
 
-    print("Chip: {}".format(chip_info.name))
-    print("Firmware version: {}".format(format_version(fw.body.firmware.version)))
+    return fw, FwInfo(path, "promontory", chip_info.name, format_version(fw.body.firmware.version), checks, get_signature(fw), [])
 
-    header_bytes: bytes = fw_bytes[:fw.header.len]
-    validate_checksum("header", header_bytes, fw.header.checksum, checksum8)
-    validate_crc32("header", header_bytes, fw.header.crc32)
+def xhc(path: str, fw_bytes: bytes, data_dir: str) -> tuple[asm_fw.AsmFw, FwInfo]:
+    fw: asm_fw.AsmFw = asm_fw.AsmFw.from_bytes(fw_bytes)
 
-    validate_checksum("code", fw.body.firmware.code, fw.body.checksum, checksum8)
-    validate_crc32("code", fw.body.firmware.code, fw.body.crc32)
+    chip_info: ChipInfo = get_chip_info(fw.header.magic)
 
-    try:
-        print("Code signature: {}".format(fw.body.signature.data.hex()))
-    except AttributeError:
-        pass
-
-    reg_names: list[tuple[int, int, str]] = []
-    chip_data_yaml: str | None = chip_info.data_filename
-    if chip_data_yaml:
-        try:
-            yaml_path: pathlib.Path = pathlib.Path(args.data_dir) / chip_data_yaml
-
-            import yaml  # type: ignore[import-untyped]
-            doc: dict[str, dict[str, list[dict]]] = yaml.safe_load(open(yaml_path, 'r'))
-            xdata: list[dict] = doc.get('registers', dict()).get('xdata', [])
-            for reg in xdata:
-                start: int = reg['start']
-                end: int = reg['end']
-                name: str = reg['name']
-                reg_names.append((start, end, name))
-        except FileNotFoundError:
-            pass
-        except ModuleNotFoundError:
-            pass
+    # Calculate both checksums of each part in a single pass.
+    header: checksums.Checksums = checksums.checksums(memoryview(fw_bytes)[:fw.header.len])
+    code: checksums.Checksums = checksums.checksums(fw.body.firmware.code)
+    checks: list[Check] = [
+        Check("header", "checksum", fw.header.checksum, header.sum8, 1),
+        Check("header", "crc32", fw.header.crc32, header.crc32, 4),
+        Check("code", "checksum", fw.body.checksum, code.sum8, 1),
+        Check("code", "crc32", fw.body.crc32, code.crc32, 4),
+    ]
+
+    regs: RegisterDb | None = load_regs(data_dir, chip_info)
 
     mmio_offset: int = chip_info.mmio_offset
-    header_printed: bool = False
+    mmio_writes: list[MmioWrite] = []
     for config_word in fw.header.data.config_words:
         if isinstance(config_word.info, asm_fw.AsmFw.Header.ConfigWord.WriteData):
-            if not header_printed:
-                print("Header MMIO writes:")
-                header_printed = True
-
             info: asm_fw.AsmFw.Header.ConfigWord.WriteData = config_word.info
-            addr: int = info.addr + mmio_offset
-            addr_format: str = "0x{:04x}"
-            if mmio_offset >= 0x10000:
-                addr_format = "0x{:05x}"
-            formatted_addr: str = addr_format.format(addr)
-            value_format: str | None = {
-                1: '0x{:02x}',
-                2: '0x{:04x}',
-                4: '0x{:08x}',
-            }.get(info.size)
-            if value_format is None:
+            if info.size not in (1, 2, 4):
                 raise ValueError("Invalid config word value size: {}".format(info.size))
-            formatted_value: str = value_format.format(info.value)
 
-            for start, end, name in reg_names:
-                if addr in range(start, end + 1):
-                    formatted_addr = "{}[{}] ({})".format(name, addr-start, formatted_addr)
-            print("  {} <= {}".format(formatted_addr, formatted_value))
+            addr: int = info.addr + mmio_offset
+            registers: list[str] = []
+            if regs is not None:
+                registers = ["{}[{}]".format(reg.name, addr-reg.start) for reg in regs.lookup("xdata", addr)]
+            mmio_writes.append(MmioWrite(addr, info.size, info.value, registers))
 
-    return fw
+    return fw, FwInfo(path, "xhc", chip_info.name, format_version(fw.body.firmware.version), checks, get_signature(fw), mmio_writes)
 
-def main() -> None:
+def analyze(path: str, fw_bytes: bytes, data_dir: str) -> tuple[asm_fw.AsmFw | prom_fw.PromFw, FwInfo]:
+    if fw_bytes.startswith(b"_PT_"):
+        return promontory(path, fw_bytes)
+
+    return xhc(path, fw_bytes, data_dir)
+
+def extract_code(path: str, fw: asm_fw.AsmFw | prom_fw.PromFw) -> None:
+    open('.'.join(path.split('.')[:-1]) + ".code.bin", 'wb').write(fw.body.firmware.code)
+
+def print_info(info: FwInfo) -> bool:
+    '''Prints the results for a single image, stopping at the first bad checksum'''
+
+    print("Chip: {}".format(info.chip))
+    print("Firmware version: {}".format(info.version))
+
+    for check in info.checks:
+        if check.kind == "checksum":
+            if not check.ok:
+                print("Error: Invalid {} checksum: expected {:#04x}, got: {:#04x}".format(check.name, check.expected, check.calculated), file=sys.stderr)
+                return False
+            print("{} checksum OK! 0x{:02x}".format(check.name.capitalize(), check.expected))
+        else:
+            if not check.ok:
+                print("Error: Invalid {} crc32: expected {:#010x}, got: {:#010x}".format(check.name, check.expected, check.calculated), file=sys.stderr)
+                return False
+            print("{} CRC32 OK! 0x{:08x}".format(check.name.capitalize(), check.expected))
+
+    if info.signature is not None:
+        print("Code signature: {}".format(info.signature))
+
+    if info.mmio_writes:
+        print("Header MMIO writes:")
+
+    for write in info.mmio_writes:
+        addr_format: str = "0x{:04x}"
+        if write.addr >= 0x10000:
+            addr_format = "0x{:05x}"
+        formatted_addr: str = addr_format.format(write.addr)
+        for register in write.registers:
+            formatted_addr = "{} ({})".format(register, formatted_addr)
+        formatted_value: str = "0x{:0{}x}".format(write.value, 2 * write.size)
+        print("  {} <= {}".format(formatted_addr, formatted_value))
+
+    return True
+
+def validate_file(path: str, data_dir: str, extract: bool) -> dict:
+    # Runs in a worker process, so report failures instead of raising them.
+    try:
+        fw_bytes: bytes = open(path, 'rb').read()
+        fw, info = analyze(path, fw_bytes, data_dir)
+        if extract:
+            extract_code(path, fw)
+        result: dict = info.to_dict()
+        result['error'] = None
+        return result
+    except Exception as error:
+        return {'path': path, 'ok': False, 'error': "{}: {}".format(type(error).__name__, error)}
+
+def find_images(inputs: list[str]) -> list[str]:
+    '''Expands directories (recursively) and glob patterns into a list of files'''
+
+    paths: list[str] = []
+    for name in inputs:
+        matches: list[str] = [name]
+        if any(c in name for c in "*?["):
+            matches = sorted(glob.glob(name, recursive=True))
+
+        for match in matches:
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs.sort()
+                    paths.extend(os.path.join(root, f) for f in sorted(files))
+            else:
+                paths.append(match)
+
+    return list(dict.fromkeys(paths))
+
+CSV_FIELDS: list[str] = [
+    "path", "kind", "chip", "version", "ok",
+    "header_checksum", "header_crc32", "code_checksum", "code_crc32",
+    "signature", "mmio_writes", "error",
+]
+
+def csv_row(result: dict) -> dict:
+    row: dict = {field: result.get(field) for field in CSV_FIELDS}
+    for check in result.get('checks', list()):
+        row["{}_{}".format(check['name'], check['kind'])] = "ok" if check['ok'] else "bad ({:#x} != {:#x})".format(check['calculated'], check['expected'])
+    row['mmio_writes'] = " ".join("{:#x}:{}={:#x}".format(write['addr'], write['size'], write['value'])
+        for write in result.get('mmio_writes', list()))
+
+    return row
+
+def batch(paths: list[str], data_dir: str, extract: bool, jobs: int | None, output_format: str, output) -> bool:
+    writer: csv.DictWriter | None = None
+    if output_format == "csv":
+        writer = csv.DictWriter(output, CSV_FIELDS)
+        writer.writeheader()
+
+    valid: int = 0
+    invalid: int = 0
+    errors: int = 0
+    chips: collections.Counter = collections.Counter()
+    start: int = time.perf_counter_ns()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Small chunks keep the workers busy without letting one slow image
+        # hold up a large batch.
+        worker = functools.partial(validate_file, data_dir=data_dir, extract=extract)
+        chunksize: int = max(1, min(64, len(paths) // (4 * (jobs or os.cpu_count() or 1))))
+        for result in executor.map(worker, paths, chunksize=chunksize):
+            if writer is not None:
+                writer.writerow(csv_row(result))
+            else:
+                output.write(json.dumps(result) + "\n")
+
+            if result['error'] is not None:
+                errors += 1
+            elif result['ok']:
+                valid += 1
+                chips[result['chip']] += 1
+            else:
+                invalid += 1
+                chips[result['chip']] += 1
+    stop: int = time.perf_counter_ns()
+
+    seconds: float = (stop - start) / 1e9
+    print("Validated {} images in {:.06f} seconds ({:.01f} images/second): {} valid, {} with bad checksums, {} failed to parse".format(
+        len(paths), seconds, len(paths) / seconds if seconds else 0, valid, invalid, errors), file=sys.stderr)
+    for chip, count in sorted(chips.items()):
+        print("  {}: {}".format(chip, count), file=sys.stderr)
+
+    return invalid == 0 and errors == 0
+
+def main() -> int:
     project_dir: pathlib.Path = pathlib.Path(__file__).resolve().parents[1]
     default_data_dir: str = str(project_dir/"data")
 
     parser: argparse.ArgumentParser = argparse.ArgumentParser()
     parser.add_argument("-d", "--data-dir", type=str, default=default_data_dir, help="The YAML data directory. Default is \"{}\"".format(default_data_dir))
     parser.add_argument("-e", "--extract", action="store_true", default=False, help="Extract the code from the firmware image.")
-    parser.add_argument("firmware", type=str, help="The ASMedia USB 3 host controller firmware image.")
+    parser.add_argument("-b", "--batch", action="store_true", default=False, help="Validate every image given, continuing past errors, and print one structured record per image. Implied when more than one image, a directory, or a glob pattern is given.")
+    parser.add_argument("-f", "--format", type=str, choices=("jsonl", "csv"), default="jsonl", help="The output format in batch mode. Default is \"jsonl\".")
+    parser.add_argument("-o", "--output", type=str, help="Write the batch mode output to this file instead of stdout.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="The number of images to validate in parallel in batch mode. Default is the number of CPUs.")
+    parser.add_argument("firmware", type=str, nargs="+", help="The ASMedia USB 3 host controller firmware image. In batch mode, may also be a directory or a glob pattern.")
     args: argparse.Namespace = parser.parse_args()
 
-    fw: asm_fw.AsmFw | prom_fw.PromFw
+    paths: list[str] = find_images(args.firmware)
+    if args.batch or paths != args.firmware or len(paths) > 1:
+        if not paths:
+            print("Error: No images found.", file=sys.stderr)
+            return 1
 
-    fw_bytes: bytes = open(args.firmware, 'rb').read()
-    if fw_bytes.startswith(b"_PT_"):
-        fw = promontory(args, fw_bytes)
-    else:
-        fw = xhc(args, fw_bytes)
+        if args.output:
+            with open(args.output, 'w', newline='') as output:
+                ok: bool = batch(paths, args.data_dir, args.extract, args.jobs, args.format, output)
+        else:
+            ok = batch(paths, args.data_dir, args.extract, args.jobs, args.format, sys.stdout)
+
+        return 0 if ok else 1
+
+    path: str = paths[0]
+    fw_bytes: bytes = open(path, 'rb').read()
+    fw, info = analyze(path, fw_bytes, args.data_dir)
+    if not print_info(info):
+        return 1
 
     if args.extract:
-        open('.'.join(args.firmware.split('.')[:-1]) + ".code.bin", 'wb').write(fw.body.firmware.code)
+        extract_code(path, fw)
+
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())